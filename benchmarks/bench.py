@@ -0,0 +1,293 @@
+#!/usr/bin/env python2.7
+"""
+Benchmarks of pyDDS's own overhead.
+
+These run against the in-memory stand-in for the RTI C API in stub/, so what is
+measured is the time spent in dds.py and ctypes rather than in DDS itself. Build
+the stub first with `make', then:
+
+    python2.7 bench.py [-n ITERATIONS] [--json OUT] [--compare BASELINE] [PATTERN ...]
+
+PATTERNs select benchmarks by substring (e.g. `unpack' or `flat'). For every
+benchmark this prints operations per second, per-operation latency percentiles,
+and, per operation, the DynamicData and string allocations and the DynamicData
+get/set calls made in C (counted by the stub).
+--json saves the results and --compare prints the change against saved results.
+"""
+
+from __future__ import print_function
+
+import argparse
+import array
+import gc
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+HERE  = os.path.dirname(os.path.abspath(__file__))
+BUILD = os.path.join(HERE, 'build')
+
+# dlopen only reads LD_LIBRARY_PATH at startup, so re-exec with the stub on it.
+if BUILD not in os.environ.get('LD_LIBRARY_PATH', '').split(os.pathsep):
+    if not os.path.exists(os.path.join(BUILD, 'libnddsc.so')):
+        sys.exit('The stub libraries are not built. Run `make\' in %s first.' % HERE)
+    os.environ['LD_LIBRARY_PATH'] = os.pathsep.join(filter(None, [BUILD, os.environ.get('LD_LIBRARY_PATH')]))
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+sys.path.insert(0, os.path.dirname(HERE))
+import dds
+
+# Counter indices, as in stub/nddsc_stub.c
+CNT_DYNAMIC_DATA_NEW = 0
+CNT_CREATE_DATA      = 2
+CNT_STRING_ALLOC     = 4
+CNT_CALLS            = 8
+
+def counters():
+    get = dds._ddsc_lib.stub_get_counter
+    return {
+        'allocs':    get(CNT_DYNAMIC_DATA_NEW) + get(CNT_CREATE_DATA) + get(CNT_STRING_ALLOC),
+        'accessors': get(CNT_CALLS),
+    }
+
+# Representative samples of each benchmark type (see stub/bench_types.c)
+
+FLAT = {
+    'id': 7, 'sequence': 123456789, 'x': 1.5, 'y': -2.25, 'z': 1e6,
+    'roll': 0.1, 'pitch': 0.2, 'yaw': 0.3, 'count': 42, 'offset': -5,
+    'port': 8080, 'stamp': 1234567890123, 'valid': True, 'flags': 3,
+    'grade': 'b', 'mode': 'ACTIVE',
+}
+
+def _pose(k):
+    return {
+        'position': {'x': k, 'y': k + 1, 'z': k + 2},
+        'velocity': {'x': -k, 'y': 0.5, 'z': 0.25},
+        'heading': 90.0,
+    }
+
+NESTED = {'id': 7, 'pose': _pose(1.0), 'target': _pose(10.0), 'mode': 'FAULT'}
+
+SEQUENCE = {
+    'id': 7,
+    'points': [i * 0.5 for i in xrange(4096)],
+    'indices': range(1024),
+    'blob': [i % 256 for i in xrange(64)],
+    'covariance': [float(i) for i in xrange(36)],
+}
+
+# The same, as array.arrays and a string, which are written without a Python
+# object per element.
+SEQUENCE_ARRAYS = {
+    'id': 7,
+    'points': array.array('f', SEQUENCE['points']),
+    'indices': array.array('i', SEQUENCE['indices']),
+    'blob': ''.join(map(chr, SEQUENCE['blob'])),
+    'covariance': array.array('d', SEQUENCE['covariance']),
+}
+
+STRING = {
+    'name': 'sensor-0007',
+    'description': 'x' * 200,
+    'source': 'benchmarks/bench.py',
+    'units': 'metres per second',
+    'tags': ['tag-%02d' % i for i in xrange(32)],
+}
+
+WIDE_SPARSE = {'id': 7, 'f01': 1.0, 'f02': 2.0}
+
+TYPES = [
+    ('flat',     'bench.Flat',          FLAT),
+    ('nested',   'bench.Nested',        NESTED),
+    ('sequence', 'bench.SequenceHeavy', SEQUENCE),
+    ('string',   'bench.StringHeavy',   STRING),
+]
+
+# Each benchmark is a setup function returning (operation, drain, keep). The
+# operation is timed and keep holds whatever must stay alive meanwhile. drain (if
+# any) runs every DRAIN_EVERY operations to empty the stub reader, which otherwise
+# keeps every sample written; neither its time nor its counters are included.
+
+DRAIN_EVERY = 500
+
+def bench_unpack(participant, topic_name, sample):
+    topic = participant.get_topic(topic_name)
+    dd = topic._support.create_data()
+    dds.write_into_dd(sample, dd)
+    return (lambda: dds.unpack_dd(dd)), None, (topic, dd)
+
+def bench_unpack_arrays(participant, topic_name, sample):
+    # As unpack, into array.arrays rather than lists.
+    topic = participant.get_topic(topic_name)
+    dd = topic._support.create_data()
+    dds.write_into_dd(sample, dd)
+    return (lambda: dds.unpack_dd(dd, arrays=True)), None, (topic, dd)
+
+def bench_write(participant, topic_name, sample):
+    topic = participant.get_topic(topic_name)
+    dd = topic._support.create_data()
+    return (lambda: dds.write_into_dd(sample, dd)), None, (topic, dd)
+
+def bench_publish(participant, topic_name, sample):
+    topic = participant.get_topic(topic_name)
+    return (lambda: topic.publish(sample)), topic.take, topic
+
+def bench_dispatch(participant, topic_name, sample):
+    # The stub delivers on the writer's thread, so with an inline dispatcher this
+    # is one publish plus the listener's take, unpack and callback.
+    topic = participant.get_topic(topic_name)
+    received = []
+    topic.subscribe(received.append, dispatcher='inline')
+
+    def drain():
+        del received[:]
+    return (lambda: topic.publish(sample)), drain, topic
+
+def bench_dispatch_lazy(participant, topic_name, sample):
+    # As dispatch, but the callback gets a SampleView and reads two fields.
+    topic = participant.get_topic(topic_name)
+    received = []
+    topic.subscribe(lambda view: received.append((view['id'], view['f01'])), dispatcher='inline', lazy=True)
+
+    def drain():
+        del received[:]
+    return (lambda: topic.publish(sample)), drain, topic
+
+def bench_dispatch_where(participant, topic_name, sample):
+    # As dispatch, with a `where' test on one field and a two field projection.
+    topic = participant.get_topic(topic_name)
+    received = []
+    topic.subscribe(received.append, dispatcher='inline', where={'id': sample['id']}, fields=['id', 'f01'])
+
+    def drain():
+        del received[:]
+    return (lambda: topic.publish(sample)), drain, topic
+
+def bench_dispatch_fanout(participant, topic_name, sample):
+    # As dispatch, with four subscriptions sharing the topic's reader.
+    topic = participant.get_topic(topic_name)
+    received = []
+    for _ in xrange(4):
+        topic.subscribe(received.append, dispatcher='inline')
+
+    def drain():
+        del received[:]
+    return (lambda: topic.publish(sample)), drain, topic
+
+def bench_dispatch_metrics(participant, topic_name, sample):
+    # As dispatch, with metrics collected.
+    participant.enable_metrics()
+    return bench_dispatch(participant, topic_name, sample)
+
+def bench_get_topic(participant, topic_name, sample):
+    # A new topic each time: the previous one is collected (and its entities
+    # deleted) as soon as the result is dropped.
+    return (lambda: participant.get_topic(topic_name)), None, None
+
+def bench_import(participant, topic_name, sample):
+    # A fresh interpreter importing dds, so this includes interpreter startup.
+    # `python2.7 -c pass' gives the baseline to subtract.
+    command = [sys.executable, '-c', 'import sys; sys.path.insert(0, %r); import dds' % os.path.dirname(HERE)]
+    return (lambda: subprocess.check_call(command)), None, None
+
+BENCHMARKS = []
+for _type, _topic_name, _sample in TYPES:
+    for _what, _setup in [('unpack', bench_unpack), ('write', bench_write), ('publish', bench_publish),
+                          ('dispatch', bench_dispatch), ('get_topic', bench_get_topic)]:
+        BENCHMARKS.append(('%s/%s' % (_what, _type), _setup, _topic_name, _sample))
+BENCHMARKS.append(('unpack/sequence_arrays', bench_unpack_arrays, 'bench.SequenceHeavy', SEQUENCE))
+BENCHMARKS.append(('write/sequence_arrays', bench_write, 'bench.SequenceHeavy', SEQUENCE_ARRAYS))
+BENCHMARKS.append(('dispatch_metrics/flat', bench_dispatch_metrics, 'bench.Flat', FLAT))
+BENCHMARKS.append(('publish/wide_sparse', bench_publish, 'bench.Wide', WIDE_SPARSE))
+BENCHMARKS.append(('dispatch/wide_sparse', bench_dispatch, 'bench.Wide', WIDE_SPARSE))
+BENCHMARKS.append(('dispatch_lazy/wide_sparse', bench_dispatch_lazy, 'bench.Wide', WIDE_SPARSE))
+BENCHMARKS.append(('dispatch_where/wide_sparse', bench_dispatch_where, 'bench.Wide', WIDE_SPARSE))
+BENCHMARKS.append(('dispatch_fanout/wide_sparse', bench_dispatch_fanout, 'bench.Wide', WIDE_SPARSE))
+BENCHMARKS.append(('import', bench_import, None, None))
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+def run(setup, topic_name, sample, iterations):
+    participant = dds.DDS('bench_types')
+    operation, drain, keep = setup(participant, topic_name, sample)
+    timer = timeit.default_timer
+
+    for _ in xrange(min(100, iterations)):
+        operation()
+    if drain is not None:
+        drain()
+
+    latencies = []
+    drained = dict.fromkeys(counters(), 0)
+    gc.collect()
+    dds._ddsc_lib.stub_reset_counters()
+    for i in xrange(iterations):
+        start = timer()
+        operation()
+        latencies.append(timer() - start)
+        if drain is not None and i % DRAIN_EVERY == DRAIN_EVERY - 1:
+            before = counters()
+            drain()
+            for name, value in counters().iteritems():
+                drained[name] += value - before[name]
+    used = dict((name, value - drained[name]) for name, value in counters().iteritems())
+    if drain is not None:
+        drain()
+    if isinstance(keep, dds.TopicSuper):
+        keep.unsubscribe()  # a listener keeps its topic (and participant) alive
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'ops_per_sec': iterations / total if total else float('inf'),
+        'p50_us':      percentile(latencies, 50) * 1e6,
+        'p90_us':      percentile(latencies, 90) * 1e6,
+        'p99_us':      percentile(latencies, 99) * 1e6,
+        'allocs':      float(used['allocs']) / iterations,
+        'accessors':   float(used['accessors']) / iterations,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of pyDDS overhead against the stub RTI libraries.')
+    parser.add_argument('patterns', nargs='*', help='only run benchmarks whose name contains one of these')
+    parser.add_argument('-n', '--iterations', type=int, default=2000, help='timed operations per benchmark')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='show the change in ops/sec against results saved with --json')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    header = '%-26s %12s %10s %10s %10s %9s %9s' % ('benchmark', 'ops/sec', 'p50 us', 'p90 us', 'p99 us', 'allocs', 'get/set')
+    if baseline:
+        header += ' %9s' % 'vs base'
+    print(header)
+
+    results = {}
+    for name, setup, topic_name, sample in BENCHMARKS:
+        if args.patterns and not any(p in name for p in args.patterns):
+            continue
+        iterations = args.iterations
+        if setup is bench_get_topic:
+            iterations = max(1, iterations // 10)
+        elif setup is bench_import:
+            iterations = max(1, iterations // 100)
+        res = results[name] = run(setup, topic_name, sample, iterations)
+        line = '%-26s %12.0f %10.1f %10.1f %10.1f %9.1f %9.1f' % (
+            name, res['ops_per_sec'], res['p50_us'], res['p90_us'], res['p99_us'], res['allocs'], res['accessors'])
+        if name in baseline:
+            line += ' %+8.1f%%' % ((res['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1) * 100)
+        print(line)
+        sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
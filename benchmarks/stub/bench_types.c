@@ -0,0 +1,181 @@
+/*
+ * Topic types for the benchmarks, playing the part of an rtiddsgen-generated
+ * topic library: each type exports <module>_<name>_get_typecode().
+ *
+ *   module bench {
+ *       enum Mode { IDLE, ACTIVE, FAULT };
+ *
+ *       struct Flat {                  // 16 primitive members
+ *           long id; //@key
+ *           ...
+ *       };
+ *
+ *       struct Vec3 { double x; double y; double z; };
+ *       struct Pose { Vec3 position; Vec3 velocity; double heading; };
+ *       struct Nested {
+ *           long id; //@key
+ *           Pose pose;
+ *           Pose target;
+ *           Mode mode;
+ *       };
+ *
+ *       struct SequenceHeavy {
+ *           long id; //@key
+ *           sequence<float, 4096> points;
+ *           sequence<long, 1024> indices;
+ *           octet blob[64];
+ *           double covariance[36];
+ *       };
+ *
+ *       struct StringHeavy {
+ *           string<64> name; //@key
+ *           string<256> description;
+ *           string<256> source;
+ *           string<256> units;
+ *           sequence<string<64>, 32> tags;
+ *       };
+ *
+ *       struct Wide {                  // 60 members, for sparse publishes
+ *           long id; //@key
+ *           ...
+ *       };
+ *   };
+ */
+
+#include <stdio.h>
+
+typedef struct DDS_TypeCode DDS_TypeCode;
+
+extern DDS_TypeCode *stub_tc_primitive(int kind);
+extern DDS_TypeCode *stub_tc_string(unsigned bound);
+extern DDS_TypeCode *stub_tc_struct(const char *name);
+extern DDS_TypeCode *stub_tc_enum(const char *name);
+extern DDS_TypeCode *stub_tc_sequence(DDS_TypeCode *content, unsigned bound);
+extern DDS_TypeCode *stub_tc_array(DDS_TypeCode *content, unsigned count);
+extern void stub_tc_add_member(DDS_TypeCode *tc, const char *name, DDS_TypeCode *type, int is_key);
+extern void stub_tc_add_enumerator(DDS_TypeCode *tc, const char *name);
+
+enum {
+    TK_SHORT = 1, TK_LONG, TK_USHORT, TK_ULONG, TK_FLOAT, TK_DOUBLE, TK_BOOLEAN,
+    TK_CHAR, TK_OCTET, TK_LONGLONG = 17, TK_ULONGLONG
+};
+
+#define P(kind) stub_tc_primitive(kind)
+
+static DDS_TypeCode *mode_tc(void)
+{
+    static DDS_TypeCode *tc;
+    if (!tc) {
+        tc = stub_tc_enum("bench::Mode");
+        stub_tc_add_enumerator(tc, "IDLE");
+        stub_tc_add_enumerator(tc, "ACTIVE");
+        stub_tc_add_enumerator(tc, "FAULT");
+    }
+    return tc;
+}
+
+DDS_TypeCode *bench_Flat_get_typecode(void)
+{
+    static DDS_TypeCode *tc;
+    if (!tc) {
+        tc = stub_tc_struct("bench::Flat");
+        stub_tc_add_member(tc, "id", P(TK_LONG), 1);
+        stub_tc_add_member(tc, "sequence", P(TK_ULONGLONG), 0);
+        stub_tc_add_member(tc, "x", P(TK_DOUBLE), 0);
+        stub_tc_add_member(tc, "y", P(TK_DOUBLE), 0);
+        stub_tc_add_member(tc, "z", P(TK_DOUBLE), 0);
+        stub_tc_add_member(tc, "roll", P(TK_FLOAT), 0);
+        stub_tc_add_member(tc, "pitch", P(TK_FLOAT), 0);
+        stub_tc_add_member(tc, "yaw", P(TK_FLOAT), 0);
+        stub_tc_add_member(tc, "count", P(TK_ULONG), 0);
+        stub_tc_add_member(tc, "offset", P(TK_SHORT), 0);
+        stub_tc_add_member(tc, "port", P(TK_USHORT), 0);
+        stub_tc_add_member(tc, "stamp", P(TK_LONGLONG), 0);
+        stub_tc_add_member(tc, "valid", P(TK_BOOLEAN), 0);
+        stub_tc_add_member(tc, "flags", P(TK_OCTET), 0);
+        stub_tc_add_member(tc, "grade", P(TK_CHAR), 0);
+        stub_tc_add_member(tc, "mode", mode_tc(), 0);
+    }
+    return tc;
+}
+
+static DDS_TypeCode *vec3_tc(void)
+{
+    static DDS_TypeCode *tc;
+    if (!tc) {
+        tc = stub_tc_struct("bench::Vec3");
+        stub_tc_add_member(tc, "x", P(TK_DOUBLE), 0);
+        stub_tc_add_member(tc, "y", P(TK_DOUBLE), 0);
+        stub_tc_add_member(tc, "z", P(TK_DOUBLE), 0);
+    }
+    return tc;
+}
+
+static DDS_TypeCode *pose_tc(void)
+{
+    static DDS_TypeCode *tc;
+    if (!tc) {
+        tc = stub_tc_struct("bench::Pose");
+        stub_tc_add_member(tc, "position", vec3_tc(), 0);
+        stub_tc_add_member(tc, "velocity", vec3_tc(), 0);
+        stub_tc_add_member(tc, "heading", P(TK_DOUBLE), 0);
+    }
+    return tc;
+}
+
+DDS_TypeCode *bench_Nested_get_typecode(void)
+{
+    static DDS_TypeCode *tc;
+    if (!tc) {
+        tc = stub_tc_struct("bench::Nested");
+        stub_tc_add_member(tc, "id", P(TK_LONG), 1);
+        stub_tc_add_member(tc, "pose", pose_tc(), 0);
+        stub_tc_add_member(tc, "target", pose_tc(), 0);
+        stub_tc_add_member(tc, "mode", mode_tc(), 0);
+    }
+    return tc;
+}
+
+DDS_TypeCode *bench_SequenceHeavy_get_typecode(void)
+{
+    static DDS_TypeCode *tc;
+    if (!tc) {
+        tc = stub_tc_struct("bench::SequenceHeavy");
+        stub_tc_add_member(tc, "id", P(TK_LONG), 1);
+        stub_tc_add_member(tc, "points", stub_tc_sequence(P(TK_FLOAT), 4096), 0);
+        stub_tc_add_member(tc, "indices", stub_tc_sequence(P(TK_LONG), 1024), 0);
+        stub_tc_add_member(tc, "blob", stub_tc_array(P(TK_OCTET), 64), 0);
+        stub_tc_add_member(tc, "covariance", stub_tc_array(P(TK_DOUBLE), 36), 0);
+    }
+    return tc;
+}
+
+DDS_TypeCode *bench_StringHeavy_get_typecode(void)
+{
+    static DDS_TypeCode *tc;
+    if (!tc) {
+        tc = stub_tc_struct("bench::StringHeavy");
+        stub_tc_add_member(tc, "name", stub_tc_string(64), 1);
+        stub_tc_add_member(tc, "description", stub_tc_string(256), 0);
+        stub_tc_add_member(tc, "source", stub_tc_string(256), 0);
+        stub_tc_add_member(tc, "units", stub_tc_string(256), 0);
+        stub_tc_add_member(tc, "tags", stub_tc_sequence(stub_tc_string(64), 32), 0);
+    }
+    return tc;
+}
+
+DDS_TypeCode *bench_Wide_get_typecode(void)
+{
+    static DDS_TypeCode *tc;
+    if (!tc) {
+        int i;
+        char name[16];
+        tc = stub_tc_struct("bench::Wide");
+        stub_tc_add_member(tc, "id", P(TK_LONG), 1);
+        for (i = 1; i < 60; i++) {
+            snprintf(name, sizeof(name), "f%02d", i);
+            stub_tc_add_member(tc, name, (i % 3) ? P(TK_DOUBLE) : P(TK_LONG), 0);
+        }
+    }
+    return tc;
+}
@@ -0,0 +1,2558 @@
+/*
+ * In-memory stand-in for the parts of the RTI Connext C API that dds.py binds.
+ *
+ * This is NOT DDS. Everything happens inside one process: a write on a
+ * DataWriter is copied synchronously into every DataReader of the same topic
+ * name and domain, and the reader's listener (if any) is invoked on the
+ * writer's thread. Content filter expressions are accepted but not evaluated.
+ * The point is to have a backend cheap enough that pyDDS's own overhead
+ * dominates what the benchmarks measure.
+ *
+ * The struct layouts that dds.py reads directly (sequences, SampleInfo,
+ * InstanceHandle_t, Topic, PublicationBuiltinTopicData, listeners) mirror the
+ * ctypes declarations in dds.py, not the real RTI headers.
+ */
+
+#include <pthread.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <wchar.h>
+#include <errno.h>
+#include <sys/time.h>
+
+typedef int32_t DDS_Long;
+typedef uint32_t DDS_UnsignedLong;
+typedef int DDS_ReturnCode_t;
+typedef int DDS_ExceptionCode_t;
+typedef unsigned char DDS_Boolean;
+
+enum {
+    RC_OK = 0, RC_ERROR = 1, RC_UNSUPPORTED = 2, RC_BAD_PARAMETER = 3,
+    RC_PRECONDITION_NOT_MET = 4, RC_TIMEOUT = 10, RC_NO_DATA = 11
+};
+
+enum {
+    TK_NULL = 0, TK_SHORT, TK_LONG, TK_USHORT, TK_ULONG, TK_FLOAT, TK_DOUBLE,
+    TK_BOOLEAN, TK_CHAR, TK_OCTET, TK_STRUCT, TK_UNION, TK_ENUM, TK_STRING,
+    TK_SEQUENCE, TK_ARRAY, TK_ALIAS, TK_LONGLONG, TK_ULONGLONG, TK_LONGDOUBLE,
+    TK_WCHAR, TK_WSTRING
+};
+
+#define READ_SAMPLE_STATE 1
+#define NOT_READ_SAMPLE_STATE 2
+#define NEW_VIEW_STATE 1
+#define NOT_NEW_VIEW_STATE 2
+#define ALIVE_INSTANCE_STATE 1
+#define NOT_ALIVE_DISPOSED_INSTANCE_STATE 2
+#define NOT_ALIVE_NO_WRITERS_INSTANCE_STATE 4
+#define DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED 0
+
+#define SAMPLE_LOST_STATUS (1 << 7)
+#define DATA_AVAILABLE_STATUS (1 << 10)
+#define PUBLICATION_MATCHED_STATUS (1 << 13)
+#define SUBSCRIPTION_MATCHED_STATUS (1 << 14)
+
+/* ------------------------------------------------------------------------ */
+/* counters                                                                 */
+
+enum {
+    CNT_DYNAMIC_DATA_NEW, CNT_DYNAMIC_DATA_DELETE, CNT_CREATE_DATA,
+    CNT_DELETE_DATA, CNT_STRING_ALLOC, CNT_WRITE, CNT_TAKE, CNT_BIND,
+    CNT_CALLS, CNT_CREATE_WRITER, CNT_CREATE_READER, CNT_STRING_SEQ_ALLOC,
+    CNT_STRING_SEQ_FREE, CNT_LAST
+};
+
+static long g_counters[CNT_LAST];
+
+#define COUNT(c) __sync_fetch_and_add(&g_counters[c], 1)
+
+long stub_get_counter(int which)
+{
+    if (which < 0 || which >= CNT_LAST)
+        return -1;
+    return g_counters[which];
+}
+
+void stub_reset_counters(void)
+{
+    memset(g_counters, 0, sizeof(g_counters));
+}
+
+static pthread_mutex_t g_lock = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t g_changed = PTHREAD_COND_INITIALIZER;
+
+static void *xcalloc(size_t n, size_t size)
+{
+    void *p = calloc(n ? n : 1, size ? size : 1);
+    if (!p) {
+        fprintf(stderr, "nddsc_stub: out of memory\n");
+        abort();
+    }
+    return p;
+}
+
+static char *xstrdup(const char *s)
+{
+    size_t n = strlen(s ? s : "");
+    char *r = xcalloc(n + 1, 1);
+    memcpy(r, s ? s : "", n);
+    return r;
+}
+
+/* ------------------------------------------------------------------------ */
+/* shared plain structs (layout mirrors dds.py)                             */
+
+typedef struct { DDS_Long sec; DDS_UnsignedLong nanosec; } DDS_Time_t;
+typedef struct { DDS_Long sec; DDS_UnsignedLong nanosec; } DDS_Duration_t;
+
+typedef struct {
+    signed char keyHash_value[16];
+    uint32_t keyHash_length;
+    int isValid;
+} DDS_InstanceHandle_t;
+
+typedef struct {
+    DDS_Long sample_state;
+    DDS_Long view_state;
+    DDS_Long instance_state;
+    DDS_Time_t source_timestamp;
+    DDS_InstanceHandle_t instance_handle;
+    DDS_InstanceHandle_t publication_handle;
+    DDS_Long disposed_generation_count;
+    DDS_Long no_writers_generation_count;
+    DDS_Long sample_rank;
+    DDS_Long generation_rank;
+    DDS_Long absolute_generation_rank;
+    DDS_Boolean valid_data;
+    DDS_Time_t reception_timestamp;
+    DDS_Long flag;
+} DDS_SampleInfo;
+
+typedef struct {
+    DDS_Boolean _owned;
+    void *_contiguous_buffer;
+    void *_discontiguous_buffer;
+    unsigned long _maximum;
+    unsigned long _length;
+    long _sequence_init;
+    void *_read_token1;
+    void *_read_token2;
+} Seq;
+
+typedef struct { int32_t value[4]; } DDS_BuiltinTopicKey_t;
+
+typedef struct {
+    DDS_BuiltinTopicKey_t key;
+    DDS_BuiltinTopicKey_t participant_key;
+    char *topic_name;
+    char *type_name;
+} DDS_PublicationBuiltinTopicData;
+
+typedef struct {
+    DDS_BuiltinTopicKey_t key;
+    char *name;
+    char *type_name;
+} DDS_TopicBuiltinTopicData;
+
+long stub_sizeof(int which)
+{
+    switch (which) {
+    case 0: return sizeof(DDS_SampleInfo);
+    case 1: return sizeof(Seq);
+    case 2: return sizeof(DDS_InstanceHandle_t);
+    case 3: return sizeof(DDS_PublicationBuiltinTopicData);
+    }
+    return -1;
+}
+
+static void now(DDS_Time_t *t)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_REALTIME, &ts);
+    t->sec = (DDS_Long)ts.tv_sec;
+    t->nanosec = (DDS_UnsignedLong)ts.tv_nsec;
+}
+
+/* ------------------------------------------------------------------------ */
+/* TypeCode                                                                 */
+
+typedef struct DDS_TypeCode DDS_TypeCode;
+
+typedef struct {
+    char *name;
+    DDS_Long id;
+    int is_key;
+    DDS_TypeCode *type;
+} Member;
+
+struct DDS_TypeCode {
+    int kind;
+    char *name;
+    int nmembers;
+    int cap;
+    Member *members;
+    DDS_TypeCode *content;
+    DDS_UnsignedLong length;      /* sequence/string bound, array element count */
+};
+
+static DDS_TypeCode *tc_new(int kind, const char *name)
+{
+    DDS_TypeCode *tc = xcalloc(1, sizeof(*tc));
+    tc->kind = kind;
+    tc->name = name ? xstrdup(name) : NULL;
+    return tc;
+}
+
+DDS_TypeCode *stub_tc_primitive(int kind)
+{
+    static DDS_TypeCode *cache[32];
+    if (kind < 0 || kind >= 32)
+        return NULL;
+    pthread_mutex_lock(&g_lock);
+    if (!cache[kind])
+        cache[kind] = tc_new(kind, NULL);
+    pthread_mutex_unlock(&g_lock);
+    return cache[kind];
+}
+
+DDS_TypeCode *stub_tc_string(DDS_UnsignedLong bound)
+{
+    DDS_TypeCode *tc = tc_new(TK_STRING, NULL);
+    tc->length = bound;
+    return tc;
+}
+
+DDS_TypeCode *stub_tc_wstring(DDS_UnsignedLong bound)
+{
+    DDS_TypeCode *tc = tc_new(TK_WSTRING, NULL);
+    tc->length = bound;
+    return tc;
+}
+
+DDS_TypeCode *stub_tc_struct(const char *name)
+{
+    return tc_new(TK_STRUCT, name);
+}
+
+DDS_TypeCode *stub_tc_enum(const char *name)
+{
+    return tc_new(TK_ENUM, name);
+}
+
+DDS_TypeCode *stub_tc_sequence(DDS_TypeCode *content, DDS_UnsignedLong bound)
+{
+    DDS_TypeCode *tc = tc_new(TK_SEQUENCE, NULL);
+    tc->content = content;
+    tc->length = bound;
+    return tc;
+}
+
+DDS_TypeCode *stub_tc_array(DDS_TypeCode *content, DDS_UnsignedLong count)
+{
+    DDS_TypeCode *tc = tc_new(TK_ARRAY, NULL);
+    tc->content = content;
+    tc->length = count;
+    return tc;
+}
+
+DDS_TypeCode *stub_tc_alias(const char *name, DDS_TypeCode *content)
+{
+    DDS_TypeCode *tc = tc_new(TK_ALIAS, name);
+    tc->content = content;
+    return tc;
+}
+
+static void tc_push_member(DDS_TypeCode *tc, const char *name, DDS_TypeCode *type, int is_key)
+{
+    if (tc->nmembers == tc->cap) {
+        int cap = tc->cap ? tc->cap * 2 : 8;
+        Member *m = xcalloc(cap, sizeof(Member));
+        if (tc->members) {
+            memcpy(m, tc->members, tc->nmembers * sizeof(Member));
+            free(tc->members);
+        }
+        tc->members = m;
+        tc->cap = cap;
+    }
+    tc->members[tc->nmembers].name = xstrdup(name);
+    tc->members[tc->nmembers].id = tc->nmembers;
+    tc->members[tc->nmembers].is_key = is_key;
+    tc->members[tc->nmembers].type = type;
+    tc->nmembers++;
+}
+
+void stub_tc_add_member(DDS_TypeCode *tc, const char *name, DDS_TypeCode *type, int is_key)
+{
+    tc_push_member(tc, name, type, is_key);
+}
+
+void stub_tc_add_enumerator(DDS_TypeCode *tc, const char *name)
+{
+    tc_push_member(tc, name, NULL, 0);
+}
+
+static DDS_TypeCode *resolve(DDS_TypeCode *tc)
+{
+    while (tc && tc->kind == TK_ALIAS)
+        tc = tc->content;
+    return tc;
+}
+
+static int tc_find_member(DDS_TypeCode *tc, const char *name)
+{
+    int i;
+    for (i = 0; i < tc->nmembers; i++)
+        if (strcmp(tc->members[i].name, name) == 0)
+            return i;
+    return -1;
+}
+
+#define EX_OK(ex) do { if (ex) *(ex) = 0; } while (0)
+#define EX_FAIL(ex, code) do { if (ex) *(ex) = (code); } while (0)
+
+const char *DDS_TypeCode_name(DDS_TypeCode *tc, DDS_ExceptionCode_t *ex)
+{
+    EX_OK(ex);
+    if (!tc->name) {
+        EX_FAIL(ex, 6);
+        return NULL;
+    }
+    return tc->name;
+}
+
+int DDS_TypeCode_kind(DDS_TypeCode *tc, DDS_ExceptionCode_t *ex)
+{
+    EX_OK(ex);
+    return tc->kind;
+}
+
+DDS_UnsignedLong DDS_TypeCode_member_count(DDS_TypeCode *tc, DDS_ExceptionCode_t *ex)
+{
+    EX_OK(ex);
+    if (tc->kind != TK_STRUCT && tc->kind != TK_ENUM) {
+        EX_FAIL(ex, 6);
+        return 0;
+    }
+    return tc->nmembers;
+}
+
+const char *DDS_TypeCode_member_name(DDS_TypeCode *tc, DDS_UnsignedLong i, DDS_ExceptionCode_t *ex)
+{
+    EX_OK(ex);
+    if ((int)i >= tc->nmembers) {
+        EX_FAIL(ex, 7);
+        return NULL;
+    }
+    return tc->members[i].name;
+}
+
+DDS_TypeCode *DDS_TypeCode_member_type(DDS_TypeCode *tc, DDS_UnsignedLong i, DDS_ExceptionCode_t *ex)
+{
+    EX_OK(ex);
+    if ((int)i >= tc->nmembers || tc->kind != TK_STRUCT) {
+        EX_FAIL(ex, 7);
+        return NULL;
+    }
+    return tc->members[i].type;
+}
+
+DDS_Long DDS_TypeCode_member_id(DDS_TypeCode *tc, DDS_UnsignedLong i, DDS_ExceptionCode_t *ex)
+{
+    EX_OK(ex);
+    if ((int)i >= tc->nmembers) {
+        EX_FAIL(ex, 7);
+        return 0;
+    }
+    return tc->members[i].id;
+}
+
+DDS_Long DDS_TypeCode_member_ordinal(DDS_TypeCode *tc, DDS_UnsignedLong i, DDS_ExceptionCode_t *ex)
+{
+    return DDS_TypeCode_member_id(tc, i, ex);
+}
+
+DDS_UnsignedLong DDS_TypeCode_find_member_by_name(DDS_TypeCode *tc, const char *name, DDS_ExceptionCode_t *ex)
+{
+    int i = tc_find_member(tc, name);
+    EX_OK(ex);
+    if (i < 0)
+        EX_FAIL(ex, 9);
+    return (DDS_UnsignedLong)i;
+}
+
+DDS_Boolean DDS_TypeCode_is_member_key(DDS_TypeCode *tc, DDS_UnsignedLong i, DDS_ExceptionCode_t *ex)
+{
+    EX_OK(ex);
+    if ((int)i >= tc->nmembers) {
+        EX_FAIL(ex, 7);
+        return 0;
+    }
+    return (DDS_Boolean)tc->members[i].is_key;
+}
+
+DDS_TypeCode *DDS_TypeCode_content_type(DDS_TypeCode *tc, DDS_ExceptionCode_t *ex)
+{
+    EX_OK(ex);
+    if (!tc->content) {
+        EX_FAIL(ex, 6);
+        return NULL;
+    }
+    return tc->content;
+}
+
+DDS_UnsignedLong DDS_TypeCode_length(DDS_TypeCode *tc, DDS_ExceptionCode_t *ex)
+{
+    EX_OK(ex);
+    return tc->length;
+}
+
+DDS_UnsignedLong DDS_TypeCode_element_count(DDS_TypeCode *tc, DDS_ExceptionCode_t *ex)
+{
+    EX_OK(ex);
+    if (tc->kind != TK_ARRAY) {
+        EX_FAIL(ex, 6);
+        return 0;
+    }
+    return tc->length;
+}
+
+/* ------------------------------------------------------------------------ */
+/* values                                                                   */
+
+typedef struct Value Value;
+struct Value {
+    DDS_TypeCode *tc;               /* resolved (never an alias) */
+    union {
+        int64_t i;
+        uint64_t u;
+        double d;
+        long double ld;
+        char *s;
+        wchar_t *ws;
+    } v;
+    int n;
+    int cap;
+    Value **items;
+};
+
+static Value *value_new(DDS_TypeCode *tc)
+{
+    Value *val = xcalloc(1, sizeof(Value));
+    int i;
+    tc = resolve(tc);
+    val->tc = tc;
+    switch (tc->kind) {
+    case TK_STRUCT:
+        val->n = val->cap = tc->nmembers;
+        val->items = xcalloc(tc->nmembers, sizeof(Value *));
+        for (i = 0; i < tc->nmembers; i++)
+            val->items[i] = value_new(tc->members[i].type);
+        break;
+    case TK_ARRAY:
+        val->n = val->cap = (int)tc->length;
+        val->items = xcalloc(tc->length, sizeof(Value *));
+        for (i = 0; i < (int)tc->length; i++)
+            val->items[i] = value_new(tc->content);
+        break;
+    case TK_SEQUENCE:
+        break;
+    case TK_STRING:
+        val->v.s = xstrdup("");
+        break;
+    case TK_WSTRING:
+        val->v.ws = xcalloc(1, sizeof(wchar_t));
+        break;
+    }
+    return val;
+}
+
+static void value_free(Value *val)
+{
+    int i;
+    if (!val)
+        return;
+    if (val->tc->kind == TK_STRING)
+        free(val->v.s);
+    else if (val->tc->kind == TK_WSTRING)
+        free(val->v.ws);
+    for (i = 0; i < val->n; i++)
+        value_free(val->items[i]);
+    free(val->items);
+    free(val);
+}
+
+static Value *value_copy(const Value *src)
+{
+    Value *val = xcalloc(1, sizeof(Value));
+    int i;
+    *val = *src;
+    val->items = NULL;
+    if (src->tc->kind == TK_STRING) {
+        val->v.s = xstrdup(src->v.s);
+    } else if (src->tc->kind == TK_WSTRING) {
+        size_t n = wcslen(src->v.ws);
+        val->v.ws = xcalloc(n + 1, sizeof(wchar_t));
+        memcpy(val->v.ws, src->v.ws, n * sizeof(wchar_t));
+    }
+    if (src->cap) {
+        val->items = xcalloc(src->cap, sizeof(Value *));
+        for (i = 0; i < src->n; i++)
+            val->items[i] = value_copy(src->items[i]);
+    }
+    return val;
+}
+
+static void seq_grow(Value *val, int n)
+{
+    if (n > val->cap) {
+        int cap = val->cap ? val->cap : 4;
+        Value **items;
+        while (cap < n)
+            cap *= 2;
+        items = xcalloc(cap, sizeof(Value *));
+        if (val->items) {
+            memcpy(items, val->items, val->n * sizeof(Value *));
+            free(val->items);
+        }
+        val->items = items;
+        val->cap = cap;
+    }
+    while (val->n < n)
+        val->items[val->n++] = value_new(val->tc->content);
+}
+
+static void seq_truncate(Value *val, int n)
+{
+    while (val->n > n)
+        value_free(val->items[--val->n]);
+}
+
+static void hash_bytes(uint64_t *h, const void *data, size_t n)
+{
+    const unsigned char *p = data;
+    size_t i;
+    for (i = 0; i < n; i++) {
+        h[0] = (h[0] ^ p[i]) * 1099511628211ULL;
+        h[1] = (h[1] ^ p[i]) * 0x100000001b3ULL + 0x9e3779b97f4a7c15ULL;
+    }
+}
+
+static void value_hash(uint64_t *h, const Value *val)
+{
+    int i;
+    switch (val->tc->kind) {
+    case TK_STRING:
+        hash_bytes(h, val->v.s, strlen(val->v.s) + 1);
+        break;
+    case TK_WSTRING:
+        hash_bytes(h, val->v.ws, (wcslen(val->v.ws) + 1) * sizeof(wchar_t));
+        break;
+    case TK_STRUCT:
+    case TK_ARRAY:
+    case TK_SEQUENCE:
+        hash_bytes(h, &val->n, sizeof(val->n));
+        for (i = 0; i < val->n; i++)
+            value_hash(h, val->items[i]);
+        break;
+    default:
+        hash_bytes(h, &val->v, sizeof(val->v.u));
+    }
+}
+
+static void key_handle(const Value *val, DDS_InstanceHandle_t *handle)
+{
+    uint64_t h[2] = {14695981039346656037ULL, 7809847782465536322ULL};
+    int i;
+    DDS_TypeCode *tc = val->tc;
+    for (i = 0; i < tc->nmembers; i++)
+        if (tc->members[i].is_key)
+            value_hash(h, val->items[i]);
+    memcpy(handle->keyHash_value, h, 16);
+    handle->keyHash_length = 16;
+    handle->isValid = 1;
+}
+
+static void copy_keys(Value *dst, const Value *src)
+{
+    int i;
+    for (i = 0; i < src->tc->nmembers; i++) {
+        if (src->tc->members[i].is_key) {
+            value_free(dst->items[i]);
+            dst->items[i] = value_copy(src->items[i]);
+        }
+    }
+}
+
+/* ------------------------------------------------------------------------ */
+/* DynamicData                                                              */
+
+typedef struct DDS_DynamicData {
+    DDS_TypeCode *tc;
+    Value *root;
+    int owns;
+    int bound;
+} DDS_DynamicData;
+
+static DDS_DynamicData *dd_wrap(Value *root, int owns)
+{
+    DDS_DynamicData *dd = xcalloc(1, sizeof(*dd));
+    dd->root = root;
+    dd->tc = root ? root->tc : NULL;
+    dd->owns = owns;
+    return dd;
+}
+
+static void dd_free(DDS_DynamicData *dd)
+{
+    if (!dd)
+        return;
+    if (dd->owns)
+        value_free(dd->root);
+    free(dd);
+}
+
+char DDS_DYNAMIC_DATA_PROPERTY_DEFAULT[64];
+char DDS_DYNAMIC_DATA_TYPE_PROPERTY_DEFAULT[64];
+
+DDS_DynamicData *DDS_DynamicData_new(DDS_TypeCode *tc, void *property)
+{
+    (void)property;
+    COUNT(CNT_DYNAMIC_DATA_NEW);
+    return dd_wrap(tc ? value_new(tc) : NULL, tc != NULL);
+}
+
+void DDS_DynamicData_delete(DDS_DynamicData *dd)
+{
+    COUNT(CNT_DYNAMIC_DATA_DELETE);
+    dd_free(dd);
+}
+
+/* Find (and for writes, create) the member value addressed by name or id. */
+static Value *dd_member(DDS_DynamicData *dd, const char *name, DDS_Long id, int create)
+{
+    Value *root = dd->root;
+    int i;
+    if (!root)
+        return NULL;
+    switch (root->tc->kind) {
+    case TK_STRUCT:
+        if (name) {
+            i = tc_find_member(root->tc, name);
+        } else if (id == DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED) {
+            /* As in RTI: with no name, the unspecified id addresses nothing,
+               even though the first member's id is also 0. */
+            i = -1;
+        } else {
+            for (i = 0; i < root->tc->nmembers; i++)
+                if (root->tc->members[i].id == id)
+                    break;
+            if (i == root->tc->nmembers)
+                i = -1;
+        }
+        return i < 0 ? NULL : root->items[i];
+    case TK_ARRAY:
+        if (name || id < 1 || id > root->n)
+            return NULL;
+        return root->items[id - 1];
+    case TK_SEQUENCE:
+        if (name || id < 1)
+            return NULL;
+        if (id > root->n) {
+            if (!create)
+                return NULL;
+            if (root->tc->length && (DDS_UnsignedLong)id > root->tc->length)
+                return NULL;
+            seq_grow(root, id);
+        }
+        return root->items[id - 1];
+    }
+    return NULL;
+}
+
+static int kind_compatible(int want, int have)
+{
+    if (want == have)
+        return 1;
+    /* enums are accessed as longs/ulongs */
+    return have == TK_ENUM && (want == TK_ULONG || want == TK_LONG);
+}
+
+#define PRIM_ACCESSORS(NAME, CTYPE, KIND, FIELD)                                       \
+DDS_ReturnCode_t DDS_DynamicData_get_##NAME(DDS_DynamicData *dd, CTYPE *out,           \
+                                           const char *name, DDS_Long id)              \
+{                                                                                      \
+    Value *m = dd_member(dd, name, id, 0);                                             \
+    COUNT(CNT_CALLS);                                                                  \
+    if (!m)                                                                            \
+        return RC_NO_DATA;                                                             \
+    if (!kind_compatible(KIND, m->tc->kind))                                           \
+        return RC_BAD_PARAMETER;                                                       \
+    *out = (CTYPE)m->v.FIELD;                                                          \
+    return RC_OK;                                                                      \
+}                                                                                      \
+DDS_ReturnCode_t DDS_DynamicData_set_##NAME(DDS_DynamicData *dd, const char *name,     \
+                                           DDS_Long id, CTYPE value)                   \
+{                                                                                      \
+    Value *m = dd_member(dd, name, id, 1);                                             \
+    COUNT(CNT_CALLS);                                                                  \
+    if (!m)                                                                            \
+        return RC_BAD_PARAMETER;                                                       \
+    if (!kind_compatible(KIND, m->tc->kind))                                           \
+        return RC_BAD_PARAMETER;                                                       \
+    m->v.FIELD = value;                                                                \
+    return RC_OK;                                                                      \
+}                                                                                      \
+DDS_ReturnCode_t DDS_DynamicData_get_##NAME##_array(DDS_DynamicData *dd, CTYPE *out,   \
+                          DDS_UnsignedLong *length, const char *name, DDS_Long id)     \
+{                                                                                      \
+    Value *m;                                                                          \
+    int i;                                                                             \
+    COUNT(CNT_CALLS);                                                                  \
+    if (name || id != 0) {                                                             \
+        m = dd_member(dd, name, id, 0);                                                \
+    } else {                                                                           \
+        m = dd->root;                                                                  \
+    }                                                                                  \
+    if (!m)                                                                            \
+        return RC_NO_DATA;                                                             \
+    if (m->tc->kind != TK_SEQUENCE && m->tc->kind != TK_ARRAY)                         \
+        return RC_BAD_PARAMETER;                                                       \
+    if (resolve(m->tc->content)->kind != KIND)                                         \
+        return RC_BAD_PARAMETER;                                                       \
+    if ((DDS_UnsignedLong)m->n > *length)                                              \
+        return RC_BAD_PARAMETER;                                                       \
+    for (i = 0; i < m->n; i++)                                                         \
+        out[i] = (CTYPE)m->items[i]->v.FIELD;                                          \
+    *length = m->n;                                                                    \
+    return RC_OK;                                                                      \
+}                                                                                      \
+DDS_ReturnCode_t DDS_DynamicData_set_##NAME##_array(DDS_DynamicData *dd,               \
+            const char *name, DDS_Long id, DDS_UnsignedLong length, const CTYPE *in)  \
+{                                                                                      \
+    Value *m;                                                                          \
+    int i;                                                                             \
+    COUNT(CNT_CALLS);                                                                  \
+    if (name || id != 0) {                                                             \
+        m = dd_member(dd, name, id, 1);                                                \
+    } else {                                                                           \
+        m = dd->root;                                                                  \
+    }                                                                                  \
+    if (!m)                                                                            \
+        return RC_BAD_PARAMETER;                                                       \
+    if (m->tc->kind != TK_SEQUENCE && m->tc->kind != TK_ARRAY)                         \
+        return RC_BAD_PARAMETER;                                                       \
+    if (resolve(m->tc->content)->kind != KIND)                                         \
+        return RC_BAD_PARAMETER;                                                       \
+    if (m->tc->kind == TK_ARRAY) {                                                     \
+        if (length != (DDS_UnsignedLong)m->n)                                          \
+            return RC_BAD_PARAMETER;                                                   \
+    } else {                                                                           \
+        if (m->tc->length && length > m->tc->length)                                   \
+            return RC_BAD_PARAMETER;                                                   \
+        seq_truncate(m, (int)length);                                                  \
+        seq_grow(m, (int)length);                                                      \
+    }                                                                                  \
+    for (i = 0; i < (int)length; i++)                                                  \
+        m->items[i]->v.FIELD = in[i];                                                  \
+    return RC_OK;                                                                      \
+}
+
+PRIM_ACCESSORS(long, DDS_Long, TK_LONG, i)
+PRIM_ACCESSORS(ulong, DDS_UnsignedLong, TK_ULONG, u)
+PRIM_ACCESSORS(short, int16_t, TK_SHORT, i)
+PRIM_ACCESSORS(ushort, uint16_t, TK_USHORT, u)
+PRIM_ACCESSORS(longlong, int64_t, TK_LONGLONG, i)
+PRIM_ACCESSORS(ulonglong, uint64_t, TK_ULONGLONG, u)
+PRIM_ACCESSORS(float, float, TK_FLOAT, d)
+PRIM_ACCESSORS(double, double, TK_DOUBLE, d)
+PRIM_ACCESSORS(longdouble, long double, TK_LONGDOUBLE, ld)
+PRIM_ACCESSORS(boolean, DDS_Boolean, TK_BOOLEAN, u)
+PRIM_ACCESSORS(octet, unsigned char, TK_OCTET, u)
+PRIM_ACCESSORS(char, char, TK_CHAR, i)
+PRIM_ACCESSORS(wchar, wchar_t, TK_WCHAR, u)
+
+DDS_ReturnCode_t DDS_DynamicData_get_string(DDS_DynamicData *dd, char **value, DDS_UnsignedLong *size,
+                                            const char *name, DDS_Long id)
+{
+    Value *m = dd_member(dd, name, id, 0);
+    COUNT(CNT_CALLS);
+    if (!m)
+        return RC_NO_DATA;
+    if (m->tc->kind != TK_STRING)
+        return RC_BAD_PARAMETER;
+    if (*value == NULL) {
+        COUNT(CNT_STRING_ALLOC);
+        *value = xstrdup(m->v.s);
+    } else {
+        size_t n = strlen(m->v.s);
+        if (!size || *size <= n)
+            return RC_BAD_PARAMETER;
+        memcpy(*value, m->v.s, n + 1);
+    }
+    if (size)
+        *size = (DDS_UnsignedLong)strlen(m->v.s) + 1;
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DynamicData_set_string(DDS_DynamicData *dd, const char *name, DDS_Long id,
+                                            const char *value)
+{
+    Value *m = dd_member(dd, name, id, 1);
+    COUNT(CNT_CALLS);
+    if (!m)
+        return RC_BAD_PARAMETER;
+    if (m->tc->kind != TK_STRING)
+        return RC_BAD_PARAMETER;
+    if (m->tc->length && strlen(value) > m->tc->length)
+        return RC_BAD_PARAMETER;
+    free(m->v.s);
+    m->v.s = xstrdup(value);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DynamicData_get_wstring(DDS_DynamicData *dd, wchar_t **value, DDS_UnsignedLong *size,
+                                             const char *name, DDS_Long id)
+{
+    Value *m = dd_member(dd, name, id, 0);
+    size_t n;
+    COUNT(CNT_CALLS);
+    if (!m)
+        return RC_NO_DATA;
+    if (m->tc->kind != TK_WSTRING)
+        return RC_BAD_PARAMETER;
+    n = wcslen(m->v.ws);
+    if (*value == NULL) {
+        COUNT(CNT_STRING_ALLOC);
+        *value = xcalloc(n + 1, sizeof(wchar_t));
+    } else if (!size || *size <= n) {
+        return RC_BAD_PARAMETER;
+    }
+    memcpy(*value, m->v.ws, (n + 1) * sizeof(wchar_t));
+    if (size)
+        *size = (DDS_UnsignedLong)n + 1;
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DynamicData_set_wstring(DDS_DynamicData *dd, const char *name, DDS_Long id,
+                                             const wchar_t *value)
+{
+    Value *m = dd_member(dd, name, id, 1);
+    size_t n = wcslen(value);
+    COUNT(CNT_CALLS);
+    if (!m)
+        return RC_BAD_PARAMETER;
+    if (m->tc->kind != TK_WSTRING)
+        return RC_BAD_PARAMETER;
+    free(m->v.ws);
+    m->v.ws = xcalloc(n + 1, sizeof(wchar_t));
+    memcpy(m->v.ws, value, n * sizeof(wchar_t));
+    return RC_OK;
+}
+
+void DDS_String_free(char *s)
+{
+    free(s);
+}
+
+void DDS_Wstring_free(wchar_t *s)
+{
+    free(s);
+}
+
+DDS_ReturnCode_t DDS_DynamicData_bind_complex_member(DDS_DynamicData *dd, DDS_DynamicData *inner,
+                                                     const char *name, DDS_Long id)
+{
+    Value *m = dd_member(dd, name, id, 1);
+    COUNT(CNT_BIND);
+    if (!m)
+        return RC_BAD_PARAMETER;
+    if (m->tc->kind != TK_STRUCT && m->tc->kind != TK_SEQUENCE && m->tc->kind != TK_ARRAY)
+        return RC_BAD_PARAMETER;
+    if (inner->bound || (inner->owns && inner->root))
+        return RC_PRECONDITION_NOT_MET;
+    inner->root = m;
+    inner->tc = m->tc;
+    inner->owns = 0;
+    inner->bound = 1;
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DynamicData_unbind_complex_member(DDS_DynamicData *dd, DDS_DynamicData *inner)
+{
+    (void)dd;
+    if (!inner->bound)
+        return RC_PRECONDITION_NOT_MET;
+    inner->root = NULL;
+    inner->tc = NULL;
+    inner->bound = 0;
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DynamicData_get_member_type(DDS_DynamicData *dd, DDS_TypeCode **out,
+                                                 const char *name, DDS_Long id)
+{
+    Value *root = dd->root;
+    int i;
+    COUNT(CNT_CALLS);
+    if (!root)
+        return RC_PRECONDITION_NOT_MET;
+    if (root->tc->kind == TK_STRUCT) {
+        Value *m = dd_member(dd, name, id, 0);
+        if (!m)
+            return RC_BAD_PARAMETER;
+        for (i = 0; i < root->n; i++)
+            if (root->items[i] == m)
+                *out = root->tc->members[i].type;
+        return RC_OK;
+    }
+    if (root->tc->kind == TK_SEQUENCE || root->tc->kind == TK_ARRAY) {
+        *out = root->tc->content;
+        return RC_OK;
+    }
+    return RC_BAD_PARAMETER;
+}
+
+DDS_UnsignedLong DDS_DynamicData_get_member_count(DDS_DynamicData *dd)
+{
+    COUNT(CNT_CALLS);
+    return dd->root ? (DDS_UnsignedLong)dd->root->n : 0;
+}
+
+typedef struct {
+    DDS_Long member_id;
+    const char *member_name;
+    DDS_Boolean member_exists;
+    int member_kind;
+    DDS_UnsignedLong representation_count;
+    DDS_UnsignedLong element_count;
+    int element_kind;
+} DDS_DynamicDataMemberInfo;
+
+DDS_ReturnCode_t DDS_DynamicData_get_member_info(DDS_DynamicData *dd, DDS_DynamicDataMemberInfo *info,
+                                                 const char *name, DDS_Long id)
+{
+    Value *m = dd_member(dd, name, id, 0);
+    COUNT(CNT_CALLS);
+    if (!m)
+        return RC_NO_DATA;
+    memset(info, 0, sizeof(*info));
+    info->member_id = id;
+    info->member_name = name;
+    info->member_exists = 1;
+    info->member_kind = m->tc->kind;
+    info->representation_count = 1;
+    if (m->tc->kind == TK_SEQUENCE || m->tc->kind == TK_ARRAY) {
+        info->element_count = (DDS_UnsignedLong)m->n;
+        info->element_kind = resolve(m->tc->content)->kind;
+    }
+    return RC_OK;
+}
+
+DDS_TypeCode *DDS_DynamicData_get_type(DDS_DynamicData *dd)
+{
+    COUNT(CNT_CALLS);
+    return dd->tc;
+}
+
+int DDS_DynamicData_get_type_kind(DDS_DynamicData *dd)
+{
+    COUNT(CNT_CALLS);
+    return dd->tc ? dd->tc->kind : TK_NULL;
+}
+
+DDS_ReturnCode_t DDS_DynamicData_clear_all_members(DDS_DynamicData *dd)
+{
+    DDS_TypeCode *tc = dd->tc;
+    Value *root = dd->root;
+    Value *fresh;
+    int i;
+    if (!root)
+        return RC_PRECONDITION_NOT_MET;
+    fresh = value_new(tc);
+    for (i = 0; i < root->n; i++)
+        value_free(root->items[i]);
+    free(root->items);
+    *root = *fresh;
+    free(fresh);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DynamicData_copy(DDS_DynamicData *dd, const DDS_DynamicData *src)
+{
+    Value *copy;
+    int i;
+    if (!dd->root || !src->root || dd->root->tc != src->root->tc)
+        return RC_BAD_PARAMETER;
+    copy = value_copy(src->root);
+    if (dd->root->tc->kind == TK_STRING)
+        free(dd->root->v.s);
+    else if (dd->root->tc->kind == TK_WSTRING)
+        free(dd->root->v.ws);
+    for (i = 0; i < dd->root->n; i++)
+        value_free(dd->root->items[i]);
+    free(dd->root->items);
+    *dd->root = *copy;
+    free(copy);
+    return RC_OK;
+}
+
+/* ------------------------------------------------------------------------ */
+/* type support                                                             */
+
+typedef struct DDS_DynamicDataTypeSupport {
+    DDS_TypeCode *tc;
+    int registrations;
+} DDS_DynamicDataTypeSupport;
+
+DDS_DynamicDataTypeSupport *DDS_DynamicDataTypeSupport_new(DDS_TypeCode *tc, void *props)
+{
+    DDS_DynamicDataTypeSupport *s = xcalloc(1, sizeof(*s));
+    (void)props;
+    s->tc = tc;
+    return s;
+}
+
+void DDS_DynamicDataTypeSupport_delete(DDS_DynamicDataTypeSupport *s)
+{
+    free(s);
+}
+
+DDS_ReturnCode_t DDS_DynamicDataTypeSupport_register_type(DDS_DynamicDataTypeSupport *s, void *p, const char *name)
+{
+    (void)p; (void)name;
+    s->registrations++;
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DynamicDataTypeSupport_unregister_type(DDS_DynamicDataTypeSupport *s, void *p, const char *name)
+{
+    (void)p; (void)name;
+    if (s->registrations <= 0)
+        return RC_PRECONDITION_NOT_MET;
+    s->registrations--;
+    return RC_OK;
+}
+
+DDS_DynamicData *DDS_DynamicDataTypeSupport_create_data(DDS_DynamicDataTypeSupport *s)
+{
+    COUNT(CNT_CREATE_DATA);
+    return dd_wrap(value_new(s->tc), 1);
+}
+
+DDS_ReturnCode_t DDS_DynamicDataTypeSupport_delete_data(DDS_DynamicDataTypeSupport *s, DDS_DynamicData *dd)
+{
+    (void)s;
+    COUNT(CNT_DELETE_DATA);
+    dd_free(dd);
+    return RC_OK;
+}
+
+void DDS_DynamicDataTypeSupport_print_data(DDS_DynamicDataTypeSupport *s, DDS_DynamicData *dd)
+{
+    (void)s; (void)dd;
+}
+
+/* ------------------------------------------------------------------------ */
+/* entities                                                                 */
+
+enum { E_PARTICIPANT = 1, E_PUBLISHER, E_SUBSCRIBER, E_TOPIC, E_READER, E_WRITER };
+
+typedef struct DDS_StatusCondition DDS_StatusCondition;
+typedef struct DDS_Entity {
+    int kind;
+    DDS_StatusCondition *condition;
+    unsigned status;                /* triggered status bits */
+} DDS_Entity;
+
+typedef struct DDS_Condition {
+    int kind;                       /* 0 status, 1 guard, 2 read */
+} DDS_Condition;
+
+struct DDS_StatusCondition {
+    DDS_Condition as_condition;
+    DDS_Entity *entity;
+    DDS_UnsignedLong enabled;
+};
+
+typedef struct DDS_GuardCondition {
+    DDS_Condition as_condition;
+    int trigger;
+} DDS_GuardCondition;
+
+typedef struct DDS_DomainParticipant DDS_DomainParticipant;
+typedef struct DDS_DataReader DDS_DataReader;
+typedef struct DDS_TopicDescription DDS_TopicDescription;
+
+typedef struct DDS_Topic {
+    void *as_entity;
+    DDS_TopicDescription *as_topicdescription;
+    DDS_Entity entity;
+} DDS_Topic;
+
+typedef struct DDS_ContentFilteredTopic {
+    DDS_TopicDescription *as_topicdescription;
+    void *narrow;
+    char *expression;
+    int nparams;
+    char **params;
+    DDS_Topic *related;
+} DDS_ContentFilteredTopic;
+
+struct DDS_TopicDescription {
+    char *name;
+    char *type_name;
+    DDS_Topic *topic;               /* the related topic for filtered topics */
+    DDS_ContentFilteredTopic *cft;
+    DDS_DomainParticipant *participant;
+};
+
+typedef struct DDS_Listener { void *listener_data; } DDS_Listener;
+
+typedef void (*status_cb)(void *, void *, void *);
+typedef void (*data_cb)(void *, void *);
+
+typedef struct DDS_DataReaderListener {
+    DDS_Listener as_listener;
+    status_cb on_requested_deadline_missed;
+    status_cb on_requested_incompatible_qos;
+    status_cb on_sample_rejected;
+    status_cb on_liveliness_changed;
+    data_cb on_data_available;
+    status_cb on_subscription_matched;
+    status_cb on_sample_lost;
+} DDS_DataReaderListener;
+
+typedef struct DDS_DataWriterListener {
+    DDS_Listener as_listener;
+    status_cb on_offered_deadline_missed;
+    status_cb on_offered_incompatible_qos;
+    status_cb on_liveliness_lost;
+    status_cb on_publication_matched;
+    void *on_reliable_writer_cache_changed;
+    void *on_reliable_reader_activity_changed;
+    void *on_destination_unreachable;
+    void *on_data_request;
+    void *on_data_return;
+    void *on_sample_removed;
+    void *on_instance_replaced;
+    void *on_application_acknowledgment;
+    void *on_service_request_accepted;
+} DDS_DataWriterListener;
+
+typedef struct Sample {
+    Value *data;
+    DDS_SampleInfo info;
+    int read;
+    struct Sample *next;
+} Sample;
+
+typedef struct Instance {
+    DDS_InstanceHandle_t handle;
+    Value *key;
+    int state;
+    struct Instance *next;
+} Instance;
+
+typedef struct {
+    DDS_Long total_count;
+    DDS_Long total_count_change;
+    int last_reason;
+} DDS_SampleLostStatus;
+
+typedef struct {
+    DDS_Long total_count;
+    DDS_Long total_count_change;
+    DDS_Long current_count;
+    DDS_Long current_count_peak;
+    DDS_Long current_count_change;
+    DDS_InstanceHandle_t last_publication_handle;
+} DDS_SubscriptionMatchedStatus;
+
+typedef struct {
+    DDS_Long total_count;
+    DDS_Long total_count_change;
+    DDS_Long current_count;
+    DDS_Long current_count_peak;
+    DDS_Long current_count_change;
+    DDS_InstanceHandle_t last_subscription_handle;
+} DDS_PublicationMatchedStatus;
+
+typedef struct DDS_Publisher {
+    DDS_Entity entity;
+    DDS_DomainParticipant *participant;
+} DDS_Publisher;
+
+typedef struct DDS_Subscriber {
+    DDS_Entity entity;
+    DDS_DomainParticipant *participant;
+    DDS_DataReader *builtin_publication_reader;
+} DDS_Subscriber;
+
+struct DDS_DataReader {
+    DDS_Entity entity;
+    DDS_Subscriber *subscriber;
+    DDS_TopicDescription *td;
+    char *topic_name;
+    char *profile;
+    int domain;
+    int builtin;
+    int has_listener;
+    DDS_DataReaderListener listener;
+    DDS_UnsignedLong mask;
+    Sample *head;
+    Sample *tail;
+    int depth;
+    Instance *instances;
+    int ninstances;
+    DDS_SubscriptionMatchedStatus matched;
+    DDS_SampleLostStatus lost;
+    struct DDS_DataReader *next;
+};
+
+typedef struct DDS_DataWriter {
+    DDS_Entity entity;
+    DDS_Publisher *publisher;
+    DDS_Topic *topic;
+    char *profile;
+    int domain;
+    int has_listener;
+    DDS_DataWriterListener listener;
+    DDS_UnsignedLong mask;
+    Instance *registered;
+    DDS_PublicationMatchedStatus matched;
+    struct DDS_DataWriter *next;
+} DDS_DataWriter;
+
+struct DDS_DomainParticipant {
+    DDS_Entity entity;
+    int domain;
+    int deleted;
+    DDS_Subscriber *builtin_subscriber;
+    struct DDS_DomainParticipant *next;
+};
+
+typedef struct DDS_DomainParticipantFactory { int dummy; } DDS_DomainParticipantFactory;
+
+static DDS_DomainParticipantFactory g_factory;
+static DDS_DomainParticipant *g_participants;
+static DDS_DataReader *g_readers;
+static DDS_DataWriter *g_writers;
+
+char DDS_PARTICIPANT_QOS_DEFAULT[64];
+char DDS_PUBLISHER_QOS_DEFAULT[64];
+char DDS_SUBSCRIBER_QOS_DEFAULT[64];
+char DDS_TOPIC_QOS_DEFAULT[64];
+char DDS_DATAREADER_QOS_DEFAULT[64];
+char DDS_DATAWRITER_QOS_DEFAULT[64];
+DDS_UnsignedLong DDS_ANY_SAMPLE_STATE = 0xffff;
+DDS_UnsignedLong DDS_ANY_VIEW_STATE = 0xffff;
+DDS_UnsignedLong DDS_ANY_INSTANCE_STATE = 0xffff;
+DDS_UnsignedLong DDS_STATUS_MASK_ALL = 0xffffffff;
+DDS_UnsignedLong DDS_STATUS_MASK_NONE = 0;
+
+static void entity_init(DDS_Entity *e, int kind)
+{
+    e->kind = kind;
+    e->condition = xcalloc(1, sizeof(DDS_StatusCondition));
+    e->condition->entity = e;
+}
+
+DDS_DomainParticipantFactory *DDS_DomainParticipantFactory_get_instance(void)
+{
+    return &g_factory;
+}
+
+DDS_ReturnCode_t DDS_DomainParticipantFactory_set_default_participant_qos_with_profile(
+    DDS_DomainParticipantFactory *f, const char *lib, const char *profile)
+{
+    (void)f; (void)lib; (void)profile;
+    return RC_OK;
+}
+
+static DDS_DataReader *reader_new(DDS_Subscriber *sub, DDS_TopicDescription *td, const char *topic_name)
+{
+    DDS_DataReader *r = xcalloc(1, sizeof(*r));
+    entity_init(&r->entity, E_READER);
+    r->subscriber = sub;
+    r->td = td;
+    r->topic_name = xstrdup(topic_name);
+    r->domain = sub->participant->domain;
+    return r;
+}
+
+DDS_DomainParticipant *DDS_DomainParticipantFactory_create_participant(
+    DDS_DomainParticipantFactory *f, int domain, void *qos, void *listener, DDS_UnsignedLong mask)
+{
+    DDS_DomainParticipant *p = xcalloc(1, sizeof(*p));
+    DDS_DataWriter *w;
+    (void)f; (void)qos; (void)listener; (void)mask;
+    entity_init(&p->entity, E_PARTICIPANT);
+    p->domain = domain;
+    p->builtin_subscriber = xcalloc(1, sizeof(DDS_Subscriber));
+    entity_init(&p->builtin_subscriber->entity, E_SUBSCRIBER);
+    p->builtin_subscriber->participant = p;
+    p->builtin_subscriber->builtin_publication_reader =
+        reader_new(p->builtin_subscriber, NULL, "DCPSPublication");
+    p->builtin_subscriber->builtin_publication_reader->builtin = 1;
+
+    pthread_mutex_lock(&g_lock);
+    p->next = g_participants;
+    g_participants = p;
+    /* announce the writers that already exist */
+    for (w = g_writers; w; w = w->next) {
+        if (w->domain == domain) {
+            DDS_DataReader *br = p->builtin_subscriber->builtin_publication_reader;
+            Sample *s = xcalloc(1, sizeof(Sample));
+            DDS_PublicationBuiltinTopicData *pd = xcalloc(1, sizeof(*pd));
+            pd->topic_name = xstrdup(w->topic->as_topicdescription->name);
+            pd->type_name = xstrdup(w->topic->as_topicdescription->type_name);
+            s->data = (Value *)pd;
+            s->info.sample_state = NOT_READ_SAMPLE_STATE;
+            s->info.view_state = NEW_VIEW_STATE;
+            s->info.instance_state = ALIVE_INSTANCE_STATE;
+            s->info.valid_data = 1;
+            if (br->tail) br->tail->next = s; else br->head = s;
+            br->tail = s;
+            br->depth++;
+            br->entity.status |= DATA_AVAILABLE_STATUS;
+        }
+    }
+    pthread_mutex_unlock(&g_lock);
+    return p;
+}
+
+DDS_DomainParticipant *DDS_DomainParticipantFactory_create_participant_with_profile(
+    DDS_DomainParticipantFactory *f, int domain, const char *lib, const char *profile,
+    void *listener, DDS_UnsignedLong mask)
+{
+    (void)lib; (void)profile;
+    return DDS_DomainParticipantFactory_create_participant(f, domain, NULL, listener, mask);
+}
+
+static void reader_clear(DDS_DataReader *r)
+{
+    Sample *s, *sn;
+    Instance *i, *in;
+    for (s = r->head; s; s = sn) {
+        sn = s->next;
+        if (r->builtin) {
+            DDS_PublicationBuiltinTopicData *pd = (DDS_PublicationBuiltinTopicData *)s->data;
+            free(pd->topic_name);
+            free(pd->type_name);
+            free(pd);
+        } else {
+            value_free(s->data);
+        }
+        free(s);
+    }
+    for (i = r->instances; i; i = in) {
+        in = i->next;
+        value_free(i->key);
+        free(i);
+    }
+    r->head = r->tail = NULL;
+    r->instances = NULL;
+    r->depth = 0;
+}
+
+static DDS_DataReader *unlink_reader(DDS_DataReader *r)
+{
+    DDS_DataReader **pp;
+    for (pp = &g_readers; *pp; pp = &(*pp)->next) {
+        if (*pp == r) {
+            *pp = r->next;
+            return r;
+        }
+    }
+    return NULL;
+}
+
+static DDS_DataWriter *unlink_writer(DDS_DataWriter *w)
+{
+    DDS_DataWriter **pp;
+    for (pp = &g_writers; *pp; pp = &(*pp)->next) {
+        if (*pp == w) {
+            *pp = w->next;
+            return w;
+        }
+    }
+    return NULL;
+}
+
+DDS_ReturnCode_t DDS_DomainParticipant_delete_contained_entities(DDS_DomainParticipant *p)
+{
+    DDS_DataReader *r, *rn;
+    DDS_DataWriter *w, *wn;
+    pthread_mutex_lock(&g_lock);
+    for (r = g_readers; r; r = rn) {
+        rn = r->next;
+        if (r->subscriber->participant == p) {
+            unlink_reader(r);
+            reader_clear(r);
+        }
+    }
+    for (w = g_writers; w; w = wn) {
+        wn = w->next;
+        if (w->publisher->participant == p)
+            unlink_writer(w);
+    }
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DomainParticipantFactory_delete_participant(DDS_DomainParticipantFactory *f,
+                                                                 DDS_DomainParticipant *p)
+{
+    DDS_DomainParticipant **pp;
+    DDS_DataReader *r;
+    DDS_DataWriter *w;
+    (void)f;
+    pthread_mutex_lock(&g_lock);
+    for (r = g_readers; r; r = r->next)
+        if (r->subscriber->participant == p) {
+            pthread_mutex_unlock(&g_lock);
+            return RC_PRECONDITION_NOT_MET;
+        }
+    for (w = g_writers; w; w = w->next)
+        if (w->publisher->participant == p) {
+            pthread_mutex_unlock(&g_lock);
+            return RC_PRECONDITION_NOT_MET;
+        }
+    for (pp = &g_participants; *pp; pp = &(*pp)->next) {
+        if (*pp == p) {
+            *pp = p->next;
+            break;
+        }
+    }
+    p->deleted = 1;
+    pthread_cond_broadcast(&g_changed);
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DomainParticipant_set_default_library(void *p, const char *lib)
+{
+    (void)p; (void)lib;
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DomainParticipant_set_default_profile(void *p, const char *lib, const char *profile)
+{
+    (void)p; (void)lib; (void)profile;
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_Entity_enable(DDS_Entity *e)
+{
+    (void)e;
+    return RC_OK;
+}
+
+DDS_Publisher *DDS_DomainParticipant_create_publisher(DDS_DomainParticipant *p, void *qos, void *l,
+                                                     DDS_UnsignedLong mask)
+{
+    DDS_Publisher *pub = xcalloc(1, sizeof(*pub));
+    (void)qos; (void)l; (void)mask;
+    entity_init(&pub->entity, E_PUBLISHER);
+    pub->participant = p;
+    return pub;
+}
+
+DDS_Publisher *DDS_DomainParticipant_create_publisher_with_profile(DDS_DomainParticipant *p, const char *lib,
+                                                                  const char *profile, void *l,
+                                                                  DDS_UnsignedLong mask)
+{
+    (void)lib; (void)profile;
+    return DDS_DomainParticipant_create_publisher(p, NULL, l, mask);
+}
+
+DDS_ReturnCode_t DDS_DomainParticipant_delete_publisher(DDS_DomainParticipant *p, DDS_Publisher *pub)
+{
+    DDS_DataWriter *w;
+    (void)p;
+    pthread_mutex_lock(&g_lock);
+    for (w = g_writers; w; w = w->next)
+        if (w->publisher == pub) {
+            pthread_mutex_unlock(&g_lock);
+            return RC_PRECONDITION_NOT_MET;
+        }
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_Subscriber *DDS_DomainParticipant_create_subscriber(DDS_DomainParticipant *p, void *qos, void *l,
+                                                       DDS_UnsignedLong mask)
+{
+    DDS_Subscriber *sub = xcalloc(1, sizeof(*sub));
+    (void)qos; (void)l; (void)mask;
+    entity_init(&sub->entity, E_SUBSCRIBER);
+    sub->participant = p;
+    return sub;
+}
+
+DDS_Subscriber *DDS_DomainParticipant_create_subscriber_with_profile(DDS_DomainParticipant *p, const char *lib,
+                                                                    const char *profile, void *l,
+                                                                    DDS_UnsignedLong mask)
+{
+    (void)lib; (void)profile;
+    return DDS_DomainParticipant_create_subscriber(p, NULL, l, mask);
+}
+
+DDS_ReturnCode_t DDS_DomainParticipant_delete_subscriber(DDS_DomainParticipant *p, DDS_Subscriber *sub)
+{
+    DDS_DataReader *r;
+    (void)p;
+    pthread_mutex_lock(&g_lock);
+    for (r = g_readers; r; r = r->next)
+        if (r->subscriber == sub) {
+            pthread_mutex_unlock(&g_lock);
+            return RC_PRECONDITION_NOT_MET;
+        }
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_Subscriber *DDS_DomainParticipant_get_builtin_subscriber(DDS_DomainParticipant *p)
+{
+    return p->builtin_subscriber;
+}
+
+DDS_DataReader *DDS_Subscriber_lookup_datareader(DDS_Subscriber *sub, const char *name)
+{
+    if (sub->builtin_publication_reader && strcmp(name, "DCPSPublication") == 0)
+        return sub->builtin_publication_reader;
+    return NULL;
+}
+
+DDS_Topic *DDS_DomainParticipant_create_topic(DDS_DomainParticipant *p, const char *name, const char *type_name,
+                                             void *qos, void *l, DDS_UnsignedLong mask)
+{
+    DDS_Topic *t = xcalloc(1, sizeof(*t));
+    DDS_TopicDescription *td = xcalloc(1, sizeof(*td));
+    (void)qos; (void)l; (void)mask;
+    entity_init(&t->entity, E_TOPIC);
+    t->as_entity = &t->entity;
+    t->as_topicdescription = td;
+    td->name = xstrdup(name);
+    td->type_name = xstrdup(type_name);
+    td->topic = t;
+    td->participant = p;
+    return t;
+}
+
+DDS_ReturnCode_t DDS_DomainParticipant_delete_topic(DDS_DomainParticipant *p, DDS_Topic *t)
+{
+    (void)p; (void)t;
+    return RC_OK;
+}
+
+static void cft_set_params(DDS_ContentFilteredTopic *cft, Seq *params)
+{
+    int i;
+    for (i = 0; i < cft->nparams; i++)
+        free(cft->params[i]);
+    free(cft->params);
+    cft->params = NULL;
+    cft->nparams = 0;
+    if (params && params->_length) {
+        char **src = (char **)params->_contiguous_buffer;
+        cft->nparams = (int)params->_length;
+        cft->params = xcalloc(cft->nparams, sizeof(char *));
+        for (i = 0; i < cft->nparams; i++)
+            cft->params[i] = xstrdup(src[i]);
+    }
+}
+
+DDS_ContentFilteredTopic *DDS_DomainParticipant_create_contentfilteredtopic(
+    DDS_DomainParticipant *p, const char *name, DDS_Topic *related, const char *expression, Seq *params)
+{
+    DDS_ContentFilteredTopic *cft = xcalloc(1, sizeof(*cft));
+    DDS_TopicDescription *td = xcalloc(1, sizeof(*td));
+    cft->as_topicdescription = td;
+    cft->expression = xstrdup(expression);
+    cft->related = related;
+    cft_set_params(cft, params);
+    td->name = xstrdup(name);
+    td->type_name = xstrdup(related->as_topicdescription->type_name);
+    td->topic = related;
+    td->cft = cft;
+    td->participant = p;
+    return cft;
+}
+
+DDS_ReturnCode_t DDS_DomainParticipant_delete_contentfilteredtopic(DDS_DomainParticipant *p,
+                                                                   DDS_ContentFilteredTopic *cft)
+{
+    (void)p; (void)cft;
+    return RC_OK;
+}
+
+/* RTI accepts at most 100 filter expression parameters. */
+#define MAX_FILTER_PARAMETERS 100
+
+DDS_ReturnCode_t DDS_ContentFilteredTopic_set_expression_parameters(DDS_ContentFilteredTopic *cft, Seq *params)
+{
+    if (params && params->_length > MAX_FILTER_PARAMETERS)
+        return RC_BAD_PARAMETER;
+    pthread_mutex_lock(&g_lock);
+    cft_set_params(cft, params);
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_ContentFilteredTopic_get_expression_parameters(DDS_ContentFilteredTopic *cft, Seq *params)
+{
+    (void)cft; (void)params;
+    return RC_UNSUPPORTED;
+}
+
+const char *stub_cft_parameter(DDS_ContentFilteredTopic *cft, int i)
+{
+    return i < cft->nparams ? cft->params[i] : NULL;
+}
+
+const char *DDS_ContentFilteredTopic_get_filter_expression(DDS_ContentFilteredTopic *cft)
+{
+    return cft->expression;
+}
+
+DDS_ReturnCode_t DDS_DomainParticipant_get_discovered_topics(DDS_DomainParticipant *p, Seq *handles)
+{
+    (void)p;
+    handles->_length = 0;
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DomainParticipant_get_discovered_topic_data(DDS_DomainParticipant *p, void *data, void *handle)
+{
+    (void)p; (void)data; (void)handle;
+    return RC_UNSUPPORTED;
+}
+
+void *DDS_TopicBuiltinTopicDataDataReader_narrow(void *r) { return r; }
+void *DDS_ParticipantBuiltinTopicDataDataReader_narrow(void *r) { return r; }
+void *DDS_SubscriptionBuiltinTopicDataDataReader_narrow(void *r) { return r; }
+void *DDS_PublicationBuiltinTopicDataDataReader_narrow(void *r) { return r; }
+
+DDS_ReturnCode_t DDS_TopicBuiltinTopicDataDataReader_get_key_value(void *r, void *data, void *handle)
+{
+    (void)r; (void)data; (void)handle;
+    return RC_UNSUPPORTED;
+}
+
+DDS_TopicBuiltinTopicData DDS_TopicBuiltinTopicDataTypeSupport_create_data(void)
+{
+    DDS_TopicBuiltinTopicData d;
+    memset(&d, 0, sizeof(d));
+    return d;
+}
+
+/* ------------------------------------------------------------------------ */
+/* sequences                                                                */
+
+#define SEQ_FUNCS(NAME, ELEM, REF)                                                    \
+DDS_Boolean DDS_##NAME##_initialize(Seq *s)                                           \
+{                                                                                     \
+    memset(s, 0, sizeof(*s));                                                         \
+    s->_owned = 1;                                                                    \
+    return 1;                                                                         \
+}                                                                                     \
+DDS_Boolean DDS_##NAME##_finalize(Seq *s)                                             \
+{                                                                                     \
+    if (s->_read_token1)                                                              \
+        return 0;                                                                     \
+    if (s->_owned && s->_contiguous_buffer)                                           \
+        free(s->_contiguous_buffer);                                                  \
+    memset(s, 0, sizeof(*s));                                                         \
+    return 1;                                                                         \
+}                                                                                     \
+DDS_Long DDS_##NAME##_get_length(Seq *s)                                              \
+{                                                                                     \
+    return (DDS_Long)s->_length;                                                      \
+}                                                                                     \
+ELEM *DDS_##NAME##_get_reference(Seq *s, DDS_Long i)                                  \
+{                                                                                     \
+    if (i < 0 || (unsigned long)i >= s->_length)                                      \
+        return NULL;                                                                  \
+    return REF;                                                                       \
+}
+
+SEQ_FUNCS(DynamicDataSeq, DDS_DynamicData, ((DDS_DynamicData **)s->_contiguous_buffer)[i])
+SEQ_FUNCS(SampleInfoSeq, DDS_SampleInfo, &((DDS_SampleInfo *)s->_contiguous_buffer)[i])
+SEQ_FUNCS(InstanceHandleSeq, DDS_InstanceHandle_t, &((DDS_InstanceHandle_t *)s->_contiguous_buffer)[i])
+SEQ_FUNCS(PublicationBuiltinTopicDataSeq, DDS_PublicationBuiltinTopicData,
+          &((DDS_PublicationBuiltinTopicData *)s->_contiguous_buffer)[i])
+SEQ_FUNCS(ConditionSeq, DDS_Condition, ((DDS_Condition **)s->_contiguous_buffer)[i])
+
+DDS_Boolean DDS_StringSeq_initialize(Seq *s)
+{
+    memset(s, 0, sizeof(*s));
+    s->_owned = 1;
+    return 1;
+}
+
+DDS_Boolean DDS_StringSeq_finalize(Seq *s)
+{
+    unsigned long i;
+    if (s->_contiguous_buffer) {
+        COUNT(CNT_STRING_SEQ_FREE);
+        for (i = 0; i < s->_length; i++)
+            free(((char **)s->_contiguous_buffer)[i]);
+        free(s->_contiguous_buffer);
+    }
+    memset(s, 0, sizeof(*s));
+    return 1;
+}
+
+DDS_Boolean DDS_StringSeq_from_array(Seq *s, const char **array, DDS_Long length)
+{
+    DDS_Long i;
+    char **buf;
+    DDS_StringSeq_finalize(s);
+    s->_owned = 1;
+    COUNT(CNT_STRING_SEQ_ALLOC);
+    buf = xcalloc(length, sizeof(char *));
+    for (i = 0; i < length; i++)
+        buf[i] = xstrdup(array[i]);
+    s->_contiguous_buffer = buf;
+    s->_length = s->_maximum = length;
+    return 1;
+}
+
+DDS_Long DDS_StringSeq_get_length(Seq *s)
+{
+    return (DDS_Long)s->_length;
+}
+
+/* ------------------------------------------------------------------------ */
+/* readers and writers                                                      */
+
+/* A status listener call, collected with g_lock held and made after it is
+ * released (as for on_data_available). The status is copied, and its change
+ * counts reset, when the call is collected. */
+typedef struct {
+    status_cb cb;
+    void *listener_data;
+    void *entity;
+    union {
+        DDS_SubscriptionMatchedStatus subscription_matched;
+        DDS_PublicationMatchedStatus publication_matched;
+        DDS_SampleLostStatus sample_lost;
+    } status;
+} StatusNotify;
+
+#define MAX_STATUS_NOTIFY 256
+
+static int reader_matched_notify(DDS_DataReader *r, StatusNotify *n)
+{
+    if (!r->has_listener || !(r->mask & SUBSCRIPTION_MATCHED_STATUS) || !r->listener.on_subscription_matched)
+        return 0;
+    n->cb = r->listener.on_subscription_matched;
+    n->listener_data = r->listener.as_listener.listener_data;
+    n->entity = r;
+    n->status.subscription_matched = r->matched;
+    r->matched.total_count_change = 0;
+    r->matched.current_count_change = 0;
+    return 1;
+}
+
+static int writer_matched_notify(DDS_DataWriter *w, StatusNotify *n)
+{
+    if (!w->has_listener || !(w->mask & PUBLICATION_MATCHED_STATUS) || !w->listener.on_publication_matched)
+        return 0;
+    n->cb = w->listener.on_publication_matched;
+    n->listener_data = w->listener.as_listener.listener_data;
+    n->entity = w;
+    n->status.publication_matched = w->matched;
+    w->matched.total_count_change = 0;
+    w->matched.current_count_change = 0;
+    return 1;
+}
+
+static void status_notify(StatusNotify *notify, int n)
+{
+    int i;
+    for (i = 0; i < n; i++)
+        notify[i].cb(notify[i].listener_data, notify[i].entity, &notify[i].status);
+}
+
+/* Matches (delta 1) or unmatches (delta -1) a reader and a writer. */
+static void match(DDS_DataReader *r, DDS_DataWriter *w, int delta)
+{
+    if (delta > 0) {
+        r->matched.total_count++;
+        r->matched.total_count_change++;
+        w->matched.total_count++;
+        w->matched.total_count_change++;
+    }
+    r->matched.current_count += delta;
+    r->matched.current_count_change += delta;
+    if (r->matched.current_count > r->matched.current_count_peak)
+        r->matched.current_count_peak = r->matched.current_count;
+    w->matched.current_count += delta;
+    w->matched.current_count_change += delta;
+    if (w->matched.current_count > w->matched.current_count_peak)
+        w->matched.current_count_peak = w->matched.current_count;
+}
+
+static int matches(DDS_DataReader *r, DDS_DataWriter *w)
+{
+    return !r->builtin && r->domain == w->domain &&
+           strcmp(r->topic_name, w->topic->as_topicdescription->name) == 0;
+}
+
+/* Test hook: the reader loses `count` samples, as if its resource limits had
+ * been exceeded. */
+void stub_reader_lose_samples(DDS_DataReader *r, int count)
+{
+    StatusNotify notify;
+    int n = 0;
+    pthread_mutex_lock(&g_lock);
+    r->lost.total_count += count;
+    r->lost.total_count_change += count;
+    if (r->has_listener && (r->mask & SAMPLE_LOST_STATUS) && r->listener.on_sample_lost) {
+        notify.cb = r->listener.on_sample_lost;
+        notify.listener_data = r->listener.as_listener.listener_data;
+        notify.entity = r;
+        notify.status.sample_lost = r->lost;
+        r->lost.total_count_change = 0;
+        n = 1;
+    }
+    pthread_mutex_unlock(&g_lock);
+    status_notify(&notify, n);
+}
+
+DDS_DataWriter *DDS_Publisher_create_datawriter(DDS_Publisher *pub, DDS_Topic *topic, void *qos,
+                                               DDS_DataWriterListener *l, DDS_UnsignedLong mask)
+{
+    DDS_DataWriter *w = xcalloc(1, sizeof(*w));
+    DDS_DomainParticipant *p;
+    DDS_DataReader *r;
+    StatusNotify notify[MAX_STATUS_NOTIFY];
+    int n = 0, matched = 0;
+    (void)qos;
+    COUNT(CNT_CREATE_WRITER);
+    entity_init(&w->entity, E_WRITER);
+    w->publisher = pub;
+    w->topic = topic;
+    w->domain = pub->participant->domain;
+    if (l) {
+        w->listener = *l;
+        w->has_listener = 1;
+        w->mask = mask;
+    }
+
+    pthread_mutex_lock(&g_lock);
+    w->next = g_writers;
+    g_writers = w;
+    for (r = g_readers; r; r = r->next) {
+        if (matches(r, w)) {
+            match(r, w, 1);
+            matched = 1;
+            if (n < MAX_STATUS_NOTIFY - 1)
+                n += reader_matched_notify(r, &notify[n]);
+        }
+    }
+    if (matched)
+        n += writer_matched_notify(w, &notify[n]);
+    for (p = g_participants; p; p = p->next) {
+        if (p->domain == w->domain && p != pub->participant) {
+            DDS_DataReader *br = p->builtin_subscriber->builtin_publication_reader;
+            Sample *s = xcalloc(1, sizeof(Sample));
+            DDS_PublicationBuiltinTopicData *pd = xcalloc(1, sizeof(*pd));
+            pd->topic_name = xstrdup(topic->as_topicdescription->name);
+            pd->type_name = xstrdup(topic->as_topicdescription->type_name);
+            s->data = (Value *)pd;
+            s->info.sample_state = NOT_READ_SAMPLE_STATE;
+            s->info.view_state = NEW_VIEW_STATE;
+            s->info.instance_state = ALIVE_INSTANCE_STATE;
+            s->info.valid_data = 1;
+            if (br->tail) br->tail->next = s; else br->head = s;
+            br->tail = s;
+            br->depth++;
+            br->entity.status |= DATA_AVAILABLE_STATUS;
+        }
+    }
+    pthread_cond_broadcast(&g_changed);
+    pthread_mutex_unlock(&g_lock);
+    status_notify(notify, n);
+    return w;
+}
+
+DDS_DataWriter *DDS_Publisher_create_datawriter_with_profile(DDS_Publisher *pub, DDS_Topic *topic,
+                                                            const char *lib, const char *profile,
+                                                            DDS_DataWriterListener *l, DDS_UnsignedLong mask)
+{
+    DDS_DataWriter *w = DDS_Publisher_create_datawriter(pub, topic, NULL, l, mask);
+    char buf[512];
+    snprintf(buf, sizeof(buf), "%s::%s", lib ? lib : "", profile ? profile : "");
+    w->profile = xstrdup(buf);
+    return w;
+}
+
+const char *stub_entity_profile(DDS_Entity *e)
+{
+    if (e->kind == E_READER)
+        return ((DDS_DataReader *)e)->profile;
+    if (e->kind == E_WRITER)
+        return ((DDS_DataWriter *)e)->profile;
+    return NULL;
+}
+
+DDS_ReturnCode_t DDS_Publisher_delete_datawriter(DDS_Publisher *pub, DDS_DataWriter *w)
+{
+    DDS_DataReader *r;
+    StatusNotify notify[MAX_STATUS_NOTIFY];
+    int n = 0;
+    (void)pub;
+    pthread_mutex_lock(&g_lock);
+    unlink_writer(w);
+    for (r = g_readers; r; r = r->next) {
+        if (matches(r, w)) {
+            match(r, w, -1);
+            if (n < MAX_STATUS_NOTIFY)
+                n += reader_matched_notify(r, &notify[n]);
+        }
+    }
+    pthread_mutex_unlock(&g_lock);
+    status_notify(notify, n);
+    return RC_OK;
+}
+
+DDS_DataReader *DDS_Subscriber_create_datareader(DDS_Subscriber *sub, DDS_TopicDescription *td, void *qos,
+                                                DDS_DataReaderListener *l, DDS_UnsignedLong mask)
+{
+    DDS_DataReader *r = reader_new(sub, td, td->topic->as_topicdescription->name);
+    DDS_DataWriter *w;
+    StatusNotify notify[MAX_STATUS_NOTIFY];
+    int n = 0, matched = 0;
+    (void)qos;
+    COUNT(CNT_CREATE_READER);
+    if (l) {
+        r->listener = *l;
+        r->has_listener = 1;
+        r->mask = mask;
+    }
+    pthread_mutex_lock(&g_lock);
+    r->next = g_readers;
+    g_readers = r;
+    for (w = g_writers; w; w = w->next) {
+        if (matches(r, w)) {
+            match(r, w, 1);
+            matched = 1;
+            if (n < MAX_STATUS_NOTIFY - 1)
+                n += writer_matched_notify(w, &notify[n]);
+        }
+    }
+    if (matched)
+        n += reader_matched_notify(r, &notify[n]);
+    pthread_mutex_unlock(&g_lock);
+    status_notify(notify, n);
+    return r;
+}
+
+DDS_DataReader *DDS_Subscriber_create_datareader_with_profile(DDS_Subscriber *sub, DDS_TopicDescription *td,
+                                                             const char *lib, const char *profile,
+                                                             DDS_DataReaderListener *l, DDS_UnsignedLong mask)
+{
+    DDS_DataReader *r = DDS_Subscriber_create_datareader(sub, td, NULL, l, mask);
+    char buf[512];
+    snprintf(buf, sizeof(buf), "%s::%s", lib ? lib : "", profile ? profile : "");
+    r->profile = xstrdup(buf);
+    return r;
+}
+
+DDS_ReturnCode_t DDS_Subscriber_delete_datareader(DDS_Subscriber *sub, DDS_DataReader *r)
+{
+    DDS_DataWriter *w;
+    StatusNotify notify[MAX_STATUS_NOTIFY];
+    int n = 0;
+    (void)sub;
+    pthread_mutex_lock(&g_lock);
+    unlink_reader(r);
+    reader_clear(r);
+    for (w = g_writers; w; w = w->next) {
+        if (matches(r, w)) {
+            match(r, w, -1);
+            if (n < MAX_STATUS_NOTIFY)
+                n += writer_matched_notify(w, &notify[n]);
+        }
+    }
+    pthread_mutex_unlock(&g_lock);
+    status_notify(notify, n);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DataReader_set_listener(DDS_DataReader *r, DDS_DataReaderListener *l, DDS_UnsignedLong mask)
+{
+    pthread_mutex_lock(&g_lock);
+    if (l) {
+        r->listener = *l;
+        r->has_listener = 1;
+    } else {
+        memset(&r->listener, 0, sizeof(r->listener));
+        r->has_listener = 0;
+    }
+    r->mask = mask;
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DataWriter_set_listener(DDS_DataWriter *w, DDS_DataWriterListener *l, DDS_UnsignedLong mask)
+{
+    pthread_mutex_lock(&g_lock);
+    if (l) {
+        w->listener = *l;
+        w->has_listener = 1;
+    } else {
+        memset(&w->listener, 0, sizeof(w->listener));
+        w->has_listener = 0;
+    }
+    w->mask = mask;
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DataReader_get_subscription_matched_status(DDS_DataReader *r,
+                                                                DDS_SubscriptionMatchedStatus *status)
+{
+    pthread_mutex_lock(&g_lock);
+    *status = r->matched;
+    r->matched.total_count_change = 0;
+    r->matched.current_count_change = 0;
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DataReader_get_sample_lost_status(DDS_DataReader *r, DDS_SampleLostStatus *status)
+{
+    pthread_mutex_lock(&g_lock);
+    *status = r->lost;
+    r->lost.total_count_change = 0;
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DataWriter_get_publication_matched_status(DDS_DataWriter *w,
+                                                               DDS_PublicationMatchedStatus *status)
+{
+    pthread_mutex_lock(&g_lock);
+    *status = w->matched;
+    w->matched.total_count_change = 0;
+    w->matched.current_count_change = 0;
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+void *DDS_DynamicDataWriter_narrow(void *w) { return w; }
+void *DDS_DynamicDataReader_narrow(void *r) { return r; }
+
+static Instance *find_instance(Instance *list, const DDS_InstanceHandle_t *h)
+{
+    for (; list; list = list->next)
+        if (memcmp(list->handle.keyHash_value, h->keyHash_value, 16) == 0)
+            return list;
+    return NULL;
+}
+
+typedef struct {
+    DDS_DataReader *reader;
+    data_cb cb;
+    void *listener_data;
+} Notify;
+
+/* Deliver a sample from writer `w`; must be called with g_lock held. Listener
+ * invocations are collected in `notify` and made after the lock is released. */
+static int deliver(DDS_DataWriter *w, const Value *data, const DDS_InstanceHandle_t *handle, int state,
+                   Notify *notify, int max_notify)
+{
+    DDS_DataReader *r;
+    DDS_Time_t stamp;
+    int n = 0;
+    now(&stamp);
+    for (r = g_readers; r; r = r->next) {
+        Sample *s;
+        Instance *inst;
+        if (r->builtin || r->domain != w->domain ||
+            strcmp(r->topic_name, w->topic->as_topicdescription->name) != 0)
+            continue;
+        inst = find_instance(r->instances, handle);
+        if (!inst) {
+            inst = xcalloc(1, sizeof(Instance));
+            inst->handle = *handle;
+            inst->key = value_copy(data);
+            inst->next = r->instances;
+            r->instances = inst;
+            r->ninstances++;
+        }
+        inst->state = state;
+        s = xcalloc(1, sizeof(Sample));
+        s->data = state == ALIVE_INSTANCE_STATE ? value_copy(data) : value_new(data->tc);
+        if (state != ALIVE_INSTANCE_STATE)
+            copy_keys(s->data, data);
+        s->info.sample_state = NOT_READ_SAMPLE_STATE;
+        s->info.view_state = NEW_VIEW_STATE;
+        s->info.instance_state = state;
+        s->info.source_timestamp = stamp;
+        s->info.instance_handle = *handle;
+        s->info.valid_data = state == ALIVE_INSTANCE_STATE;
+        now(&s->info.reception_timestamp);
+        if (r->tail) r->tail->next = s; else r->head = s;
+        r->tail = s;
+        r->depth++;
+        r->entity.status |= DATA_AVAILABLE_STATUS;
+        if (r->has_listener && (r->mask & DATA_AVAILABLE_STATUS) && r->listener.on_data_available &&
+            n < max_notify) {
+            notify[n].reader = r;
+            notify[n].cb = r->listener.on_data_available;
+            notify[n].listener_data = r->listener.as_listener.listener_data;
+            n++;
+        }
+    }
+    pthread_cond_broadcast(&g_changed);
+    return n;
+}
+
+#define MAX_NOTIFY 256
+
+static DDS_ReturnCode_t write_common(DDS_DataWriter *w, DDS_DynamicData *dd, DDS_InstanceHandle_t *handle,
+                                     int state)
+{
+    Notify notify[MAX_NOTIFY];
+    DDS_InstanceHandle_t h;
+    int n, i;
+    if (!dd->root || dd->root->tc->kind != TK_STRUCT)
+        return RC_BAD_PARAMETER;
+    if (handle && handle->isValid) {
+        pthread_mutex_lock(&g_lock);
+        if (!find_instance(w->registered, handle)) {
+            pthread_mutex_unlock(&g_lock);
+            return RC_BAD_PARAMETER;
+        }
+        pthread_mutex_unlock(&g_lock);
+        h = *handle;
+    } else {
+        key_handle(dd->root, &h);
+    }
+    COUNT(CNT_WRITE);
+    pthread_mutex_lock(&g_lock);
+    n = deliver(w, dd->root, &h, state, notify, MAX_NOTIFY);
+    pthread_mutex_unlock(&g_lock);
+    for (i = 0; i < n; i++)
+        notify[i].cb(notify[i].listener_data, notify[i].reader);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DynamicDataWriter_write(DDS_DataWriter *w, DDS_DynamicData *dd, DDS_InstanceHandle_t *handle)
+{
+    return write_common(w, dd, handle, ALIVE_INSTANCE_STATE);
+}
+
+DDS_ReturnCode_t DDS_DynamicDataWriter_dispose(DDS_DataWriter *w, DDS_DynamicData *dd, DDS_InstanceHandle_t *handle)
+{
+    return write_common(w, dd, handle, NOT_ALIVE_DISPOSED_INSTANCE_STATE);
+}
+
+DDS_InstanceHandle_t DDS_DynamicDataWriter_register_instance(DDS_DataWriter *w, DDS_DynamicData *dd)
+{
+    DDS_InstanceHandle_t h;
+    memset(&h, 0, sizeof(h));
+    if (!dd->root || dd->root->tc->kind != TK_STRUCT)
+        return h;
+    key_handle(dd->root, &h);
+    pthread_mutex_lock(&g_lock);
+    if (!find_instance(w->registered, &h)) {
+        Instance *inst = xcalloc(1, sizeof(Instance));
+        inst->handle = h;
+        inst->key = value_copy(dd->root);
+        inst->state = ALIVE_INSTANCE_STATE;
+        inst->next = w->registered;
+        w->registered = inst;
+    }
+    pthread_mutex_unlock(&g_lock);
+    return h;
+}
+
+DDS_ReturnCode_t DDS_DynamicDataWriter_unregister_instance(DDS_DataWriter *w, DDS_DynamicData *dd,
+                                                          DDS_InstanceHandle_t *handle)
+{
+    Instance **pp;
+    DDS_InstanceHandle_t h;
+    (void)dd;
+    if (handle && handle->isValid)
+        h = *handle;
+    else if (dd && dd->root)
+        key_handle(dd->root, &h);
+    else
+        return RC_BAD_PARAMETER;
+    pthread_mutex_lock(&g_lock);
+    for (pp = &w->registered; *pp; pp = &(*pp)->next) {
+        if (memcmp((*pp)->handle.keyHash_value, h.keyHash_value, 16) == 0) {
+            Instance *inst = *pp;
+            *pp = inst->next;
+            value_free(inst->key);
+            free(inst);
+            pthread_mutex_unlock(&g_lock);
+            return RC_OK;
+        }
+    }
+    pthread_mutex_unlock(&g_lock);
+    return RC_BAD_PARAMETER;
+}
+
+DDS_ReturnCode_t DDS_DynamicDataReader_get_key_value(DDS_DataReader *r, DDS_DynamicData *dd,
+                                                     DDS_InstanceHandle_t *handle)
+{
+    Instance *inst;
+    pthread_mutex_lock(&g_lock);
+    inst = find_instance(r->instances, handle);
+    if (!inst || !dd->root) {
+        pthread_mutex_unlock(&g_lock);
+        return RC_BAD_PARAMETER;
+    }
+    copy_keys(dd->root, inst->key);
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+static int sample_matches(const Sample *s, DDS_UnsignedLong smask, DDS_UnsignedLong vmask, DDS_UnsignedLong imask)
+{
+    int sstate = s->read ? READ_SAMPLE_STATE : NOT_READ_SAMPLE_STATE;
+    (void)vmask;
+    return (sstate & smask) && (s->info.instance_state & imask);
+}
+
+typedef struct Loan {
+    int n;
+    int builtin;
+} Loan;
+
+static DDS_ReturnCode_t take_or_read(DDS_DataReader *r, Seq *data, Seq *infos, DDS_Long max,
+                                     DDS_UnsignedLong smask, DDS_UnsignedLong vmask, DDS_UnsignedLong imask,
+                                     int take)
+{
+    Sample **prev, *s;
+    int n = 0, cap;
+    Loan *loan;
+    DDS_SampleInfo *info_buf;
+    void *data_buf;
+
+    if (data->_read_token1 || infos->_read_token1)
+        return RC_PRECONDITION_NOT_MET;
+    COUNT(CNT_TAKE);
+    pthread_mutex_lock(&g_lock);
+    cap = r->depth ? r->depth : 1;
+    if (max >= 0 && max < cap)
+        cap = max ? max : 1;
+    info_buf = xcalloc(cap, sizeof(DDS_SampleInfo));
+    data_buf = r->builtin ? xcalloc(cap, sizeof(DDS_PublicationBuiltinTopicData))
+                          : xcalloc(cap, sizeof(DDS_DynamicData *));
+
+    prev = &r->head;
+    r->tail = NULL;
+    for (s = r->head; s && n < cap; ) {
+        if (!sample_matches(s, smask, vmask, imask)) {
+            r->tail = s;
+            prev = &s->next;
+            s = s->next;
+            continue;
+        }
+        info_buf[n] = s->info;
+        info_buf[n].sample_state = s->read ? READ_SAMPLE_STATE : NOT_READ_SAMPLE_STATE;
+        if (r->builtin) {
+            DDS_PublicationBuiltinTopicData *pd = (DDS_PublicationBuiltinTopicData *)s->data;
+            DDS_PublicationBuiltinTopicData *out = &((DDS_PublicationBuiltinTopicData *)data_buf)[n];
+            out->topic_name = xstrdup(pd->topic_name);
+            out->type_name = xstrdup(pd->type_name);
+        } else {
+            ((DDS_DynamicData **)data_buf)[n] = dd_wrap(value_copy(s->data), 1);
+        }
+        n++;
+        if (take) {
+            Sample *next = s->next;
+            *prev = next;
+            if (r->builtin) {
+                DDS_PublicationBuiltinTopicData *pd = (DDS_PublicationBuiltinTopicData *)s->data;
+                free(pd->topic_name);
+                free(pd->type_name);
+                free(pd);
+            } else {
+                value_free(s->data);
+            }
+            free(s);
+            r->depth--;
+            s = next;
+        } else {
+            s->read = 1;
+            r->tail = s;
+            prev = &s->next;
+            s = s->next;
+        }
+    }
+    for (; s; s = s->next)
+        r->tail = s;
+    if (!r->head)
+        r->tail = NULL;
+    if (r->depth == 0)
+        r->entity.status &= ~DATA_AVAILABLE_STATUS;
+    pthread_mutex_unlock(&g_lock);
+
+    if (n == 0) {
+        free(info_buf);
+        free(data_buf);
+        return RC_NO_DATA;
+    }
+    loan = xcalloc(1, sizeof(Loan));
+    loan->n = n;
+    loan->builtin = r->builtin;
+    data->_contiguous_buffer = data_buf;
+    data->_length = data->_maximum = n;
+    data->_owned = 0;
+    data->_read_token1 = loan;
+    infos->_contiguous_buffer = info_buf;
+    infos->_length = infos->_maximum = n;
+    infos->_owned = 0;
+    infos->_read_token1 = loan;
+    return RC_OK;
+}
+
+static DDS_ReturnCode_t return_loan(Seq *data, Seq *infos)
+{
+    Loan *loan = data->_read_token1;
+    int i;
+    if (!loan && !infos->_read_token1 && data->_length == 0 && infos->_length == 0)
+        return RC_OK;
+    if (!loan || infos->_read_token1 != loan)
+        return RC_PRECONDITION_NOT_MET;
+    for (i = 0; i < loan->n; i++) {
+        if (loan->builtin) {
+            DDS_PublicationBuiltinTopicData *pd = &((DDS_PublicationBuiltinTopicData *)data->_contiguous_buffer)[i];
+            free(pd->topic_name);
+            free(pd->type_name);
+        } else {
+            dd_free(((DDS_DynamicData **)data->_contiguous_buffer)[i]);
+        }
+    }
+    free(data->_contiguous_buffer);
+    free(infos->_contiguous_buffer);
+    free(loan);
+    memset(data, 0, sizeof(*data));
+    memset(infos, 0, sizeof(*infos));
+    data->_owned = infos->_owned = 1;
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_DynamicDataReader_take(DDS_DataReader *r, Seq *data, Seq *infos, DDS_Long max,
+                                            DDS_UnsignedLong smask, DDS_UnsignedLong vmask, DDS_UnsignedLong imask)
+{
+    return take_or_read(r, data, infos, max, smask, vmask, imask, 1);
+}
+
+DDS_ReturnCode_t DDS_DynamicDataReader_read(DDS_DataReader *r, Seq *data, Seq *infos, DDS_Long max,
+                                            DDS_UnsignedLong smask, DDS_UnsignedLong vmask, DDS_UnsignedLong imask)
+{
+    return take_or_read(r, data, infos, max, smask, vmask, imask, 0);
+}
+
+DDS_ReturnCode_t DDS_DynamicDataReader_return_loan(DDS_DataReader *r, Seq *data, Seq *infos)
+{
+    (void)r;
+    return return_loan(data, infos);
+}
+
+DDS_ReturnCode_t DDS_PublicationBuiltinTopicDataDataReader_take(DDS_DataReader *r, Seq *data, Seq *infos,
+                                                                 DDS_Long max, DDS_UnsignedLong smask,
+                                                                 DDS_UnsignedLong vmask, DDS_UnsignedLong imask)
+{
+    return take_or_read(r, data, infos, max, smask, vmask, imask, 1);
+}
+
+DDS_ReturnCode_t DDS_PublicationBuiltinTopicDataDataReader_return_loan(DDS_DataReader *r, Seq *data, Seq *infos)
+{
+    (void)r;
+    return return_loan(data, infos);
+}
+
+DDS_ReturnCode_t DDS_DynamicDataReader_take_next_sample(DDS_DataReader *r, DDS_DynamicData *dd,
+                                                        DDS_SampleInfo *info)
+{
+    Sample *s, **prev;
+    COUNT(CNT_TAKE);
+    pthread_mutex_lock(&g_lock);
+    prev = &r->head;
+    for (s = r->head; s; s = s->next) {
+        if (!s->read)
+            break;
+        prev = &s->next;
+    }
+    if (!s) {
+        pthread_mutex_unlock(&g_lock);
+        return RC_NO_DATA;
+    }
+    *prev = s->next;
+    if (r->tail == s) {
+        Sample *t;
+        r->tail = NULL;
+        for (t = r->head; t; t = t->next)
+            r->tail = t;
+    }
+    r->depth--;
+    if (r->depth == 0)
+        r->entity.status &= ~DATA_AVAILABLE_STATUS;
+    pthread_mutex_unlock(&g_lock);
+
+    if (dd->owns)
+        value_free(dd->root);
+    dd->root = s->data;
+    dd->tc = s->data->tc;
+    dd->owns = 1;
+    *info = s->info;
+    free(s);
+    return RC_OK;
+}
+
+/* ------------------------------------------------------------------------ */
+/* conditions and waitsets                                                  */
+
+typedef struct DDS_WaitSet {
+    int n;
+    DDS_Condition *conditions[64];
+} DDS_WaitSet;
+
+DDS_StatusCondition *DDS_Entity_get_statuscondition(DDS_Entity *e)
+{
+    return e->condition;
+}
+
+DDS_ReturnCode_t DDS_StatusCondition_set_enabled_statuses(DDS_StatusCondition *c, DDS_Long mask)
+{
+    pthread_mutex_lock(&g_lock);
+    c->enabled = (DDS_UnsignedLong)mask;
+    pthread_cond_broadcast(&g_changed);
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_UnsignedLong DDS_Entity_get_status_changes(DDS_Entity *e)
+{
+    return e->status;
+}
+
+DDS_GuardCondition *DDS_GuardCondition_new(void)
+{
+    DDS_GuardCondition *g = xcalloc(1, sizeof(*g));
+    g->as_condition.kind = 1;
+    return g;
+}
+
+void DDS_GuardCondition_delete(DDS_GuardCondition *g)
+{
+    free(g);
+}
+
+DDS_ReturnCode_t DDS_GuardCondition_set_trigger_value(DDS_GuardCondition *g, DDS_Boolean value)
+{
+    pthread_mutex_lock(&g_lock);
+    g->trigger = value;
+    pthread_cond_broadcast(&g_changed);
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_WaitSet *DDS_WaitSet_new(void)
+{
+    return xcalloc(1, sizeof(DDS_WaitSet));
+}
+
+void DDS_WaitSet_delete(DDS_WaitSet *ws)
+{
+    free(ws);
+}
+
+DDS_ReturnCode_t DDS_WaitSet_attach_condition(DDS_WaitSet *ws, DDS_Condition *c)
+{
+    pthread_mutex_lock(&g_lock);
+    if (ws->n == 64) {
+        pthread_mutex_unlock(&g_lock);
+        return RC_ERROR;
+    }
+    ws->conditions[ws->n++] = c;
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
+
+DDS_ReturnCode_t DDS_WaitSet_detach_condition(DDS_WaitSet *ws, DDS_Condition *c)
+{
+    int i;
+    pthread_mutex_lock(&g_lock);
+    for (i = 0; i < ws->n; i++) {
+        if (ws->conditions[i] == c) {
+            ws->conditions[i] = ws->conditions[--ws->n];
+            pthread_mutex_unlock(&g_lock);
+            return RC_OK;
+        }
+    }
+    pthread_mutex_unlock(&g_lock);
+    return RC_BAD_PARAMETER;
+}
+
+static int condition_triggered(DDS_Condition *c)
+{
+    if (c->kind == 1)
+        return ((DDS_GuardCondition *)c)->trigger;
+    {
+        DDS_StatusCondition *sc = (DDS_StatusCondition *)c;
+        return (sc->entity->status & sc->enabled) != 0;
+    }
+}
+
+DDS_ReturnCode_t DDS_WaitSet_wait(DDS_WaitSet *ws, Seq *active, DDS_Duration_t *timeout)
+{
+    struct timespec deadline;
+    int infinite = timeout->sec == 0x7fffffff;
+    int i, n;
+    DDS_Condition **buf;
+
+    clock_gettime(CLOCK_REALTIME, &deadline);
+    deadline.tv_sec += timeout->sec;
+    deadline.tv_nsec += timeout->nanosec;
+    if (deadline.tv_nsec >= 1000000000L) {
+        deadline.tv_sec += deadline.tv_nsec / 1000000000L;
+        deadline.tv_nsec %= 1000000000L;
+    }
+
+    pthread_mutex_lock(&g_lock);
+    for (;;) {
+        n = 0;
+        for (i = 0; i < ws->n; i++)
+            if (condition_triggered(ws->conditions[i]))
+                n++;
+        if (n)
+            break;
+        if (infinite) {
+            pthread_cond_wait(&g_changed, &g_lock);
+        } else if (pthread_cond_timedwait(&g_changed, &g_lock, &deadline) == ETIMEDOUT) {
+            pthread_mutex_unlock(&g_lock);
+            if (active)
+                active->_length = 0;
+            return RC_TIMEOUT;
+        }
+    }
+    if (active) {
+        if (active->_owned && active->_contiguous_buffer)
+            free(active->_contiguous_buffer);
+        buf = xcalloc(n, sizeof(DDS_Condition *));
+        n = 0;
+        for (i = 0; i < ws->n; i++)
+            if (condition_triggered(ws->conditions[i]))
+                buf[n++] = ws->conditions[i];
+        active->_contiguous_buffer = buf;
+        active->_length = active->_maximum = n;
+        active->_owned = 1;
+    }
+    pthread_mutex_unlock(&g_lock);
+    return RC_OK;
+}
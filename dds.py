@@ -1,22 +1,67 @@
 from __future__ import print_function
 
+import array
+import bisect
 import ctypes
 import weakref
 import collections
-import uuid
-import platform
+import itertools
+import sys
 import threading
+import time
+import traceback
+
+# numpy is optional and slow to import, so it is only imported by _import_numpy
+# when columnar batches are first asked for.
+numpy = None
+
+def _import_numpy(what):
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError(what + ' require numpy')
+    return numpy
 
 def libname(name):
-    if platform.uname()[0] == 'Windows':
+    if sys.platform == 'win32':
         return name + '.dll'
-    elif platform.uname()[0] == 'Darwin':
+    elif sys.platform == 'darwin':
         return 'lib' + name + '.dylib'
     else:
         return 'lib' + name + '.so'
 
-_ddscore_lib = ctypes.CDLL(libname('nddscore'), ctypes.RTLD_GLOBAL)
-_ddsc_lib = ctypes.CDLL(libname('nddsc'))
+class _LazyLibrary(object):
+    """
+    A ctypes.CDLL that is only loaded when one of its symbols is first looked up,
+    so importing this module doesn't load the RTI libraries. Libraries in
+    `depends' are loaded first.
+    """
+    def __init__(self, name, mode=ctypes.DEFAULT_MODE, depends=()):
+        self._name    = name
+        self._mode    = mode
+        self._depends = depends
+        self._lib     = None
+        self._lock    = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._lib is None:
+                for lib in self._depends:
+                    lib._load()
+                self._lib = ctypes.CDLL(self._name, self._mode)
+        return self._lib
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        value = getattr(self._lib or self._load(), attr)
+        setattr(self, attr, value)
+        return value
+
+_ddscore_lib = _LazyLibrary(libname('nddscore'), ctypes.RTLD_GLOBAL)
+_ddsc_lib = _LazyLibrary(libname('nddsc'), depends=(_ddscore_lib,))
 
 # some types
 enum = ctypes.c_int
@@ -98,10 +143,15 @@ class Error(Exception):
 class NoDataError(Exception):
     pass
 
+class TimeoutError(Error):
+    pass
+
 
 def check_code(result, func, arguments):
     if result == 11:
         raise NoDataError()
+    if result == 10:
+        raise TimeoutError('timeout')
     if result != 0:
         # raise Error(str(result))
         raise Error({
@@ -146,12 +196,25 @@ def check_true(result, func, arguments):
 
 # Function and structure accessors
 
+_globals = {}
+
 def get(name, data_type):
-    return ctypes.cast(getattr(_ddsc_lib, 'DDS_' + name), ctypes.POINTER(data_type)).contents
+    # The exported defaults and masks never move, so each is only looked up once.
+    try:
+        return _globals[name, data_type]
+    except KeyError:
+        value = _globals[name, data_type] = ctypes.cast(getattr(_ddsc_lib, 'DDS_' + name), ctypes.POINTER(data_type)).contents
+        return value
 
 @apply
 class DDSFunc(object):
-    pass
+    # Functions are bound from their prototype in _prototypes on first use.
+    def __getattr__(self, attr):
+        try:
+            prototype = _prototypes[attr]
+        except KeyError:
+            raise AttributeError(attr)
+        return _define_func((attr,) + prototype)
 
 @apply
 class DDSType(object):
@@ -307,6 +370,24 @@ DDSType.DataReaderListener._fields_ = [
     ('on_sample_lost', ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(DDSType.DataReader), ctypes.POINTER(DDSType.SampleLostStatus))),
 ]
 
+DDSType.DataWriterListener._fields_ = [
+    ('as_listener', DDSType.Listener),
+    ('on_offered_deadline_missed', ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(DDSType.DataWriter), ctypes.POINTER(DDSType.OfferedDeadlineMissedStatus))),
+    ('on_offered_incompatible_qos', ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(DDSType.DataWriter), ctypes.POINTER(DDSType.OfferedIncompatibleQosStatus))),
+    ('on_liveliness_lost', ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(DDSType.DataWriter), ctypes.POINTER(DDSType.LivelinessLostStatus))),
+    ('on_publication_matched', ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(DDSType.DataWriter), ctypes.POINTER(DDSType.PublicationMatchedStatus))),
+    # the remaining (RTI specific) callbacks are not used
+    ('on_reliable_writer_cache_changed', ctypes.c_void_p),
+    ('on_reliable_reader_activity_changed', ctypes.c_void_p),
+    ('on_destination_unreachable', ctypes.c_void_p),
+    ('on_data_request', ctypes.c_void_p),
+    ('on_data_return', ctypes.c_void_p),
+    ('on_sample_removed', ctypes.c_void_p),
+    ('on_instance_replaced', ctypes.c_void_p),
+    ('on_application_acknowledgment', ctypes.c_void_p),
+    ('on_service_request_accepted', ctypes.c_void_p),
+]
+
 DDSType.LivelinessChangedStatus._fields_ = [
     ('alive_count', DDS_Long),
     ('not_alive_count', DDS_Long),
@@ -315,6 +396,65 @@ DDSType.LivelinessChangedStatus._fields_ = [
     ('last_publication_handle', DDSType.InstanceHandle_t),
 ]
 
+DDSType.LivelinessLostStatus._fields_ = [
+    ('total_count', DDS_Long),
+    ('total_count_change', DDS_Long),
+]
+
+DDSType.SampleLostStatus._fields_ = [
+    ('total_count', DDS_Long),
+    ('total_count_change', DDS_Long),
+    ('last_reason', enum),
+]
+
+DDSType.SampleRejectedStatus._fields_ = [
+    ('total_count', DDS_Long),
+    ('total_count_change', DDS_Long),
+    ('last_reason', enum),
+    ('last_instance_handle', DDSType.InstanceHandle_t),
+]
+
+DDSType.RequestedDeadlineMissedStatus._fields_ = DDSType.OfferedDeadlineMissedStatus._fields_ = [
+    ('total_count', DDS_Long),
+    ('total_count_change', DDS_Long),
+    ('last_instance_handle', DDSType.InstanceHandle_t),
+]
+
+# Followed by the per-policy counts, which are not read.
+DDSType.RequestedIncompatibleQosStatus._fields_ = DDSType.OfferedIncompatibleQosStatus._fields_ = [
+    ('total_count', DDS_Long),
+    ('total_count_change', DDS_Long),
+    ('last_policy_id', enum),
+]
+
+DDSType.SubscriptionMatchedStatus._fields_ = [
+    ('total_count', DDS_Long),
+    ('total_count_change', DDS_Long),
+    ('current_count', DDS_Long),
+    ('current_count_peak', DDS_Long),
+    ('current_count_change', DDS_Long),
+    ('last_publication_handle', DDSType.InstanceHandle_t),
+]
+
+DDSType.PublicationMatchedStatus._fields_ = [
+    ('total_count', DDS_Long),
+    ('total_count_change', DDS_Long),
+    ('current_count', DDS_Long),
+    ('current_count_peak', DDS_Long),
+    ('current_count_change', DDS_Long),
+    ('last_subscription_handle', DDSType.InstanceHandle_t),
+]
+
+DDSType.DynamicDataMemberInfo._fields_ = [
+    ('member_id', DDS_DynamicDataMemberId),
+    ('member_name', ctypes.c_char_p),
+    ('member_exists', DDS_Boolean),
+    ('member_kind', ctypes.c_int),
+    ('representation_count', DDS_UnsignedLong),
+    ('element_count', DDS_UnsignedLong),
+    ('element_kind', ctypes.c_int),
+]
+
 class TCKind(object):
     NULL             =  0
     SHORT            =  1
@@ -368,7 +508,8 @@ def _define_func((p, errcheck, restype, argtypes)):
     f.restype = restype
     f.argtypes = argtypes
     setattr(DDSFunc, p, f)
-map(_define_func, [
+    return f
+_prototypes = dict((p[0], p[1:]) for p in [
     ('DomainParticipantFactory_get_instance',
         check_null, ctypes.POINTER(DDSType.DomainParticipantFactory),
         []),
@@ -424,6 +565,12 @@ map(_define_func, [
     ('DomainParticipant_delete_contentfilteredtopic',
         check_code, DDS_ReturnCode_t,
         [ctypes.POINTER(DDSType.DomainParticipant), ctypes.POINTER(DDSType.ContentFilteredTopic)]),
+    ('DomainParticipant_delete_contained_entities',
+        check_code, DDS_ReturnCode_t,
+        [ctypes.POINTER(DDSType.DomainParticipant)]),
+    ('ContentFilteredTopic_set_expression_parameters',
+        check_code, DDS_ReturnCode_t,
+        [ctypes.POINTER(DDSType.ContentFilteredTopic), ctypes.POINTER(DDSType.StringSeq)]),
     ('DomainParticipant_get_builtin_subscriber',
         None, ctypes.POINTER(DDSType.Subscriber),
         [ctypes.POINTER(DDSType.DomainParticipant)]),
@@ -489,6 +636,9 @@ map(_define_func, [
     ('Publisher_create_datawriter',
         check_null, ctypes.POINTER(DDSType.DataWriter),
         [ctypes.POINTER(DDSType.Publisher), ctypes.POINTER(DDSType.Topic), ctypes.POINTER(DDSType.DataWriterQos), ctypes.POINTER(DDSType.DataWriterListener), DDS_StatusMask]),
+    ('Publisher_create_datawriter_with_profile',
+        check_null, ctypes.POINTER(DDSType.DataWriter),
+        [ctypes.POINTER(DDSType.Publisher), ctypes.POINTER(DDSType.Topic), ctypes.c_char_p, ctypes.c_char_p, ctypes.POINTER(DDSType.DataWriterListener), DDS_StatusMask]),
     ('Publisher_delete_datawriter',
         check_code, DDS_ReturnCode_t,
         [ctypes.POINTER(DDSType.Publisher), ctypes.POINTER(DDSType.DataWriter)]),
@@ -496,6 +646,9 @@ map(_define_func, [
     ('Subscriber_create_datareader',
         check_null, ctypes.POINTER(DDSType.DataReader),
         [ctypes.POINTER(DDSType.Subscriber), ctypes.POINTER(DDSType.TopicDescription), ctypes.POINTER(DDSType.DataReaderQos), ctypes.POINTER(DDSType.DataReaderListener), DDS_StatusMask]),
+    ('Subscriber_create_datareader_with_profile',
+        check_null, ctypes.POINTER(DDSType.DataReader),
+        [ctypes.POINTER(DDSType.Subscriber), ctypes.POINTER(DDSType.TopicDescription), ctypes.c_char_p, ctypes.c_char_p, ctypes.POINTER(DDSType.DataReaderListener), DDS_StatusMask]),
     ('Subscriber_delete_datareader',
         check_code, DDS_ReturnCode_t,
         [ctypes.POINTER(DDSType.Subscriber), ctypes.POINTER(DDSType.DataReader)]),
@@ -538,6 +691,16 @@ map(_define_func, [
 ] + [
     ('DynamicData_set_' + func_name, check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId, data_type])
         for func_name, data_type, bounds  in _dyn_basic_types.itervalues()
+] + [
+    ('DynamicData_get_' + func_name + '_array', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(data_type), ctypes.POINTER(DDS_UnsignedLong), ctypes.c_char_p, DDS_DynamicDataMemberId])
+        for func_name, data_type, bounds in _dyn_basic_types.itervalues()
+] + [
+    ('DynamicData_set_' + func_name + '_array', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId, DDS_UnsignedLong, ctypes.POINTER(data_type)])
+        for func_name, data_type, bounds in _dyn_basic_types.itervalues()
+] + [
+    ('DynamicData_get_member_info',
+        check_code, DDS_ReturnCode_t,
+        [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.DynamicDataMemberInfo), ctypes.c_char_p, DDS_DynamicDataMemberId]),
 ] + [
     ('DynamicData_get_string',
         check_code, DDS_ReturnCode_t,
@@ -575,6 +738,9 @@ map(_define_func, [
     ('DynamicData_delete',
         None, None,
         [ctypes.POINTER(DDSType.DynamicData)]),
+    ('DynamicData_copy',
+        check_code, DDS_ReturnCode_t,
+        [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.DynamicData)]),
 
     ('DynamicDataWriter_narrow',
         check_null, ctypes.POINTER(DDSType.DynamicDataWriter),
@@ -585,6 +751,12 @@ map(_define_func, [
     ('DynamicDataWriter_dispose',
         check_code, DDS_ReturnCode_t,
         [ctypes.POINTER(DDSType.DynamicDataWriter), ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.InstanceHandle_t)]),
+    ('DynamicDataWriter_register_instance',
+        None, DDSType.InstanceHandle_t,
+        [ctypes.POINTER(DDSType.DynamicDataWriter), ctypes.POINTER(DDSType.DynamicData)]),
+    ('DynamicDataWriter_unregister_instance',
+        check_code, DDS_ReturnCode_t,
+        [ctypes.POINTER(DDSType.DynamicDataWriter), ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.InstanceHandle_t)]),
 
 
     ('DynamicDataReader_get_key_value',
@@ -596,6 +768,9 @@ map(_define_func, [
     ('DynamicDataReader_take',
         check_code, DDS_ReturnCode_t,
         [ctypes.POINTER(DDSType.DynamicDataReader), ctypes.POINTER(DDSType.DynamicDataSeq), ctypes.POINTER(DDSType.SampleInfoSeq), DDS_Long, DDS_SampleStateMask, DDS_ViewStateMask, DDS_InstanceStateMask]),
+    ('DynamicDataReader_read',
+        check_code, DDS_ReturnCode_t,
+        [ctypes.POINTER(DDSType.DynamicDataReader), ctypes.POINTER(DDSType.DynamicDataSeq), ctypes.POINTER(DDSType.SampleInfoSeq), DDS_Long, DDS_SampleStateMask, DDS_ViewStateMask, DDS_InstanceStateMask]),
     ('DynamicDataReader_take_next_sample',
         check_code, DDS_ReturnCode_t,
         [ctypes.POINTER(DDSType.DynamicDataReader), ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.SampleInfo)]),
@@ -617,6 +792,10 @@ map(_define_func, [
         check_ex, DDS_UnsignedLong, [ctypes.POINTER(DDSType.TypeCode), ctypes.c_char_p, ctypes.POINTER(DDS_ExceptionCode_t)]),
     ('TypeCode_is_member_key',
         check_ex, DDS_Boolean, [ctypes.POINTER(DDSType.TypeCode), DDS_UnsignedLong, ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_content_type',
+        check_ex, ctypes.POINTER(DDSType.TypeCode), [ctypes.POINTER(DDSType.TypeCode), ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_element_count',
+        check_ex, DDS_UnsignedLong, [ctypes.POINTER(DDSType.TypeCode), ctypes.POINTER(DDS_ExceptionCode_t)]),
 
     ('DynamicDataSeq_initialize',
         check_true, DDS_Boolean, [ctypes.POINTER(DDSType.DynamicDataSeq)]),
@@ -655,9 +834,21 @@ map(_define_func, [
     ('WaitSet_attach_condition',
         check_code, DDS_ReturnCode_t,
         [ctypes.POINTER(DDSType.WaitSet), ctypes.POINTER(DDSType.Condition)]),
+    ('WaitSet_detach_condition',
+        check_code, DDS_ReturnCode_t,
+        [ctypes.POINTER(DDSType.WaitSet), ctypes.POINTER(DDSType.Condition)]),
     ('WaitSet_wait',
         check_code, DDS_ReturnCode_t,
         [ctypes.POINTER(DDSType.WaitSet), ctypes.POINTER(DDSType.ConditionSeq), ctypes.POINTER(DDSType.Duration_t)]),
+    ('WaitSet_delete', None, None, [ctypes.POINTER(DDSType.WaitSet)]),
+
+    ('GuardCondition_new',
+        check_null, ctypes.POINTER(DDSType.GuardCondition),
+        []),
+    ('GuardCondition_set_trigger_value',
+        check_code, DDS_ReturnCode_t,
+        [ctypes.POINTER(DDSType.GuardCondition), DDS_Boolean]),
+    ('GuardCondition_delete', None, None, [ctypes.POINTER(DDSType.GuardCondition)]),
 
     ('Entity_get_statuscondition',
         None, ctypes.POINTER(DDSType.StatusCondition),
@@ -672,372 +863,2400 @@ map(_define_func, [
         check_true, DDS_Boolean, [ctypes.POINTER(DDSType.ConditionSeq)]),
 ])
 
-def write_into_dd_member(obj, dd, member_name=None, member_id=DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED):
-    tc = ctypes.POINTER(DDSType.TypeCode)()
-    dd.get_member_type(ctypes.byref(tc), member_name, member_id, ex())
-
+# Marshalling plans
+#
+# Walking the TypeCode for every sample is expensive (several ctypes calls per
+# member before any data is touched), so each type is compiled once into a
+# plan: a flat list of members, each holding its kind, closures over the bound
+# DynamicData accessor and, for complex members, the nested plan. unpack_dd and
+# write_into_dd both run off the plan. `patch' is `write' for sparse data: for
+# structs it only writes the fields present in the dictionary.
+#
+# The accessors take a member name and id, as the DynamicData calls do. Struct
+# members are addressed by name (ids are not unique: the first member's is 0,
+# which is also DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED), sequence and array
+# elements by their 1-based index with no name.
+#
+# Sequences and arrays of primitives are moved whole, with one
+# get_<type>_array/set_<type>_array call, rather than element by element. Plans
+# compiled with `arrays' read them as array.array (str for octets and chars,
+# unicode for wchars) instead of lists.
+
+_MemberPlan = collections.namedtuple('_MemberPlan', 'name member_id kind read write patch plan')
+
+def _resolve_alias(tc):
+    while tc.kind(ex()) == TCKind.ALIAS:
+        tc = tc.content_type(ex())
+    return tc
+
+# Complex members are accessed through a DynamicData bound to them. Rather than a
+# new one per member per sample, each thread keeps a stack of unbound ones: a
+# member nested n deep uses the n-th, so after the first sample nothing is
+# allocated. They are deleted when the thread ends.
+
+class _BinderStack(list):
+    delete = None
+
+    def __del__(self):
+        for inner in self:
+            self.delete(inner)
+
+class _Binders(threading.local):
+    def __init__(self):
+        self.stack = _BinderStack()
+
+_binders = _Binders()
+
+def _bind_member(dd, member_name, member_id):
+    """Returns a scratch DynamicData bound to a member of `dd'. Release it with `_unbind_member'."""
+    stack = _binders.stack
+    if stack:
+        inner = stack.pop()
+    else:
+        inner = DDSFunc.DynamicData_new(None, get('DYNAMIC_DATA_PROPERTY_DEFAULT', DDSType.DynamicDataProperty_t))
+        stack.delete = DDSFunc.DynamicData_delete
+    try:
+        DDSFunc.DynamicData_bind_complex_member(dd, inner, member_name, member_id)
+    except:
+        stack.append(inner)
+        raise
+    return inner
+
+def _unbind_member(dd, inner):
+    try:
+        DDSFunc.DynamicData_unbind_complex_member(dd, inner)
+    except:
+        DDSFunc.DynamicData_delete(inner)
+        raise
+    _binders.stack.append(inner)
+
+def _array_typecode(data_type):
+    # The array.array typecode with the same layout as `data_type', if there is one.
+    if data_type is DDS_Float:
+        return 'f'
+    if data_type is DDS_Double:
+        return 'd'
+    if data_type in (DDS_Boolean, DDS_Char, DDS_Wchar):
+        return None
+    signed = data_type(-1).value < 0
+    for code in ('bhil' if signed else 'BHIL'):
+        if array.array(code).itemsize == ctypes.sizeof(data_type):
+            return code
+    return None
+
+def _compile_primitive_array(element_kind, length, arrays):
+    """
+    Returns read and write functions for a SEQUENCE (`length' None) or ARRAY of
+    a primitive type, which move the whole member in one call on its parent.
+    """
+    func_name, data_type, bounds = _dyn_basic_types[element_kind]
+    getter = getattr(DDSFunc, 'DynamicData_get_' + func_name + '_array')
+    setter = getattr(DDSFunc, 'DynamicData_set_' + func_name + '_array')
+    get_info = DDSFunc.DynamicData_get_member_info
+    pointer_type, size = ctypes.POINTER(data_type), ctypes.sizeof(data_type)
+    typecode = _array_typecode(data_type)
+    byref, cast = ctypes.byref, ctypes.cast
+
+    def count(dd, member_name, member_id):
+        if length is not None:
+            return length
+        info = DDSType.DynamicDataMemberInfo()
+        get_info(dd, byref(info), member_name, member_id)
+        return info.element_count
+
+    if arrays and element_kind in (TCKind.OCTET, TCKind.CHAR):
+        def read(dd, member_name, member_id):
+            n = count(dd, member_name, member_id)
+            buf = ctypes.create_string_buffer(n)
+            getter(dd, cast(buf, pointer_type), byref(DDS_UnsignedLong(n)), member_name, member_id)
+            return buf.raw
+    elif arrays and typecode is not None:
+        zero = array.array(typecode, [0])
+
+        def read(dd, member_name, member_id):
+            n = count(dd, member_name, member_id)
+            out = zero * n
+            if n:
+                getter(dd, cast(out.buffer_info()[0], pointer_type), byref(DDS_UnsignedLong(n)), member_name, member_id)
+            return out
+    else:
+        # Slicing a char or wchar buffer gives a string: a list of characters is
+        # wanted, except for wchars with `arrays'.
+        as_list = element_kind == TCKind.CHAR or (element_kind == TCKind.WCHAR and not arrays)
+
+        def read(dd, member_name, member_id):
+            n = count(dd, member_name, member_id)
+            buf = (data_type * n)()
+            getter(dd, buf, byref(DDS_UnsignedLong(n)), member_name, member_id)
+            return list(buf[:]) if as_list else buf[:]
+
+    def check_bounds(smallest, largest):
+        low, high = bounds
+        for value in (smallest, largest):
+            if not low <= value < high:
+                raise ValueError('%r not in range [%r, %r)' % (value, low, high))
+
+    def dtype_fits(numpy, dtype):
+        # Whether every value of a NumPy dtype is in bounds, so none need checking.
+        low, high = bounds
+        if dtype.kind == 'b':
+            return low <= 0 and 1 < high
+        if dtype.kind in 'iu':
+            info = numpy.iinfo(dtype)
+            return low <= info.min and info.max < high
+        return False
+
+    def write(dd, member_name, member_id, obj):
+        # Get a pointer to the elements without making a Python object per element
+        # where possible: NumPy arrays and array.arrays of the right type are used
+        # in place, and strings are copied in one go.
+        numpy = sys.modules.get('numpy')
+        if numpy is not None and isinstance(obj, numpy.ndarray) and element_kind != TCKind.WCHAR:
+            if obj.dtype != data_type and bounds is not None and obj.size and not dtype_fits(numpy, obj.dtype):
+                check_bounds(obj.min(), obj.max())
+            obj = numpy.ascontiguousarray(obj, data_type).ravel()
+            n, pointer = len(obj), obj.ctypes.data_as(pointer_type)
+        elif isinstance(obj, array.array) and obj.typecode == typecode:
+            address, n = obj.buffer_info()
+            pointer = cast(address, pointer_type)
+        elif isinstance(obj, (str, bytearray)) and element_kind in (TCKind.OCTET, TCKind.CHAR):
+            n = len(obj)
+            pointer = (data_type * n).from_buffer_copy(obj)
+        else:
+            n = len(obj)
+            if bounds is not None and n:
+                check_bounds(min(obj), max(obj))
+            pointer = (data_type * n)(*obj)
+
+        if length is not None and n != length:
+            if n > length:
+                raise ValueError('%d elements do not fit in an array of %d' % (n, length))
+            padded = (data_type * length)()
+            ctypes.memmove(padded, pointer, n * size)
+            n, pointer = length, padded
+        setter(dd, member_name, member_id, n, pointer)
+
+    return read, write
+
+def _compile_member(tc, name=None, member_id=DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED, arrays=False):
+    tc = _resolve_alias(tc)
     kind = tc.kind(ex())
+    plan = None
+    patch = None
+
     if kind in _dyn_basic_types:
         func_name, data_type, bounds = _dyn_basic_types[kind]
-        if bounds is not None and not bounds[0] <= obj < bounds[1]:
-            raise ValueError('%r not in range [%r, %r)' % (obj, bounds[0], bounds[1]))
-        getattr(dd, 'set_' + func_name)(member_name, member_id, obj)
+        getter = getattr(DDSFunc, 'DynamicData_get_' + func_name)
+        setter = getattr(DDSFunc, 'DynamicData_set_' + func_name)
+
+        def read(dd, member_name, member_id):
+            inner = data_type()
+            getter(dd, ctypes.byref(inner), member_name, member_id)
+            return inner.value
+
+        if bounds is None:
+            def write(dd, member_name, member_id, obj):
+                setter(dd, member_name, member_id, obj)
+        else:
+            low, high = bounds
+            def write(dd, member_name, member_id, obj):
+                if not low <= obj < high:
+                    raise ValueError('%r not in range [%r, %r)' % (obj, low, high))
+                setter(dd, member_name, member_id, obj)
+
+    elif (kind == TCKind.SEQUENCE or kind == TCKind.ARRAY) and _plan_for(tc, arrays).element.kind in _dyn_basic_types:
+        plan = _plan_for(tc, arrays)
+        read, write = _compile_primitive_array(plan.element.kind, plan.length, arrays)
+
     elif kind == TCKind.STRUCT or kind == TCKind.SEQUENCE or kind == TCKind.ARRAY:
-        inner = DDSFunc.DynamicData_new(None, get('DYNAMIC_DATA_PROPERTY_DEFAULT', DDSType.DynamicDataProperty_t))
-        try:
-            dd.bind_complex_member(inner, member_name, member_id)
+        plan = _plan_for(tc, arrays)
+        unpack = plan.unpack
+
+        def read(dd, member_name, member_id):
+            inner = _bind_member(dd, member_name, member_id)
             try:
-                write_into_dd(obj, inner)
+                return unpack(inner)
             finally:
-                dd.unbind_complex_member(inner)
-        finally:
-            inner.delete()
-    elif kind == TCKind.STRING:
-        if '\0' in obj:
-            raise ValueError('strings can not contain null characters')
-        dd.set_string(member_name, member_id, obj)
-    elif kind == TCKind.WSTRING:
-        dd.set_wstring(member_name, member_id, obj)
-    elif kind == TCKind.ENUM:
-        assert isinstance(obj, str) or isinstance(obj, unicode)
-        index = tc.find_member_by_name(obj, ex())
-        dd.set_ulong(member_name, member_id, index)
-    else:
-        raise NotImplementedError(kind)
+                _unbind_member(dd, inner)
 
-def write_into_dd(obj, dd):
-    kind = dd.get_type_kind()
-    if kind == TCKind.STRUCT:
-        assert isinstance(obj, dict)
-        tc = dd.get_type()
-        for i in xrange(tc.member_count(ex())):
-            name = tc.member_name(i, ex())
-            write_into_dd_member(obj[name], dd, member_name=name)
-    elif kind == TCKind.ARRAY or kind == TCKind.SEQUENCE:
-        assert isinstance(obj, list)
-        for i, x in enumerate(obj):
-            write_into_dd_member(x, dd, member_id=i+1)
-    else:
-        raise NotImplementedError(kind)
+        def bound_writer(write_into):
+            def write(dd, member_name, member_id, obj):
+                inner = _bind_member(dd, member_name, member_id)
+                try:
+                    write_into(obj, inner)
+                finally:
+                    _unbind_member(dd, inner)
+            return write
 
-def unpack_dd_member(dd, member_name=None, member_id=DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED):
-    tc = ctypes.POINTER(DDSType.TypeCode)()
-    dd.get_member_type(ctypes.byref(tc), member_name, member_id, ex())
+        write = bound_writer(plan.write)
+        patch = bound_writer(plan.patch)
 
-    kind = tc.kind(ex())
-    if kind in _dyn_basic_types:
-        func_name, data_type, bounds = _dyn_basic_types[kind]
-        inner = data_type()
-        getattr(dd, 'get_' + func_name)(ctypes.byref(inner), member_name, member_id)
-        return inner.value
-    elif kind == TCKind.STRUCT or kind == TCKind.SEQUENCE or kind == TCKind.ARRAY:
-        inner = DDSFunc.DynamicData_new(None, get('DYNAMIC_DATA_PROPERTY_DEFAULT', DDSType.DynamicDataProperty_t))
-        try:
-            dd.bind_complex_member(inner, member_name, member_id)
+    elif kind == TCKind.STRING:
+        get_string, set_string, string_free = DDSFunc.DynamicData_get_string, DDSFunc.DynamicData_set_string, DDSFunc.String_free
+
+        def read(dd, member_name, member_id):
+            inner = ctypes.c_char_p(None)
             try:
-                return unpack_dd(inner)
+                get_string(dd, ctypes.byref(inner), None, member_name, member_id)
+                return inner.value
             finally:
-                dd.unbind_complex_member(inner)
-        finally:
-            inner.delete()
-    elif kind == TCKind.STRING:
-        inner = ctypes.c_char_p(None)
-        try:
-            dd.get_string(ctypes.byref(inner), None, member_name, member_id)
-            return inner.value
-        finally:
-            DDSFunc.String_free(inner)
-    elif kind == TCKind.WSTRING:
-        inner = ctypes.c_wchar_p(None)
-        try:
-            dd.get_wstring(ctypes.byref(inner), None, member_name, member_id)
-            return inner.value
-        finally:
-            DDSFunc.Wstring_free(inner)
-    elif kind == TCKind.ENUM:
-        val = ctypes.c_uint()
-        dd.get_ulong(ctypes.byref(val), member_name, member_id)
-        return tc.member_name(val, ex())
-    else:
-        raise NotImplementedError(kind)
+                string_free(inner)
 
-def unpack_dd(dd):
-    kind = dd.get_type_kind()
-    if kind == TCKind.STRUCT:
-        obj = {}
-        tc = dd.get_type()
-        for i in xrange(tc.member_count(ex())):
-            name = tc.member_name(i, ex())
-            obj[name] = unpack_dd_member(dd, member_name=name)
-        return obj
-    elif kind == TCKind.ARRAY or kind == TCKind.SEQUENCE:
-        obj = []
-        for i in xrange(dd.get_member_count()):
-            obj.append(unpack_dd_member(dd, member_id=i+1))
-        return obj
-    else:
-        raise NotImplementedError(kind)
+        def write(dd, member_name, member_id, obj):
+            if '\0' in obj:
+                raise ValueError('strings can not contain null characters')
+            set_string(dd, member_name, member_id, obj)
 
-_outside_refs = set()
-_refs = set()
-_filtered_topic_refs = {}
+    elif kind == TCKind.WSTRING:
+        get_wstring, set_wstring, wstring_free = DDSFunc.DynamicData_get_wstring, DDSFunc.DynamicData_set_wstring, DDSFunc.Wstring_free
 
-class TopicSuper(object):
-    def __init__(self, dds, name, data_type, related_topic=None, filter_expression=None, _base_topic=None):
-        self._dds = dds
-        self.name = name
-        self.data_type = data_type
-        self._related_topic = related_topic
-        self._filter_expression = filter_expression
-        self._data_seq = None
-        self._info_seq = None
-        self._base_topic = _base_topic  # This is to prevent the base topic getting garbage collected for filtered topic.
+        def read(dd, member_name, member_id):
+            inner = ctypes.c_wchar_p(None)
+            try:
+                get_wstring(dd, ctypes.byref(inner), None, member_name, member_id)
+                return inner.value
+            finally:
+                wstring_free(inner)
 
-        self._support = support = DDSFunc.DynamicDataTypeSupport_new(self.data_type._get_typecode(),
-                                    get('DYNAMIC_DATA_TYPE_PROPERTY_DEFAULT', DDSType.DynamicDataTypeProperty_t))
-        self._type_name = self.data_type._get_typecode().name(ex())
-        self._support.register_type(self._dds._participant, self._type_name)
+        def write(dd, member_name, member_id, obj):
+            set_wstring(dd, member_name, member_id, obj)
 
-        self._topic  = topic      = self._create_topic()
-        self._writer = writer     = self._create_writer()
-        self._dyn_narrowed_writer = DDSFunc.DynamicDataWriter_narrow(self._writer)
-        self._listener            = None
+    elif kind == TCKind.ENUM:
+        names = [tc.member_name(i, ex()) for i in xrange(tc.member_count(ex()))]
+        indices = dict((n, i) for i, n in enumerate(names))
+        get_ulong, set_ulong = DDSFunc.DynamicData_get_ulong, DDSFunc.DynamicData_set_ulong
 
-        self._reader = reader = self._dds._subscriber.create_datareader(
-            self._topic.as_topicdescription(),
-            get('DATAREADER_QOS_DEFAULT', DDSType.DataReaderQos),
-            self._listener,
-            0,
-        )
-        self._dyn_narrowed_reader = DDSFunc.DynamicDataReader_narrow(self._reader)
+        def read(dd, member_name, member_id):
+            val = DDS_UnsignedLong()
+            get_ulong(dd, ctypes.byref(val), member_name, member_id)
+            return names[val.value]
 
-        self._data_available_callback = None
-        self._instance_revoked_cb     = None
-        self._liveliness_lost_cb      = None
+        def write(dd, member_name, member_id, obj):
+            assert isinstance(obj, str) or isinstance(obj, unicode)
+            if obj not in indices:
+                raise Error('bad member name (user)')
+            set_ulong(dd, member_name, member_id, indices[obj])
 
-        if not _filtered_topic_refs.has_key(name): _filtered_topic_refs[name] = []
+    else:
+        raise NotImplementedError(kind)
 
-        def _cleanup(ref):
-            if type(topic) is ctypes.POINTER(DDSType.Topic):
-                dds._publisher.delete_datawriter(writer)
-                dds._subscriber.delete_datareader(reader)
-                for ft in _filtered_topic_refs[name]:
-                    dds._publisher.delete_datawriter(ft._writer)
-                    dds._subscriber.delete_datareader(ft._reader)
-                    dds._participant.delete_contentfilteredtopic(ft._topic)
-                dds._participant.delete_topic(topic)
-                support.unregister_type(dds._participant, data_type._get_typecode().name(ex()))
-                support.delete()
-                del _filtered_topic_refs[name]
-                _refs.remove(ref)
+    return _MemberPlan(name, member_id, kind, read, write, patch or write, plan)
 
-        def get_keys():
-            keys = []
-            tc = self.data_type._get_typecode()
+class _TypePlan(object):
+    """
+    The compiled form of a STRUCT, SEQUENCE or ARRAY TypeCode. Use `_plan_for'
+    rather than constructing these directly so that plans are shared.
+    """
+    def __init__(self, tc, arrays=False):
+        self.kind = kind = tc.kind(ex())
+        self.arrays = arrays
+        self.members = []
+        self.by_name = {}
+        self.keys = []
+        self.element = None
+        self.length = None
+        self._columns = None
+
+        if kind == TCKind.STRUCT:
+            self.name = tc.name(ex())
             for i in xrange(tc.member_count(ex())):
+                name = tc.member_name(i, ex())
+                self.members.append(_compile_member(tc.member_type(i, ex()), name, arrays=arrays))
+                self.by_name[name] = self.members[-1]
                 if tc.is_member_key(i, ex()):
-                    keys.append(tc.member_name(i, ex()))
+                    self.keys.append(name)
+        elif kind == TCKind.SEQUENCE or kind == TCKind.ARRAY:
+            self.name = None
+            if kind == TCKind.ARRAY:
+                self.length = tc.element_count(ex())
+            self.element = _compile_member(tc.content_type(ex()), arrays=arrays)
+        else:
+            raise NotImplementedError(kind)
+
+    def unpack(self, dd):
+        if self.kind == TCKind.STRUCT:
+            obj = {}
+            for member in self.members:
+                obj[member.name] = member.read(dd, member.name, member.member_id)
+            return obj
+        else:
+            read = self.element.read
+            length = self.length
+            if length is None:
+                length = DDSFunc.DynamicData_get_member_count(dd)
+            return [read(dd, None, i) for i in xrange(1, length + 1)]
+
+    def columns(self):
+        """Returns the columnar (NumPy) plan for this struct type. Requires numpy."""
+        if self._columns is None:
+            _import_numpy('columnar unpacking')
+            self._columns = _ColumnPlan(self)
+        return self._columns
+
+    def write(self, obj, dd):
+        if self.kind == TCKind.STRUCT:
+            self._check_mapping(obj)
+            for member in self.members:
+                member.write(dd, member.name, member.member_id, obj[member.name])
+        else:
+            if not isinstance(obj, list):
+                raise TypeError('a sequence or array needs a list, not %s' % type(obj).__name__)
+            write = self.element.write
+            for i, x in enumerate(obj):
+                write(dd, None, i + 1, x)
 
-            return keys
+    def patch(self, obj, dd):
+        """
+        Writes only the fields present in `obj', leaving the rest of `dd' as it is.
+        Sequences and arrays are written whole. Unknown fields are ignored.
+        """
+        if self.kind == TCKind.STRUCT:
+            self._check_mapping(obj)
+            by_name = self.by_name
+            for name, value in obj.iteritems():
+                member = by_name.get(name)
+                if member is not None:
+                    member.patch(dd, name, member.member_id, value)
+        else:
+            self.write(obj, dd)
 
-        self._keys = get_keys()
+    def _check_mapping(self, obj):
+        if not isinstance(obj, collections.Mapping):
+            raise TypeError('%s needs a mapping, not %s' % (self.name, type(obj).__name__))
 
-        _refs.add(weakref.ref(self, _cleanup))
+_plans = {}
 
-    def _create_topic(self):
-        raise NotImplementedError("You must make an instance of a subclass that implements this method")
+def _plan_for(tc, arrays=False):
+    """
+    Returns the (cached) marshalling plan for a TypeCode. TypeCodes handed out by
+    the type libraries live for the whole process, so their address is the key.
+    """
+    key = (ctypes.addressof(tc.contents), arrays)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans.setdefault(key, _TypePlan(_resolve_alias(tc), arrays))
+    return plan
+
+# Columnar unpacking
+#
+# For numeric topics a batch can be unpacked straight into a preallocated NumPy
+# structured array instead of one dictionary per sample. Primitive members (and
+# fixed-length arrays of them, in one call) are read by the DynamicData getters
+# directly into the array's memory; strings, enums and sequences fall back to
+# object columns.
+
+def _numpy_type(kind):
+    if kind == TCKind.WCHAR:
+        # The getters write a DDS_Wchar into the column: a UCS-4 character where
+        # wchar_t is 4 bytes, and a UTF-16 code unit where it is 2 (Windows).
+        size = ctypes.sizeof(DDS_Wchar)
+        return numpy.dtype('U1') if size == numpy.dtype('U1').itemsize else numpy.dtype('u%d' % size)
+    return numpy.dtype(_dyn_basic_types[kind][1])
+
+class _ColumnPlan(object):
+    def __init__(self, plan):
+        assert plan.kind == TCKind.STRUCT
+        fields, makers = [], []
+        for member in plan.members:
+            dtype, maker = self._compile_member(member)
+            fields.append((member.name, dtype))
+            makers.append((member, maker))
+
+        self.dtype = numpy.dtype(fields, align=True)
+        self._fillers = [maker(member, self.dtype.fields[member.name][1]) for member, maker in makers]
+
+    @staticmethod
+    def _compile_member(member):
+        kind = member.kind
+        if kind in _dyn_basic_types:
+            return _numpy_type(kind), _ColumnPlan._primitive_filler
+        elif kind == TCKind.STRUCT:
+            return member.plan.columns().dtype, _ColumnPlan._struct_filler
+        elif kind == TCKind.ARRAY and member.plan.element.kind in _dyn_basic_types:
+            return (_numpy_type(member.plan.element.kind), (member.plan.length,)), _ColumnPlan._array_filler
+        return numpy.dtype(object), _ColumnPlan._object_filler
+
+    @staticmethod
+    def _primitive_filler(member, offset):
+        func_name, data_type, bounds = _dyn_basic_types[member.kind]
+        getter, name, member_id = getattr(DDSFunc, 'DynamicData_get_' + func_name), member.name, member.member_id
+        from_address, byref = data_type.from_address, ctypes.byref
+
+        def fill(dd, view, i, base):
+            getter(dd, byref(from_address(base + offset)), name, member_id)
+        return fill
+
+    @staticmethod
+    def _bound(member, fill_inner):
+        member_id, name = member.member_id, member.name
+
+        def fill(dd, view, i, base):
+            inner = _bind_member(dd, name, member_id)
+            try:
+                fill_inner(inner, view[name], i, base)
+            finally:
+                _unbind_member(dd, inner)
+        return fill
 
-    def _create_writer(self):
-        raise NotImplementedError("You must make an instance of a subclass that implements this method")
+    @staticmethod
+    def _struct_filler(member, offset):
+        fill_row = member.plan.columns().fill_row
+        return _ColumnPlan._bound(member, lambda inner, view, i, base: fill_row(inner, view, i, base + offset))
 
-    def _enable_listener(self):
-        assert self._listener is None
-        self._cfunctype_data_available = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(DDSType.DataReader))(self._on_data_available)
-        self._listener = DDSType.DataReaderListener(on_data_available=self._cfunctype_data_available)
-        self._reader.set_listener(self._listener, DATA_AVAILABLE_STATUS)
-        _outside_refs.add(self) # really want self._listener, but this does the same thing
+    @staticmethod
+    def _array_filler(member, offset):
+        func_name, data_type, bounds = _dyn_basic_types[member.plan.element.kind]
+        getter, length = getattr(DDSFunc, 'DynamicData_get_' + func_name + '_array'), member.plan.length
+        from_address, byref, name, member_id = (data_type * length).from_address, ctypes.byref, member.name, member.member_id
 
-    def _on_liveliness_changed(self, listener_data, reader, status):
-        print("\nstatus.alive_count:", status.alive_count,
-              "\nstatus.not_alive_count:", status.not_alive_count,
-              "\nstatus.alive_count_change:", status.alive_count_change,
-              "\nstatus.not_alive_count_change:", status.not_alive_count_change)
+        def fill(dd, view, i, base):
+            getter(dd, from_address(base + offset), byref(DDS_UnsignedLong(length)), name, member_id)
+        return fill
 
-    def _disable_listener(self):
-        assert self._listener is not None
-        self._reader.set_listener(None, 0)
-        self._listener = None
-        if self in _outside_refs:
-            _outside_refs.remove(self)
+    @staticmethod
+    def _object_filler(member, offset):
+        read, member_id, name = member.read, member.member_id, member.name
 
-    def add_data_available_callback(self, cb):
-        '''Warning: callback is called back in another thread!'''
-        if not self._data_available_callback:
-            self._enable_listener()
-        self._data_available_callback = cb
+        def fill(dd, view, i, base):
+            view[name][i] = read(dd, name, member_id)
+        return fill
 
-    def unsubscribe(self, topic=None):
+    def fill_row(self, dd, view, i, base):
+        for fill in self._fillers:
+            fill(dd, view, i, base)
 
-        """
-        Cancels a subscription made with `subscribe' with a given topic.
+    def empty(self, length):
+        return numpy.zeros(length, self.dtype)
 
-        Parameters:
-            topic (Topic or ContentFilteredTopic) Optional. The topic to cancel the
-                                                  subscription on. This value is returned
-                                                  by `subscribe'. Defaults to self.
+def write_into_dd(obj, dd):
+    _plan_for(dd.get_type()).write(obj, dd)
+
+def unpack_dd(dd, arrays=False):
+    return _plan_for(dd.get_type(), arrays).unpack(dd)
+
+# Callback dispatch
+
+OVERFLOW_BLOCK       = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+
+class _BoundedQueue(object):
+    def __init__(self, max_size, overflow):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST):
+            raise ValueError('unknown overflow policy: %r' % (overflow,))
+        self._items     = collections.deque()
+        self._lock      = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full  = threading.Condition(self._lock)
+        self._max_size  = max_size
+        self._overflow  = overflow
+        self._closed    = False
+        self.dropped    = 0
+        self.enqueued   = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        with self._lock:
+            if self._closed:
+                self.dropped += 1
+                return
+            if self._max_size and len(self._items) >= self._max_size:
+                if self._overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                elif self._overflow == OVERFLOW_DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._items) >= self._max_size and not self._closed:
+                        self._not_full.wait()
+            self._items.append(item)
+            self.enqueued += 1
+            self.high_water = max(self.high_water, len(self._items))
+            self._not_empty.notify()
+
+    def get(self, timeout=None):
         """
-        if not topic: topic = self
-        topic._data_available_callback = None
-        topic._instance_revoked_cb     = None
-        topic._liveliness_lost_cb      = None
-        if topic._listener:
-            topic._disable_listener()
+        Blocks for the next item, for at most `timeout' seconds if given. Returns
+        None on timeout or once closed and drained.
+        """
+        with self._lock:
+            if timeout is not None:
+                deadline = time.time() + timeout
+            while not self._items:
+                if self._closed:
+                    return None
+                if timeout is None:
+                    self._not_empty.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    self._not_empty.wait(remaining)
+            item = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+    def drain(self):
+        """Removes and returns every queued item without blocking."""
+        with self._lock:
+            items = list(self._items)
+            self._items.clear()
+            self._not_full.notify_all()
+            return items
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+class Dispatcher(object):
+    """
+    Decides which thread runs subscription callbacks. Every callback for a
+    sample (or a revoked/liveliness event) goes through `dispatch' with the
+    instance key of the sample, so implementations can keep per-instance order.
 
-    def _on_data_available(self, listener_data, datareader):
-        if not self._data_seq:
-            self._data_seq = DDSType.DynamicDataSeq()
-        self._data_seq.initialize()
-        if not self._info_seq:
-            self._info_seq = DDSType.SampleInfoSeq()
-        self._info_seq.initialize()
+    Use one of InlineDispatcher, ThreadPoolDispatcher or KeyedDispatcher.
+    """
 
-        try:
-            self._dyn_narrowed_reader.take(
-                ctypes.byref(self._data_seq),
-                ctypes.byref(self._info_seq),
-                DDS_LENGTH_UNLIMITED,
-                get('ANY_SAMPLE_STATE', DDS_SampleStateMask),
-                get('ANY_VIEW_STATE', DDS_ViewStateMask),
-                get('ANY_INSTANCE_STATE', DDS_InstanceStateMask)
-            )
+    # Whether `dispatch' needs a real key. When False the listener skips
+    # computing one and passes None.
+    keyed = False
 
-            for i in xrange(self._data_seq.get_length()):
-                info = self._info_seq.get_reference(i).contents
-                sample = self._data_seq.get_reference(i)
+    def __init__(self):
+        # [dispatched, errors] for each thread that has run callbacks, so the
+        # workers never share a counter. stats() adds them up.
+        self._counters      = []
+        self._counters_lock = threading.Lock()
+        self._local         = threading.local()
 
-                # calling the callbacks in a separate thread. This may cause performance issues.
+    def dispatch(self, key, callback, data):
+        raise NotImplementedError("You must make an instance of a subclass that implements this method")
 
-                if info.instance_state == DDS_NOT_ALIVE_DISPOSED_INSTANCE_STATE and self._instance_revoked_cb:
-                    self._dyn_narrowed_reader.get_key_value(sample, ctypes.byref(info.instance_handle))
-                    data = unpack_dd(sample)
-                    if self._send_topic_info:
-                        data = {'name': self._type_name, 'data': data, 'keys': self._keys}
+    def _thread_counters(self):
+        try:
+            return self._local.counters
+        except AttributeError:
+            counters = self._local.counters = [0, 0]
+            with self._counters_lock:
+                self._counters.append(counters)
+            return counters
+
+    def _run(self, callback, data):
+        counters = self._thread_counters()
+        try:
+            callback(data)
+        except Exception:
+            counters[1] += 1
+            traceback.print_exc()
+        counters[0] += 1
 
-                    threading.Thread(target=self._instance_revoked_cb, args=(data,)).start()
+    def stats(self):
+        """
+        Returns a dictionary of counters:
+            queue_depth     callbacks waiting to run
+            high_water      the largest queue_depth seen
+            dispatched      callbacks that have run
+            dropped         callbacks discarded by the overflow policy
+            errors          callbacks that raised
+        """
+        with self._counters_lock:
+            dispatched = sum(counters[0] for counters in self._counters)
+            errors     = sum(counters[1] for counters in self._counters)
+        return {'queue_depth': 0, 'high_water': 0, 'dispatched': dispatched, 'dropped': 0, 'errors': errors}
 
-                if info.instance_state == DDS_NOT_ALIVE_NO_WRITERS_INSTANCE_STATE and self._liveliness_lost_cb:
-                    self._dyn_narrowed_reader.get_key_value(sample, ctypes.byref(info.instance_handle))
-                    data = unpack_dd(sample)
-                    if self._send_topic_info:
-                        data = {'name': self._type_name, 'data': data, 'keys': self._keys}
+    def close(self, wait=True):
+        pass
 
-                    threading.Thread(target=self._liveliness_lost_cb, args=(data,)).start()
+class InlineDispatcher(Dispatcher):
+    """
+    Runs callbacks directly on the DDS listener thread. This has the lowest
+    latency, but a slow callback holds up delivery of everything behind it.
+    """
+    def dispatch(self, key, callback, data):
+        self._run(callback, data)
+
+class _QueueDispatcher(Dispatcher):
+    def __init__(self, queues, workers_per_queue, max_queue, overflow):
+        super(_QueueDispatcher, self).__init__()
+        self._queues  = [_BoundedQueue(max_queue, overflow) for _ in xrange(queues)]
+        self._threads = []
+        for queue in self._queues:
+            for _ in xrange(workers_per_queue):
+                thread = threading.Thread(target=self._work, args=(queue,), name='dds-dispatch')
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            self._run(*item)
+
+    def stats(self):
+        res = super(_QueueDispatcher, self).stats()
+        res['queue_depth'] = sum(len(q) for q in self._queues)
+        res['high_water']  = max(q.high_water for q in self._queues)
+        res['dropped']     = sum(q.dropped for q in self._queues)
+        return res
 
-                if info.instance_state == DDS_ALIVE_INSTANCE_STATE and info.valid_data and self._data_available_callback:
-                    data = unpack_dd(sample)
-                    if self._send_topic_info:
-                        data = {'name': self._type_name, 'data': data, 'keys': self._keys}
+    def close(self, wait=True):
+        """
+        Stops the workers once the callbacks already queued have run. Callbacks
+        dispatched after this are dropped.
+        """
+        for queue in self._queues:
+            queue.close()
+        if wait:
+            for thread in self._threads:
+                if thread is not threading.current_thread():
+                    thread.join()
+
+class ThreadPoolDispatcher(_QueueDispatcher):
+    """
+    Runs callbacks on a fixed pool of worker threads fed from one bounded queue.
+    With more than one worker, callbacks for the same instance may run out of
+    order; use KeyedDispatcher if that matters.
 
-                    threading.Thread(target=self._data_available_callback, args=(data,)).start()
+    Parameters:
+        workers   (Integer) The number of worker threads (defaults to 4)
+        max_queue (Integer) The most callbacks that may wait to run. 0 means unbounded.
+        overflow  (String)  What to do when the queue is full: OVERFLOW_BLOCK (wait on the
+                            listener thread), OVERFLOW_DROP_OLDEST or OVERFLOW_DROP_NEWEST.
+    """
+    def __init__(self, workers=4, max_queue=10000, overflow=OVERFLOW_BLOCK):
+        super(ThreadPoolDispatcher, self).__init__(1, workers, max_queue, overflow)
 
-        except NoDataError:
-            return
+    def dispatch(self, key, callback, data):
+        self._queues[0].put((callback, data))
+
+class KeyedDispatcher(_QueueDispatcher):
+    """
+    Runs callbacks on a fixed set of worker threads, each with its own bounded
+    queue. Samples are assigned to a worker by instance key, so callbacks for one
+    instance always run in order while different instances run in parallel.
+
+    Parameters:
+        workers   (Integer) The number of worker threads (defaults to 4)
+        max_queue (Integer) The most callbacks that may wait to run, per worker. 0 means unbounded.
+        overflow  (String)  What to do when a queue is full: OVERFLOW_BLOCK (wait on the
+                            listener thread), OVERFLOW_DROP_OLDEST or OVERFLOW_DROP_NEWEST.
+    """
+    keyed = True
+
+    def __init__(self, workers=4, max_queue=10000, overflow=OVERFLOW_BLOCK):
+        super(KeyedDispatcher, self).__init__(workers, 1, max_queue, overflow)
+
+    def dispatch(self, key, callback, data):
+        self._queues[hash(key) % len(self._queues)].put((callback, data))
+
+_DISPATCHER_NAMES = ('keyed', 'inline', 'pool')
+
+def _make_dispatcher(name):
+    # A new dispatcher of a kind in _DISPATCHER_NAMES (see DDS._get_dispatcher).
+    if name == 'keyed':
+        return KeyedDispatcher()
+    elif name == 'inline':
+        return InlineDispatcher()
+    return ThreadPoolDispatcher()
+
+# Metrics
+#
+# Opt-in counters and timings of the hot paths, kept per topic name (see
+# DDS.enable_metrics). While they are off, the hot paths only check
+# `dds.metrics' for None. Times are in seconds.
+
+_SECONDS_BUCKETS = tuple(m * 10.0 ** e for e in xrange(-6, 1) for m in (1, 2.5, 5)) + (10.0,)
+_SIZE_BUCKETS    = tuple(2 ** i for i in xrange(11))
+
+class _Histogram(object):
+    # Counts observations by upper bound, as a Prometheus histogram does.
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last is +Inf
+        self.count  = 0
+        self.sum    = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        buckets, total = [], 0
+        for bound, n in zip(self.bounds + (float('inf'),), self.counts):
+            total += n
+            buckets.append((bound, total))
+        return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+class _TopicMetrics(object):
+    # The metrics of one topic name.
+
+    counters = [
+        ('samples_taken',     'Samples taken by the listener.'),
+        ('samples_published', 'Samples published.'),
+        ('callback_errors',   'Subscription callbacks that raised.'),
+    ]
+    histograms = [
+        ('take_size',               _SIZE_BUCKETS,    'Samples returned by each take in the listener.'),
+        ('unpack_seconds',          _SECONDS_BUCKETS, 'Time to unpack a received sample.'),
+        ('queue_wait_seconds',      _SECONDS_BUCKETS, 'Time a callback waited in its dispatcher.'),
+        ('callback_seconds',        _SECONDS_BUCKETS, 'Time spent in a subscription callback.'),
+        ('publish_marshal_seconds', _SECONDS_BUCKETS, 'Time to marshal a published sample.'),
+        ('publish_write_seconds',   _SECONDS_BUCKETS, 'Time spent in the DataWriter write of a published sample.'),
+        ('latency_seconds',         _SECONDS_BUCKETS, 'Time from the source timestamp of a sample to its reception.'),
+    ]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys((name for name, _ in self.counters), 0)
+        self._histograms = dict((name, _Histogram(bounds)) for name, bounds, _ in self.histograms)
+
+    def _taken(self, length, unpack_times, latencies):
+        with self._lock:
+            self._counters['samples_taken'] += length
+            self._histograms['take_size'].observe(length)
+            for name, values in (('unpack_seconds', unpack_times), ('latency_seconds', latencies)):
+                observe = self._histograms[name].observe
+                for value in values:
+                    observe(value)
+
+    def _published(self, marshal, write):
+        with self._lock:
+            self._counters['samples_published'] += 1
+            self._histograms['publish_marshal_seconds'].observe(marshal)
+            self._histograms['publish_write_seconds'].observe(write)
+
+    def _timed_callback(self, callback):
+        # Wraps a callback that is about to be dispatched, to time its wait in the
+        # dispatcher and its run.
+        queued = time.time()
+
+        def timed(data):
+            start = time.time()
+            error = False
+            try:
+                callback(data)
+            except Exception:
+                error = True
+                raise
+            finally:
+                end = time.time()
+                with self._lock:
+                    self._histograms['queue_wait_seconds'].observe(start - queued)
+                    self._histograms['callback_seconds'].observe(end - start)
+                    if error:
+                        self._counters['callback_errors'] += 1
+        return timed
+
+    def snapshot(self):
+        with self._lock:
+            res = dict(self._counters)
+            for name, histogram in self._histograms.iteritems():
+                res[name] = histogram.snapshot()
+        return res
 
+def _timed(f, times):
+    # `f', appending the time each call takes to `times'.
+    def timed(*args):
+        start = time.time()
+        try:
+            return f(*args)
         finally:
-            self._dyn_narrowed_reader.return_loan(ctypes.byref(self._data_seq), ctypes.byref(self._info_seq))
-            self._data_seq.finalize()
-            self._info_seq.finalize()
+            times.append(time.time() - start)
+    return timed
 
-    def _generate_instance(self):
-        sample = self._support.create_data()
-        instance = unpack_dd(sample)
-        self._support.delete_data(sample)
-        return instance
-
-    def _update(self, obj, data):
-        for k, v in data.iteritems():
-            if isinstance(v, collections.Mapping):
-                r = self._update(obj.get(k, {}), v)
-                obj[k] = r
-            else:
-                obj[k] = data[k]
-        return obj
+def _prometheus_label(value):
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
 
-    def publish(self, data):
+class Metrics(object):
+    """
+    Counters and histograms of where time goes in pyDDS, per topic name. Get one
+    from `DDS.enable_metrics'.
+
+    For each topic there are counters of samples taken, samples published and
+    callbacks that raised, and histograms of the samples per take, the time to
+    unpack a sample, the time callbacks wait in their dispatcher and run for, the
+    time to marshal a published sample and to write it, and the latency from a
+    sample's source timestamp to its reception timestamp.
+    """
+    def __init__(self, topics=None):
+        self._names  = None if topics is None else set(topics)
+        self._topics = {}  # topic name -> _TopicMetrics
+        self._lock   = threading.Lock()
+
+    def _add_topics(self, topics):
+        if topics is None:
+            self._names = None
+        elif self._names is not None:
+            self._names = self._names | set(topics)
+
+    def _topic(self, name):
+        # The metrics to record topic `name' in, or None if it is not collected.
+        metrics = self._topics.get(name)
+        if metrics is None:
+            names = self._names
+            if names is not None and name not in names:
+                return None
+            with self._lock:
+                metrics = self._topics.setdefault(name, _TopicMetrics())
+        return metrics
+
+    def snapshot(self):
 
         """
-        Publishes an instance of this topic on the DDS bus with the provided data.
-        The input data may be sparse, but every entry in the data must be a field
-        in the topic. If the provided data is sparse, a full instance of the topic
-        will be published and the non-specified fields will receive default values.
-
-        Parameters:
-            data (Dict) the data to publish on the bus.
+        Returns the metrics as a dictionary of topic name -> metric name -> value.
+        Counters are integers. Histograms are dictionaries of their `count', the
+        `sum' of the observations and their `buckets', a list of (upper bound,
+        number of observations up to it).
         """
 
-        instance = self._update(self._generate_instance(), data)
-        self._send(instance)
+        return dict((name, metrics.snapshot()) for name, metrics in self._topics.items())
 
-    def _send(self, msg):
-        sample = self._support.create_data()
+    def reset(self):
 
-        try:
-            write_into_dd(msg, sample)
-            self._dyn_narrowed_writer.write(sample, DDS_HANDLE_NIL)
-        finally:
-            self._support.delete_data(sample)
+        """
+        Zeroes every metric.
+        """
 
-class FilteredTopic(TopicSuper):
-    def __init__(self, dds, name, data_type, related_topic, filter_expression, base_topic):
-        super(FilteredTopic, self).__init__(dds, name, data_type, related_topic, filter_expression, base_topic)
+        self._topics = {}
 
-    def _create_writer(self):
-        return self._dds._publisher.create_datawriter(
-            self._related_topic,
-            get('DATAWRITER_QOS_DEFAULT', DDSType.DataWriterQos),
-            None,
-            0,
-        )
+    def prometheus(self, prefix='pydds'):
 
-    def _create_topic(self):
-        self.filter_name = str(uuid.uuid4())
-        self._filter_params = DDSType.StringSeq()
-        ## calling initialize or from_array causes a segfault on windows. There doesn't seem to be any problem with not making these calls ...
-        # self._filter_params.initialize()
-        # self._filter_params.from_array((ctypes.c_char_p * 0)(), 0)
-        # DDSFunc.StringSeq_from_array(self._filter_params, (ctypes.c_char_p * 0)(), 0)  ## TODO: add in full support for parameterized filters
+        """
+        Returns the metrics in the Prometheus text exposition format, labelled with
+        the topic name.
 
-        return self._dds._participant.create_contentfilteredtopic(
-            self.filter_name,
-            self._related_topic,
-            self._filter_expression,
-            self._filter_params
-        )
+        Parameters:
+            prefix (String) Optional. Prepended to every metric name. Defaults to 'pydds'.
 
-class Topic(TopicSuper):
-    def __init__(self, dds, name, data_type):
-        super(Topic, self).__init__(dds, name, data_type)
-        self._filtered_topics = {}
+        Returns:
+            (String)
+        """
 
-    def _create_writer(self):
-        return self._dds._publisher.create_datawriter(
+        snapshots = sorted(self.snapshot().iteritems())
+        lines = []
+        for name, description in _TopicMetrics.counters:
+            metric = '%s_%s_total' % (prefix, name)
+            lines.append('# HELP %s %s' % (metric, description))
+            lines.append('# TYPE %s counter' % metric)
+            for topic, snapshot in snapshots:
+                lines.append('%s{topic=%s} %d' % (metric, _prometheus_label(topic), snapshot[name]))
+        for name, _, description in _TopicMetrics.histograms:
+            metric = '%s_%s' % (prefix, name)
+            lines.append('# HELP %s %s' % (metric, description))
+            lines.append('# TYPE %s histogram' % metric)
+            for topic, snapshot in snapshots:
+                histogram, label = snapshot[name], _prometheus_label(topic)
+                for bound, count in histogram['buckets']:
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append('%s_bucket{topic=%s,le="%s"} %d' % (metric, label, le, count))
+                lines.append('%s_sum{topic=%s} %r' % (metric, label, float(histogram['sum'])))
+                lines.append('%s_count{topic=%s} %d' % (metric, label, histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+# Sample views
+
+class SampleView(collections.Mapping):
+    """
+    A read-only dictionary over a sample that is still loaned from the reader.
+    Each member is decoded on first access, so a callback that looks at a few
+    fields of a wide topic skips the rest. Nested structs and sequences are
+    decoded whole when their member is accessed.
+
+    The loan is returned once the listener has handled the take. After that, a
+    view that was not materialized raises Error on access of a member not yet
+    decoded; call `materialize' to keep the sample. See `Topic.subscribe'.
+    """
+    def __init__(self, plan, dd):
+        self._plan   = plan
+        self._dd     = dd
+        self._values = {}
+        self._lock   = threading.Lock()  # decoding vs returning the loan, which may be on another thread
+
+    def __getitem__(self, name):
+        values = self._values
+        if name in values:
+            return values[name]
+        member = self._plan.by_name[name]
+        with self._lock:
+            if name not in values:
+                if self._dd is None:
+                    raise Error('sample view used after its loan was returned')
+                values[name] = member.read(self._dd, name, member.member_id)
+        return values[name]
+
+    def __iter__(self):
+        return (member.name for member in self._plan.members)
+
+    def __len__(self):
+        return len(self._plan.members)
+
+    def __repr__(self):
+        return 'SampleView(%s)' % ', '.join(self._values)
+
+    def materialize(self):
+        """Decodes every member. Returns the sample as a dictionary."""
+        for name in self:
+            self[name]
+        return dict(self._values)
+
+    def _release(self, copy):
+        values = self._values
+        with self._lock:
+            if copy:
+                for member in self._plan.members:
+                    if member.name not in values:
+                        values[member.name] = member.read(self._dd, member.name, member.member_id)
+            self._dd = None
+
+def _compile_where(where, plan):
+    # A `where' predicate over a SampleView: either a callable, or a dictionary of
+    # field -> value (equality) or field -> callable (a test of the field value).
+    if where is None or callable(where):
+        return where
+    if not isinstance(where, collections.Mapping):
+        raise TypeError('where must be a callable or a dictionary')
+    tests = []
+    for name, test in where.iteritems():
+        if name not in plan.by_name:
+            raise ValueError('unknown field: %r' % (name,))
+        if not callable(test):
+            test = (lambda expected: lambda value: value == expected)(test)
+        tests.append((name, test))
+    return lambda sample: all(test(sample[name]) for name, test in tests)
+
+def _release_views(views, copy):
+    # Called once the listener holds no other reference to the views. Those still
+    # alive are referenced from elsewhere (a queued dispatch, a callback that kept
+    # it) and are cut off from the loan, or with copy set materialized first.
+    refs = map(weakref.ref, views)
+    del views[:]
+    for ref in refs:
+        view = ref()
+        if view is not None:
+            view._release(copy)
+
+# Sample metadata and batching
+
+SampleInfo = collections.namedtuple('SampleInfo', [
+    'sample_state',
+    'view_state',
+    'instance_state',
+    'valid_data',
+    'source_timestamp',     # seconds since the epoch (float)
+    'reception_timestamp',  # seconds since the epoch (float)
+    'instance_handle',      # the 16 byte key hash of the instance (str)
+])
+
+def _sample_info(info):
+    return SampleInfo(
+        info.sample_state,
+        info.view_state,
+        info.instance_state,
+        bool(info.valid_data),
+        info.source_timestamp.sec + info.source_timestamp.nanosec * 1e-9,
+        info.reception_timestamp.sec + info.reception_timestamp.nanosec * 1e-9,
+        ctypes.string_at(ctypes.addressof(info.instance_handle), 16),
+    )
+
+class _Batcher(object):
+    """
+    Collects (samples, infos) from each take and hands them to a batch callback
+    through a dispatcher. Without max_latency every take is delivered right away,
+    split into chunks of at most max_batch. With max_latency, takes are
+    coalesced until max_batch samples are pending or the oldest pending sample
+    has waited max_latency seconds.
+
+    Samples are either a list of dictionaries or, for columnar batches, a NumPy
+    structured array; with columns='fields' the array is handed over as a
+    dictionary of per-field arrays.
+    """
+    def __init__(self, callback, dispatcher, key, max_batch=None, max_latency=None, columns=None):
+        if columns not in (None, 'records', 'fields'):
+            raise ValueError('unknown columns layout: %r' % (columns,))
+        if columns is not None:
+            _import_numpy('columnar batches')
+        self._callback    = callback
+        self._dispatcher  = dispatcher
+        self._key         = key
+        self._max_batch   = max_batch
+        self._max_latency = max_latency
+        self.columns      = columns
+        self._pending     = []
+        self._count       = 0
+        self._deadline    = None
+        self._closed      = False
+        self._cond        = threading.Condition(threading.Lock())
+
+        if max_latency is not None:
+            thread = threading.Thread(target=self._flush_on_deadline, name='dds-batch')
+            thread.daemon = True
+            thread.start()
+
+    def _deliver(self, samples, infos):
+        self._dispatcher.dispatch(self._key, self._deliver_batch, (samples, infos))
+
+    def _deliver_batch(self, batch):
+        samples, infos = batch
+        if self.columns == 'fields':
+            samples = dict((name, samples[name]) for name in samples.dtype.names)
+        self._callback(samples, infos)
+
+    def _split(self, samples, infos):
+        max_batch = self._max_batch
+        if not max_batch or len(samples) <= max_batch:
+            return [(samples, infos)]
+        return [(samples[i:i + max_batch], infos[i:i + max_batch]) for i in xrange(0, len(samples), max_batch)]
+
+    def add(self, samples, infos):
+        if self._max_latency is None:
+            for batch in self._split(samples, infos):
+                self._deliver(*batch)
+            return
+
+        ready = []
+        with self._cond:
+            self._pending.append((samples, infos))
+            self._count += len(samples)
+            if self._max_batch and self._count >= self._max_batch:
+                ready = self._split(*self._take_pending())
+                if len(ready[-1][0]) < self._max_batch:
+                    samples, infos = ready.pop()
+                    self._pending.append((samples, infos))
+                    self._count = len(samples)
+            if not self._pending:
+                self._deadline = None
+            elif self._deadline is None or ready:
+                self._deadline = time.time() + self._max_latency
+                self._cond.notify()
+        for batch in ready:
+            self._deliver(*batch)
+
+    def _take_pending(self):
+        pending = self._pending
+        self._pending, self._count, self._deadline = [], 0, None
+        if not pending:
+            return None, None
+        if len(pending) == 1:
+            return pending[0]
+        infos = [info for _, chunk in pending for info in chunk]
+        if self.columns is None:
+            return [sample for chunk, _ in pending for sample in chunk], infos
+        return numpy.concatenate([chunk for chunk, _ in pending]), infos
+
+    def _flush_on_deadline(self):
+        while True:
+            with self._cond:
+                while not self._closed and (self._deadline is None or self._deadline > time.time()):
+                    if self._deadline is None:
+                        self._cond.wait()
+                    else:
+                        self._cond.wait(self._deadline - time.time())
+                if self._closed:
+                    return
+                samples, infos = self._take_pending()
+            if samples is not None:
+                self._deliver(samples, infos)
+
+    def close(self):
+        """Stops the deadline thread and delivers anything still pending."""
+        with self._cond:
+            self._closed = True
+            samples, infos = self._take_pending()
+            self._cond.notify()
+        if samples is not None:
+            self._deliver(samples, infos)
+
+# Streams
+
+class Stream(object):
+    """
+    A subscription that queues samples instead of calling back. Made with
+    `Topic.stream'. The DDS listener thread puts samples on a bounded queue and
+    the consumer takes them off, either by iterating from its own thread:
+
+        for sample in topic.stream():
+            ...
+
+    or from an event loop, with `on_samples'. Iteration ends once the stream is
+    closed and the queued samples have been consumed.
+    """
+    def __init__(self, dds, max_queue, overflow):
+        self._dds          = dds
+        self._queue        = _BoundedQueue(max_queue, overflow)
+        self._lock         = threading.Lock()
+        self._schedule     = None
+        self._callback     = None
+        self._scheduled    = False
+        self._subscription = None
+
+    def _put(self, data):
+        self._queue.put(data)
+        if self._schedule is None:
+            return
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._dds._get_waker().dispatch(None, self._schedule, self._deliver)
+
+    def _deliver(self):
+        with self._lock:
+            self._scheduled = False
+        samples = self._queue.drain()
+        if samples:
+            self._callback(samples)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        data = self._queue.get()
+        if data is None:
+            raise StopIteration
+        return data
+
+    def get(self, timeout=None):
+
+        """
+        Takes the next sample off the stream, waiting for one if necessary.
+
+        Parameters:
+            timeout (Float) Optional. The most seconds to wait. Waits forever if not given.
+
+        Returns:
+            (Dict) The sample, or None on timeout or if the stream is closed.
+        """
+
+        return self._queue.get(timeout)
+
+    def drain(self):
+
+        """
+        Takes every queued sample off the stream without waiting.
+
+        Returns:
+            ([Dict]) The samples, oldest first.
+        """
+
+        return self._queue.drain()
+
+    def on_samples(self, callback, schedule):
+
+        """
+        Delivers samples to an event loop. Whenever samples arrive, the waker thread
+        of the DDS instance calls `schedule' with a function that, run on the loop,
+        drains the stream and calls `callback' with the list of samples. Only one
+        delivery is scheduled at a time, so while the loop is busy samples collect
+        in the queue and the overflow policy of the stream applies.
+
+        Parameters:
+            callback (function) Called on the loop with a list of samples.
+            schedule (function) Runs a function on the loop from another thread, e.g.
+                                `loop.call_soon_threadsafe', `reactor.callFromThread'
+                                or `io_loop.add_callback'.
+        """
+
+        with self._lock:
+            self._callback = callback
+            self._schedule = schedule
+            pending = len(self._queue) and not self._scheduled
+            if pending:
+                self._scheduled = True
+        if pending:
+            self._dds._get_waker().dispatch(None, schedule, self._deliver)
+
+    def stats(self):
+        """Returns the queue_depth, high_water, enqueued and dropped counters of the stream."""
+        queue = self._queue
+        return {'queue_depth': len(queue), 'high_water': queue.high_water, 'enqueued': queue.enqueued, 'dropped': queue.dropped}
+
+    def close(self):
+        """Cancels the subscription. Samples already queued can still be consumed."""
+        if self._subscription is not None:
+            self._subscription.unsubscribe()
+            self._subscription = None
+        self._queue.close()
+
+# Instance cache
+
+def _key_tuple(keys, key):
+    # The key of an instance as a tuple of key field values, from a sample
+    # dictionary, a tuple, or a single value for topics with one key field.
+    if isinstance(key, collections.Mapping):
+        return tuple(key[name] for name in keys)
+    if isinstance(key, tuple):
+        return key
+    return (key,)
+
+def _handle_bytes(handle):
+    return ctypes.string_at(ctypes.addressof(handle), 16)
+
+class InstanceCache(object):
+    """
+    The most recent sample of every instance of a topic, kept up to date by the
+    topic's listener. Made with `Topic.cache'. Instances are looked up by their
+    key, i.e. the values of the key fields in the order the topic declares them
+    (a tuple, a single value for topics with one key field, or a sample
+    dictionary), or by their DDS instance handle (as in SampleInfo). Disposed
+    instances are removed.
+
+    Reads may come from any thread; they take the cache's lock, since an update
+    moves its instance to the end of the eviction order by removing and
+    re-inserting it. The samples handed out are shared with the cache; treat
+    them as read-only.
+
+    Parameters:
+        keys          ([String]) The key fields of the topic.
+        max_instances (Integer)  Optional. The most instances kept. Once full, the
+                                 instance updated least recently is evicted.
+    """
+    def __init__(self, keys, max_instances=None):
+        self.keys           = list(keys)
+        self._max_instances = max_instances
+        self._by_key        = collections.OrderedDict()  # key -> (handle, sample), oldest update first
+        self._by_handle     = {}
+        self._lock          = threading.Lock()
+        self.evicted        = 0
+
+    def _key_of(self, key):
+        return _key_tuple(self.keys, key)
+
+    def _update(self, sample, info):
+        handle = _handle_bytes(info.instance_handle)
+        with self._lock:
+            key = self._by_handle.get(handle)
+            if key is None:
+                key = self._key_of(sample)
+            if info.instance_state == DDS_NOT_ALIVE_DISPOSED_INSTANCE_STATE:
+                if self._by_key.pop(key, None) is not None:
+                    del self._by_handle[handle]
+            elif info.valid_data:
+                self._by_key.pop(key, None)
+                self._by_key[key] = (handle, sample)
+                self._by_handle[handle] = key
+                if self._max_instances and len(self._by_key) > self._max_instances:
+                    old_handle, _ = self._by_key.popitem(last=False)[1]
+                    del self._by_handle[old_handle]
+                    self.evicted += 1
+
+    def get(self, key, default=None):
+
+        """
+        Returns the latest sample of an instance.
+
+        Parameters:
+            key     (Tuple, Dict or value) The key of the instance.
+            default (Object)               Optional. Returned if the instance is not cached.
+        """
+
+        key = self._key_of(key)
+        with self._lock:
+            entry = self._by_key.get(key)
+        return default if entry is None else entry[1]
+
+    def get_by_handle(self, handle, default=None):
+        """Like `get', with the 16 byte instance handle from SampleInfo.instance_handle."""
+        with self._lock:
+            entry = self._by_key.get(self._by_handle.get(handle))
+        return default if entry is None else entry[1]
+
+    def snapshot(self):
+        """Returns a dictionary of every cached instance: key -> latest sample."""
+        with self._lock:
+            return dict((key, entry[1]) for key, entry in self._by_key.iteritems())
+
+    def __getitem__(self, key):
+        key = self._key_of(key)
+        with self._lock:
+            return self._by_key[key][1]
+
+    def __contains__(self, key):
+        key = self._key_of(key)
+        with self._lock:
+            return key in self._by_key
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_key)
+
+    def clear(self):
+        with self._lock:
+            self._by_key.clear()
+            self._by_handle.clear()
+
+# Status events
+#
+# Every reader and writer is made with a listener for its communication
+# statuses (data available is only listened for while there are
+# subscriptions). The topic counts them, and hands each one to the callbacks
+# given to `subscribe_status' through their dispatchers, as it does samples.
+
+READER_STATUSES = ('sample_lost', 'sample_rejected', 'requested_deadline_missed',
+                   'requested_incompatible_qos', 'subscription_matched', 'liveliness_changed')
+WRITER_STATUSES = ('offered_deadline_missed', 'offered_incompatible_qos', 'publication_matched', 'liveliness_lost')
+
+_status_masks = {
+    'sample_lost':                DDS_SAMPLE_LOST_STATUS,
+    'sample_rejected':            DDS_SAMPLE_REJECTED_STATUS,
+    'requested_deadline_missed':  DDS_REQUESTED_DEADLINE_MISSED_STATUS,
+    'requested_incompatible_qos': DDS_REQUESTED_INCOMPATIBLE_QOS_STATUS,
+    'subscription_matched':       DDS_SUBSCRIPTION_MATCHED_STATUS,
+    'liveliness_changed':         DDS_LIVELINESS_CHANGED_STATUS,
+    'offered_deadline_missed':    DDS_OFFERED_DEADLINE_MISSED_STATUS,
+    'offered_incompatible_qos':   DDS_OFFERED_INCOMPATIBLE_QOS_STATUS,
+    'publication_matched':        DDS_PUBLICATION_MATCHED_STATUS,
+    'liveliness_lost':            DDS_LIVELINESS_LOST_STATUS,
+}
+
+StatusEvent = collections.namedtuple('StatusEvent', [
+    'topic',   # the name of the topic
+    'kind',    # one of READER_STATUSES or WRITER_STATUSES
+    'status',  # the DDS status as a dictionary, e.g. total_count (instance handles are 16 byte strs)
+])
+
+def _status_dict(status):
+    res = {}
+    for name, _ in status._fields_:
+        value = getattr(status, name)
+        if isinstance(value, DDSType.InstanceHandle_t):
+            value = _handle_bytes(value)
+        res[name] = value
+    return res
+
+def _status_listener(listener_type, kinds, on_status):
+    # A listener calling on_status(kind, status dictionary) for each of `kinds', and its status mask.
+    listener, mask = listener_type(), 0
+    callback_types = dict(listener_type._fields_)
+    for kind in kinds:
+        def callback(listener_data, entity, status, kind=kind):
+            try:
+                on_status(kind, _status_dict(status.contents))
+            except Exception:
+                traceback.print_exc()
+        setattr(listener, 'on_' + kind, callback_types['on_' + kind](callback))
+        mask |= _status_masks[kind]
+    return listener, mask
+
+# Subscriptions
+
+class Subscription(object):
+    """
+    One subscriber's callbacks on a topic, made by `Topic.subscribe'. All the
+    subscriptions on a topic share its DataReader: each sample is taken and
+    decoded once and handed to every subscription, so the dictionaries passed
+    to callbacks may be shared between subscribers and should be treated as
+    read-only.
+
+    Attributes not found on the subscription are looked up on the topic it was
+    made on, so it can be used in place of that topic.
+    """
+    def __init__(self, topic, callback, instance_revoked_cb=None, liveliness_lost_cb=None, dispatcher=None,
+                 lazy=False, where=None, fields=None, send_topic_info=False):
+        self.topic               = topic
+        self.callback            = callback
+        self.instance_revoked_cb = instance_revoked_cb
+        self.liveliness_lost_cb  = liveliness_lost_cb
+        self.dispatcher          = dispatcher
+        self.lazy                = lazy
+        self.where               = where
+        self.fields              = fields
+        self.send_topic_info     = send_topic_info
+
+    def unsubscribe(self):
+        """Cancels this subscription. Other subscriptions on the topic are not affected."""
+        self.topic._remove_subscription(self)
+
+    def __getattr__(self, attr):
+        return getattr(self.topic, attr)
+
+class BatchSubscription(object):
+    """
+    A batch callback on a topic, made by `Topic.subscribe_batch'. Attributes not
+    found on the subscription are looked up on its topic, as for Subscription.
+    """
+    def __init__(self, topic, batcher):
+        self.topic    = topic
+        self._batcher = batcher
+
+    def unsubscribe(self):
+        """Cancels this batch subscription, delivering any batch still pending."""
+        self.topic._remove_batcher(self._batcher)
+
+    def __getattr__(self, attr):
+        return getattr(self.topic, attr)
+
+class StatusSubscription(object):
+    """
+    A callback for the status events of a topic, made by `Topic.subscribe_status'.
+    """
+    def __init__(self, topic, callback, kinds, dispatcher):
+        self.topic      = topic
+        self.callback   = callback
+        self.kinds      = kinds
+        self.dispatcher = dispatcher
+
+    def unsubscribe(self):
+        """Cancels this status subscription."""
+        self.topic._remove_status_subscription(self)
+
+_outside_refs = set()
+_refs = set()
+_instances = weakref.WeakSet()  # every DDS instance, for DDS.close_all
+_filtered_topic_refs = {}
+
+def _delete_entities(dds, entities, closed=False):
+    # The reader and writer of a topic, if they were ever made. Once the DDS
+    # instance is closed they have been deleted with the participant.
+    if not closed:
+        if 'writer' in entities:
+            dds._publisher.delete_datawriter(entities['writer'])
+        if 'reader' in entities:
+            dds._subscriber.delete_datareader(entities['reader'])
+    entities.clear()
+
+def _release_resources(resources, support):
+    # The WaitSet and the reusable samples a topic creates on first use.
+    if 'waitset' in resources:
+        resources['waitset'].detach_condition(resources['condition'])
+        resources['waitset'].delete()
+    for name in ('take_sample', 'template', 'publish_sample'):
+        if name in resources:
+            support.delete_data(resources[name])
+    resources.clear()
+
+def _duration(timeout):
+    if timeout is None:
+        return DDSType.Duration_t(DDS_DURATION_INFINITE_SEC, DDS_DURATION_INFINITE_NSEC)
+    sec = int(timeout)
+    return DDSType.Duration_t(sec, int((timeout - sec) * 1e9))
+
+class TopicSuper(object):
+    def __init__(self, dds, name, data_type, related_topic=None, filter_expression=None, _base_topic=None,
+                 reader_profile=None, writer_profile=None):
+        self._dds = dds
+        self.name = name
+        self.data_type = data_type
+        self._related_topic = related_topic
+        self._filter_expression = filter_expression
+        self._data_seq = None
+        self._info_seq = None
+        self._base_topic = _base_topic  # This is to prevent the base topic getting garbage collected for filtered topic.
+        self._reader_profile = reader_profile  # (library, profile) or None for DATAREADER_QOS_DEFAULT
+        self._writer_profile = writer_profile  # (library, profile) or None for DATAWRITER_QOS_DEFAULT
+
+        self._plan = self.data_type._get_plan()
+        self._support, self._type_name = support, type_name = dds._register_type(data_type)
+
+        self._topic  = topic      = self._create_topic()
+        self._listener            = None
+
+        # The reader and writer are made on first use (see `_writer' and `_reader'), so
+        # a topic that is only published to or only subscribed to has just the one.
+        self._entities = entities     = {}
+        self._entities_lock           = threading.Lock()
+        self._subscriptions           = []  # replaced, not mutated, so the listener can iterate it unlocked
+        self._subscriptions_lock      = threading.Lock()
+        self._status_subscriptions    = []  # replaced, not mutated, as _subscriptions
+        self._status_counts           = dict.fromkeys(READER_STATUSES + WRITER_STATUSES, 0)
+        self._batchers                = []  # replaced, not mutated, as _subscriptions
+        self._cache                   = None
+        self._poll_lock               = threading.Lock()
+        self._publish_lock            = threading.Lock()
+        self._resources = resources   = {}
+        self._handles                 = collections.OrderedDict()  # key tuple -> (handle, key dict)
+        self._handle_keys             = {}  # handle bytes -> key dict
+        self.max_registered_instances = None
+
+        key = id(self)  # this topic's entry in _filtered_topic_refs
+        released = []
+
+        def _release():
+            # Frees the topic and its filtered topics, either when it is collected or
+            # when its DDS instance is closed. In the latter case the DDS entities are
+            # deleted with the participant, so only what lives outside them is freed.
+            if type(topic) is not ctypes.POINTER(DDSType.Topic):
+                return
+            with dds._close_lock:
+                if released:
+                    return
+                released.append(True)
+                closed = dds.closed
+                _release_resources(resources, support)
+                _delete_entities(dds, entities, closed)
+                for ft in _filtered_topic_refs.pop(key, ()):
+                    _release_resources(ft._resources, ft._support)
+                    _delete_entities(dds, ft._entities, closed)
+                    if not closed:
+                        dds._participant.delete_contentfilteredtopic(ft._topic)
+                        dds._unregister_type(ft._type_name)
+                    if ft.filter_parameters:
+                        ft._filter_params.finalize()
+                        ft.filter_parameters = None
+                if not closed:
+                    dds._participant.delete_topic(topic)
+                    dds._unregister_type(type_name)
+        self._release = _release
+
+        def _cleanup(ref):
+            _release()
+            _refs.remove(ref)
+
+        self._keys = list(self._plan.keys)
+
+        _refs.add(weakref.ref(self, _cleanup))
+
+    @property
+    def dtype(self):
+        """The NumPy dtype of columnar batches of this topic (see `subscribe_batch')."""
+        return self._plan.columns().dtype
+
+    def _topic_metrics(self):
+        # Where to record this topic's metrics, or None (the usual case) if they are off.
+        metrics = self._dds.metrics
+        return None if metrics is None else metrics._topic(self.name)
+
+    def enable_metrics(self):
+
+        """
+        Starts collecting metrics for this topic's name, in addition to any other
+        topics they are collected for (see DDS.enable_metrics).
+
+        Returns:
+            (Metrics) The metrics of this topic's DDS instance.
+        """
+
+        return self._dds.enable_metrics([self.name])
+
+    def metrics(self):
+
+        """
+        Returns the metrics of this topic's name (see Metrics.snapshot), or None if
+        they are not being collected.
+        """
+
+        metrics = self._topic_metrics()
+        return None if metrics is None else metrics.snapshot()
+
+    @property
+    def arrays(self):
+        """
+        Whether sequences and arrays of primitives in received samples are
+        array.arrays (str for octets and chars, unicode for wchars) rather than
+        lists. False by default; set it before subscribing. Publishing accepts
+        lists, array.arrays, strings and NumPy arrays either way.
+        """
+        return self._plan.arrays
+
+    @arrays.setter
+    def arrays(self, value):
+        self._plan = self.data_type._get_plan(bool(value))
+
+    def _create_topic(self):
+        raise NotImplementedError("You must make an instance of a subclass that implements this method")
+
+    def _create_writer(self, listener, mask):
+        raise NotImplementedError("You must make an instance of a subclass that implements this method")
+
+    def _create_reader(self, listener, mask):
+        if self._reader_profile is not None:
+            library, profile = self._reader_profile
+            return self._dds._subscriber.create_datareader_with_profile(
+                self._topic.as_topicdescription(),
+                library,
+                profile,
+                listener,
+                mask,
+            )
+        return self._dds._subscriber.create_datareader(
+            self._topic.as_topicdescription(),
+            get('DATAREADER_QOS_DEFAULT', DDSType.DataReaderQos),
+            listener,
+            mask,
+        )
+
+    @property
+    def qos_profiles(self):
+
+        """
+        The QoS profiles this topic's reader and writer are created with.
+
+        Returns: (Dictionary) {'reader': (library, profile), 'writer': (library, profile)}, with
+                              None for an entity that uses the default QoS
+        """
+
+        return {'reader': self._reader_profile, 'writer': self._writer_profile}
+
+    def _entity(self, name):
+        entities = self._entities
+        if name not in entities:
+            with self._entities_lock:
+                if name not in entities:
+                    if self._dds.closed:
+                        raise Error('the DDS instance is closed')
+                    # The listeners must not keep the topic alive.
+                    ref = weakref.ref(self)
+
+                    def on_status(kind, status):
+                        topic = ref()
+                        if topic is not None:
+                            topic._on_status(kind, status)
+
+                    if name == 'writer':
+                        listener, mask = _status_listener(DDSType.DataWriterListener, WRITER_STATUSES, on_status)
+                        writer = self._create_writer(listener, mask)
+                        entities['writer_listener'] = listener
+                        entities['dyn_writer'] = DDSFunc.DynamicDataWriter_narrow(writer)
+                        entities['writer'] = writer
+                    else:
+                        listener, mask = _status_listener(DDSType.DataReaderListener, READER_STATUSES, on_status)
+                        reader = self._create_reader(listener, mask)
+                        entities['reader_listener'] = (listener, mask)
+                        entities['dyn_reader'] = DDSFunc.DynamicDataReader_narrow(reader)
+                        entities['reader'] = reader
+        return entities[name]
+
+    @property
+    def _writer(self):
+        return self._entity('writer')
+
+    @property
+    def _dyn_narrowed_writer(self):
+        self._entity('writer')
+        return self._entities['dyn_writer']
+
+    @property
+    def _reader(self):
+        return self._entity('reader')
+
+    @property
+    def _dyn_narrowed_reader(self):
+        self._entity('reader')
+        return self._entities['dyn_reader']
+
+    def _enable_listener(self):
+        # Adds data available to the reader's status listener.
+        assert self._listener is None
+        reader = self._reader
+        listener, mask = self._entities['reader_listener']
+        self._cfunctype_data_available = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(DDSType.DataReader))(self._on_data_available)
+        listener.on_data_available = self._cfunctype_data_available
+        reader.set_listener(listener, mask | DATA_AVAILABLE_STATUS)
+        self._listener = listener
+        _outside_refs.add(self) # really want self._listener, but this does the same thing
+
+    def _disable_listener(self):
+        assert self._listener is not None
+        listener, mask = self._entities['reader_listener']
+        listener.on_data_available = type(self._cfunctype_data_available)()
+        self._reader.set_listener(listener, mask)
+        self._listener = None
+        if self in _outside_refs and not self._status_subscriptions:
+            _outside_refs.remove(self)
+
+    def _on_status(self, kind, status):
+        # A status listener callback of the reader or the writer.
+        counts = self._status_counts
+        counts[kind] = status['total_count'] if 'total_count' in status else counts[kind] + 1
+        subscriptions = self._status_subscriptions
+        if subscriptions:
+            event = StatusEvent(self.name, kind, status)
+            for subscription in subscriptions:
+                if subscription.kinds is None or kind in subscription.kinds:
+                    # keyed by kind, so events of one kind keep their order
+                    subscription.dispatcher.dispatch((self.name, kind), subscription.callback, event)
+
+    def subscribe_status(self, callback, kinds=None, dispatcher=None):
+
+        """
+        Calls `callback' with a StatusEvent each time a communication status of this
+        topic's reader or writer changes, e.g. when samples are lost or rejected, a
+        deadline is missed, QoS is incompatible or a remote entity (un)matches.
+        Events go through a dispatcher like samples, sharing its workers and queue
+        limits. Events of one kind run in order, but on a keyed dispatcher they are
+        not ordered with the samples, which are queued by instance; use the 'inline'
+        dispatcher if that matters. Only a reader or writer that exists has
+        statuses; they are made when the topic is first subscribed to, polled
+        or published to.
+
+        Parameters:
+            callback   (function) Called with a StatusEvent.
+            kinds      ([String]) Optional. Only these kinds of event (see READER_STATUSES
+                                  and WRITER_STATUSES). All if not given.
+            dispatcher (String or Dispatcher) Optional. Where the callback runs, as for `subscribe'.
+
+        Returns:
+            (StatusSubscription) Call its `unsubscribe' to cancel.
+        """
+
+        if kinds is not None:
+            kinds = frozenset(kinds)
+            unknown = kinds.difference(READER_STATUSES + WRITER_STATUSES)
+            if unknown:
+                raise ValueError('unknown status kinds: %s' % ', '.join(sorted(unknown)))
+        subscription = StatusSubscription(self, callback, kinds, self._dds._get_dispatcher(dispatcher))
+        with self._subscriptions_lock:
+            self._status_subscriptions = self._status_subscriptions + [subscription]
+        _outside_refs.add(self)
+        return subscription
+
+    def _remove_status_subscription(self, subscription):
+        with self._subscriptions_lock:
+            self._status_subscriptions = [s for s in self._status_subscriptions if s is not subscription]
+        if not self._status_subscriptions and self._listener is None and self in _outside_refs:
+            _outside_refs.remove(self)
+
+    def status_counts(self):
+
+        """
+        Returns the cumulative number of each kind of status event of this topic's
+        reader and writer, as a dictionary of kind -> count (see READER_STATUSES and
+        WRITER_STATUSES). These are the DDS total_count of the status, e.g. the
+        number of samples lost or of matches made, except for liveliness_changed,
+        which counts the changes.
+        """
+
+        return dict(self._status_counts)
+
+    def add_data_available_callback(self, cb):
+        '''Warning: callback is called back in another thread!'''
+        return self._add_subscription(Subscription(self, cb, dispatcher=self._dds._dispatcher))
+
+    def _add_subscription(self, subscription):
+        with self._subscriptions_lock:
+            self._subscriptions = self._subscriptions + [subscription]
+        if self._listener is None:
+            self._enable_listener()
+        return subscription
+
+    def _remove_subscription(self, subscription):
+        with self._subscriptions_lock:
+            self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+        if self._listener and not self._subscriptions and not self._batchers and self._cache is None:
+            self._disable_listener()
+
+    def _remove_batcher(self, batcher):
+        with self._subscriptions_lock:
+            self._batchers = [b for b in self._batchers if b is not batcher]
+        batcher.close()
+        if self._listener and not self._subscriptions and not self._batchers and self._cache is None:
+            self._disable_listener()
+
+    def unsubscribe(self, topic=None):
+
+        """
+        Cancels a subscription made with `subscribe', `subscribe_batch' or
+        `subscribe_status'. Given a topic instead, cancels every subscription,
+        status subscription, batch subscription and cache on it.
+
+        Parameters:
+            topic (Subscription or Topic) Optional. The subscription to cancel, as returned
+                                          by `subscribe', `subscribe_batch' or `subscribe_status',
+                                          or the topic to cancel everything on. Defaults to self.
+        """
+        if not topic: topic = self
+        if isinstance(topic, (Subscription, BatchSubscription, StatusSubscription)):
+            topic.unsubscribe()
+            return
+        with topic._subscriptions_lock:
+            topic._subscriptions = []
+            topic._status_subscriptions = []
+            batchers, topic._batchers = topic._batchers, []
+        if topic._listener:
+            topic._disable_listener()
+        elif topic in _outside_refs:
+            _outside_refs.remove(topic)
+        for batcher in batchers:
+            batcher.close()
+        topic._cache = None
+
+    def _on_data_available(self, listener_data, datareader):
+        if not self._data_seq:
+            self._data_seq = DDSType.DynamicDataSeq()
+        self._data_seq.initialize()
+        if not self._info_seq:
+            self._info_seq = DDSType.SampleInfoSeq()
+        self._info_seq.initialize()
+        views = []
+        metrics = self._topic_metrics()
+
+        try:
+            self._dyn_narrowed_reader.take(
+                ctypes.byref(self._data_seq),
+                ctypes.byref(self._info_seq),
+                DDS_LENGTH_UNLIMITED,
+                get('ANY_SAMPLE_STATE', DDS_SampleStateMask),
+                get('ANY_VIEW_STATE', DDS_ViewStateMask),
+                get('ANY_INSTANCE_STATE', DDS_InstanceStateMask)
+            )
+
+            subscriptions = self._subscriptions
+            batchers = self._batchers
+            cache = self._cache
+            data = view = source = None
+            length = self._data_seq.get_length()
+            # Batch subscriptions get the take as dictionaries, as columns, or both.
+            batch, batch_infos = [], []
+            records = fill_row = None
+            dicts = any(b.columns is None for b in batchers)
+            unpack = self._plan.unpack
+            if any(b.columns is not None for b in batchers):
+                columns = self._plan.columns()
+                fill_row = columns.fill_row
+                records = columns.empty(length)
+                base, itemsize = records.ctypes.data, records.dtype.itemsize
+            if metrics is not None:
+                unpack_times, latencies = [], []
+                unpack = _timed(unpack, unpack_times)
+                if fill_row is not None:
+                    fill_row = _timed(fill_row, unpack_times)
+
+            for i in xrange(length):
+                info = self._info_seq.get_reference(i).contents
+                sample = self._data_seq.get_reference(i)
+                if metrics is not None and info.valid_data:
+                    latencies.append(info.reception_timestamp.sec - info.source_timestamp.sec +
+                                     (info.reception_timestamp.nanosec - info.source_timestamp.nanosec) * 1e-9)
+
+                state = info.instance_state
+                alive = state == DDS_ALIVE_INSTANCE_STATE and info.valid_data
+                if state == DDS_NOT_ALIVE_DISPOSED_INSTANCE_STATE:
+                    callbacks = [(s, s.instance_revoked_cb) for s in subscriptions if s.instance_revoked_cb is not None]
+                elif state == DDS_NOT_ALIVE_NO_WRITERS_INSTANCE_STATE:
+                    callbacks = [(s, s.liveliness_lost_cb) for s in subscriptions if s.liveliness_lost_cb is not None]
+                elif alive:
+                    callbacks = [(s, s.callback) for s in subscriptions if s.callback is not None]
+                else:
+                    callbacks = ()
+
+                if not callbacks and not batchers and cache is None:
+                    continue
+
+                # samples without valid data only carry the key of their instance
+                if not info.valid_data:
+                    self._dyn_narrowed_reader.get_key_value(sample, ctypes.byref(info.instance_handle))
+
+                value = None
+                if batchers:
+                    if records is not None:
+                        row = len(batch_infos)
+                        fill_row(sample, records, row, base + row * itemsize)
+                    if dicts:
+                        value = unpack(sample)
+                        batch.append(value)
+                    batch_infos.append(_sample_info(info))
+
+                if cache is not None:
+                    if value is None:
+                        value = unpack(sample)
+                    cache._update(value, info)
+
+                # The sample is decoded at most once, whatever the number of subscriptions:
+                # `value' is the full dictionary and `view' a SampleView, which `where',
+                # `fields' and lazy subscriptions work off so only the fields they use
+                # are decoded.
+                key = None
+                for subscription, callback in callbacks:
+                    selective = alive and (subscription.where is not None or subscription.fields is not None)
+                    if subscription.lazy or selective:
+                        if value is not None and not subscription.lazy:
+                            source = value
+                        else:
+                            if view is None:
+                                view = SampleView(self._plan, sample)
+                                views.append(view)
+                            source = view
+                        if selective and subscription.where is not None:
+                            try:
+                                if not subscription.where(source):
+                                    continue
+                            except Exception:
+                                traceback.print_exc()
+                                continue
+
+                    if subscription.lazy:
+                        data = view
+                    elif selective and subscription.fields is not None:
+                        data = dict((name, source[name]) for name in subscription.fields)
+                    else:
+                        if value is None:
+                            value = view.materialize() if view is not None else unpack(sample)
+                        data = value
+
+                    # callbacks for one instance share a key so keyed dispatchers keep them in order
+                    dispatcher = subscription.dispatcher
+                    if dispatcher.keyed and key is None:
+                        key = (self.name, ctypes.string_at(ctypes.addressof(info.instance_handle), 16))
+                    if subscription.send_topic_info:
+                        data = {'name': self._type_name, 'data': data, 'keys': self._keys}
+
+                    if metrics is not None:
+                        callback = metrics._timed_callback(callback)
+                    dispatcher.dispatch(key, callback, data)
+                    data = source = None
+                view = None
+
+            if batch_infos:
+                count = len(batch_infos)
+                for batcher in batchers:
+                    samples = batch if batcher.columns is None else records
+                    batcher.add(samples[:count], batch_infos[:])
+            if metrics is not None:
+                metrics._taken(length, unpack_times, latencies)
+
+        except NoDataError:
+            return
+
+        finally:
+            if views:
+                data = view = source = None
+                _release_views(views, any(s.lazy == 'copy' for s in self._subscriptions))
+            self._dyn_narrowed_reader.return_loan(ctypes.byref(self._data_seq), ctypes.byref(self._info_seq))
+            self._data_seq.finalize()
+            self._info_seq.finalize()
+
+    # Polling. These let the application thread pull data itself instead of
+    # subscribing. Don't mix them with a subscription on the same topic: the
+    # listener takes the data before a poll can see it.
+
+    def wait(self, timeout=None):
+
+        """
+        Blocks until this topic's reader has data available. Only one thread at
+        a time may wait on a topic.
+
+        Parameters:
+            timeout (Float) Optional. The most seconds to wait. Waits forever if not given.
+
+        Returns:
+            (Boolean) True if data is available, False if the timeout expired.
+        """
+
+        resources = self._resources
+        if 'waitset' not in resources:
+            with self._poll_lock:
+                if 'waitset' not in resources:
+                    condition = DDSFunc.Entity_get_statuscondition(ctypes.cast(self._reader, ctypes.POINTER(DDSType.Entity)))
+                    condition.set_enabled_statuses(DDS_DATA_AVAILABLE_STATUS)
+                    waitset = DDSFunc.WaitSet_new()
+                    resources['condition'] = ctypes.cast(condition, ctypes.POINTER(DDSType.Condition))
+                    waitset.attach_condition(resources['condition'])
+                    resources['waitset'] = waitset
+
+        condition_seq = DDSType.ConditionSeq()
+        condition_seq.initialize()
+        try:
+            resources['waitset'].wait(ctypes.byref(condition_seq), ctypes.byref(_duration(timeout)))
+        except TimeoutError:
+            return False
+        finally:
+            condition_seq.finalize()
+        return True
+
+    def _poll_samples(self, take, max_samples, info):
+        data_seq = DDSType.DynamicDataSeq()
+        info_seq = DDSType.SampleInfoSeq()
+        data_seq.initialize()
+        info_seq.initialize()
+
+        try:
+            take(
+                ctypes.byref(data_seq),
+                ctypes.byref(info_seq),
+                DDS_LENGTH_UNLIMITED if max_samples is None else max_samples,
+                get('ANY_SAMPLE_STATE', DDS_SampleStateMask),
+                get('ANY_VIEW_STATE', DDS_ViewStateMask),
+                get('ANY_INSTANCE_STATE', DDS_InstanceStateMask)
+            )
+        except NoDataError:
+            return []
+
+        try:
+            res = []
+            for i in xrange(data_seq.get_length()):
+                sample_info = info_seq.get_reference(i).contents
+                sample = data_seq.get_reference(i)
+                if not sample_info.valid_data:
+                    if not info:
+                        continue
+                    self._dyn_narrowed_reader.get_key_value(sample, ctypes.byref(sample_info.instance_handle))
+                data = self._plan.unpack(sample)
+                res.append((data, _sample_info(sample_info)) if info else data)
+            return res
+        finally:
+            self._dyn_narrowed_reader.return_loan(ctypes.byref(data_seq), ctypes.byref(info_seq))
+            data_seq.finalize()
+            info_seq.finalize()
+
+    def take(self, max_samples=None, info=False):
+
+        """
+        Takes the samples currently held by this topic's reader without blocking.
+        Taken samples are removed from the reader.
+
+        Parameters:
+            max_samples (Integer) Optional. The most samples to take. Takes all if not given.
+            info        (Boolean) Optional. If True, return (sample, SampleInfo) pairs and
+                                  include samples without valid data (disposed instances,
+                                  instances without writers) with only their key fields set.
+
+        Returns:
+            ([Dict]) The samples, oldest first. Empty if there is no data.
+        """
+
+        return self._poll_samples(self._dyn_narrowed_reader.take, max_samples, info)
+
+    def read(self, max_samples=None, info=False):
+
+        """
+        Like `take', but leaves the samples in the reader so later reads (or takes)
+        see them again.
+        """
+
+        return self._poll_samples(self._dyn_narrowed_reader.read, max_samples, info)
+
+    def take_next(self, info=False):
+
+        """
+        Takes the next sample not yet seen by `read' or `take' from this topic's
+        reader, without blocking.
+
+        Parameters:
+            info (Boolean) Optional. If True, return a (sample, SampleInfo) pair and do not
+                           skip samples without valid data.
+
+        Returns:
+            (Dict) The sample, or None if there is no data.
+        """
+
+        sample_info = DDSType.SampleInfo()
+        with self._poll_lock:
+            reader = self._dyn_narrowed_reader  # raises if the DDS instance is closed
+            resources = self._resources
+            if 'take_sample' not in resources:
+                resources['take_sample'] = self._create_data()
+            sample = resources['take_sample']
+
+            while True:
+                try:
+                    reader.take_next_sample(sample, ctypes.byref(sample_info))
+                except NoDataError:
+                    return None
+                if sample_info.valid_data:
+                    break
+                if info:
+                    reader.get_key_value(sample, ctypes.byref(sample_info.instance_handle))
+                    break
+
+            data = self._plan.unpack(sample)
+        return (data, _sample_info(sample_info)) if info else data
+
+    def _create_data(self):
+        # The TypeSupport is deleted when the DDS instance is closed, and the
+        # topic's resources cleared, so they must not be made again afterwards.
+        if self._dds.closed:
+            raise Error('the DDS instance is closed')
+        return self._support.create_data()
+
+    def _publish_sample(self, data, key=None):
+        # Resets the reused publish sample to the default instance and writes just
+        # the fields given in `key' and `data'. Call with the publish lock held.
+        resources = self._resources
+        if 'template' not in resources:
+            resources['template'] = self._create_data()
+            resources['publish_sample'] = self._create_data()
+        sample = resources['publish_sample']
+        sample.copy(resources['template'])
+        if key is not None:
+            self._plan.patch(key, sample)
+        self._plan.patch(data, sample)
+        return sample
+
+    def _registered_key(self, handle):
+        key = self._handle_keys.get(_handle_bytes(handle))
+        if key is None:
+            raise Error('instance is not registered')
+        return key
+
+    def register_instance(self, key):
+
+        """
+        Registers an instance of this topic with its writer and returns the
+        instance handle. Publishing or disposing with the handle saves DDS from
+        hashing the key fields on every write, and the key fields may then be left
+        out of the data. Registering a key again returns the same handle.
+
+        Registrations are kept until `unregister_instance' or until the topic is
+        gone. If `max_registered_instances' is set on the topic, registering past
+        it unregisters the oldest registration.
+
+        Parameters:
+            key (Dict, Tuple or value) The key fields of the instance: a dictionary,
+                                       a tuple of their values in declaration order,
+                                       or the value of the only key field.
+
+        Returns:
+            handle (InstanceHandle_t) The handle to pass to `publish' and `dispose'.
+        """
+
+        key_tuple = _key_tuple(self._keys, key)
+        if len(key_tuple) != len(self._keys):
+            raise ValueError('expected %d key values, got %d' % (len(self._keys), len(key_tuple)))
+        key_dict = dict(zip(self._keys, key_tuple))
+
+        with self._publish_lock:
+            entry = self._handles.get(key_tuple)
+            if entry is not None:
+                return entry[0]
+
+            handle = self._dyn_narrowed_writer.register_instance(self._publish_sample(key_dict))
+            if not handle.isValid:
+                raise Error('could not register instance')
+            self._handles[key_tuple] = (handle, key_dict)
+            self._handle_keys[_handle_bytes(handle)] = key_dict
+
+            limit = self.max_registered_instances
+            if limit and len(self._handles) > limit:
+                self._unregister(*self._handles.popitem(last=False)[1])
+        return handle
+
+    def unregister_instance(self, key):
+
+        """
+        Unregisters an instance registered with `register_instance'.
+
+        Parameters:
+            key (InstanceHandle_t, Dict, Tuple or value) The handle or the key of the instance.
+        """
+
+        with self._publish_lock:
+            if isinstance(key, DDSType.InstanceHandle_t):
+                key = self._registered_key(key)
+            entry = self._handles.pop(_key_tuple(self._keys, key), None)
+            if entry is None:
+                raise Error('instance is not registered')
+            self._unregister(*entry)
+
+    def _unregister(self, handle, key_dict):
+        del self._handle_keys[_handle_bytes(handle)]
+        self._dyn_narrowed_writer.unregister_instance(self._publish_sample(key_dict), handle)
+
+    def publish(self, data, handle=None):
+
+        """
+        Publishes an instance of this topic on the DDS bus with the provided data.
+        The input data may be sparse, but every entry in the data must be a field
+        in the topic. If the provided data is sparse, a full instance of the topic
+        will be published and the non-specified fields will receive default values.
+
+        Parameters:
+            data   (Dict)             the data to publish on the bus.
+            handle (InstanceHandle_t) Optional. The handle from `register_instance'. The
+                                      key fields are then filled in from the registration.
+        """
+
+        metrics = self._topic_metrics()
+        with self._publish_lock:
+            if handle is None:
+                self._write(data, None, DDS_HANDLE_NIL, metrics)
+            else:
+                self._write(data, self._registered_key(handle), handle, metrics)
+
+    def _write(self, data, key, handle, metrics):
+        # Marshals and writes one sample. Call with the publish lock held.
+        writer = self._dyn_narrowed_writer  # raises if the DDS instance is closed
+        if metrics is None:
+            writer.write(self._publish_sample(data, key), handle)
+            return
+        start = time.time()
+        sample = self._publish_sample(data, key)
+        marshalled = time.time()
+        writer.write(sample, handle)
+        metrics._published(marshalled - start, time.time() - marshalled)
+
+    def publish_many(self, samples, batch_size=1000, on_batch=None):
+
+        """
+        Publishes every sample from an iterable (which may be a generator), as
+        `publish' would. Samples are taken from the iterable `batch_size' at a time
+        and written back to back. A sample that fails to publish is recorded and
+        skipped; the rest are still published.
+
+        Parameters:
+            samples    (Iterable) The data dictionaries to publish.
+            batch_size (Integer)  Optional. The number of samples written per batch.
+            on_batch   (function) Optional. Called after each batch with a dictionary of:
+                                      batch      the number of the batch, from 0
+                                      published  samples written in the batch
+                                      failed     samples in the batch that raised
+                                      seconds    time spent writing the batch
+                                      rate       samples written per second
+
+        Returns:
+            (Dict) published (Integer), failed ([(index, exception)]) and seconds (Float)
+                   totals over all batches. Indices count from 0 across the whole iterable.
+        """
+
+        samples = iter(samples)
+        metrics = self._topic_metrics()
+        published, failed, seconds = 0, [], 0.0
+
+        for batch_number in itertools.count():
+            batch = list(itertools.islice(samples, batch_size))
+            if not batch:
+                break
+
+            start, batch_failed = time.time(), 0
+            with self._publish_lock:
+                for i, data in enumerate(batch, published + len(failed)):
+                    try:
+                        self._write(data, None, DDS_HANDLE_NIL, metrics)
+                    except Exception as e:
+                        failed.append((i, e))
+                        batch_failed += 1
+            elapsed = time.time() - start
+
+            published += len(batch) - batch_failed
+            seconds += elapsed
+            if on_batch is not None:
+                on_batch({
+                    'batch':     batch_number,
+                    'published': len(batch) - batch_failed,
+                    'failed':    batch_failed,
+                    'seconds':   elapsed,
+                    'rate':      (len(batch) - batch_failed) / elapsed if elapsed else float('inf'),
+                })
+
+        return {'published': published, 'failed': failed, 'seconds': seconds}
+
+    def publish_async(self, data, callback=None):
+
+        """
+        Publishes like `publish', but on the waker thread of the DDS instance so
+        the caller (e.g. an event loop) does not wait on the write. Publishes run
+        in order. If many are outstanding this blocks until there is room.
+
+        Parameters:
+            data     (Dict)     the data to publish on the bus.
+            callback (function) Optional. Called on the waker thread once the sample
+                                is written, with None or the exception raised.
+        """
+
+        self._dds._get_waker().dispatch(None, self._publish_async, (data, callback))
+
+    def _publish_async(self, (data, callback)):
+        try:
+            self.publish(data)
+        except Exception as e:
+            if callback is None:
+                raise
+            callback(e)
+        else:
+            if callback is not None:
+                callback(None)
+
+def _string_seq(strings):
+    seq = DDSType.StringSeq()
+    if strings:
+        seq.from_array((ctypes.c_char_p * len(strings))(*strings), len(strings))
+    return seq
+
+class FilteredTopic(TopicSuper):
+    def __init__(self, dds, name, data_type, related_topic, filter_expression, base_topic, filter_parameters=None):
+        self.filter_parameters = [str(p) for p in filter_parameters or []]
+        # Publishing goes through the base topic's writer, so only its reader profile applies here.
+        super(FilteredTopic, self).__init__(dds, name, data_type, related_topic, filter_expression, base_topic,
+                                            reader_profile=base_topic._reader_profile)
+
+    def set_filter_parameters(self, *parameters):
+
+        """
+        Changes the parameters of the filter expression (%0, %1, ...) of this
+        subscription. The reader is kept, so this is cheap enough to do often.
+
+        Parameters:
+            *parameters (String) The new parameter values, in order. Non-strings are
+                                 converted with str. Strings must be quoted as they
+                                 would be in the expression itself, e.g. "'mode_2'".
+        """
+
+        parameters = [str(p) for p in parameters]
+        params = _string_seq(parameters)
+        try:
+            self._topic.set_expression_parameters(ctypes.byref(params))
+            # The new sequence is in use; the old one is to be released.
+            params, self._filter_params = self._filter_params, params
+            parameters, self.filter_parameters = self.filter_parameters, parameters
+        finally:
+            # As in _create_topic, only sequences with parameters were filled.
+            if parameters:
+                params.finalize()
+
+    # Publishing on a filtered topic goes through its base topic's writer.
+
+    @property
+    def _writer(self):
+        return self._base_topic._writer
+
+    @property
+    def _dyn_narrowed_writer(self):
+        return self._base_topic._dyn_narrowed_writer
+
+    def _create_topic(self):
+        import uuid  # slow to import, and only needed here
+        self.filter_name = str(uuid.uuid4())
+        ## calling initialize or from_array causes a segfault on windows. There doesn't seem to be any problem with not making these calls,
+        ## so they are only made when the filter has parameters.
+        self._filter_params = _string_seq(self.filter_parameters)
+
+        return self._dds._participant.create_contentfilteredtopic(
+            self.filter_name,
+            self._related_topic,
+            self._filter_expression,
+            self._filter_params
+        )
+
+class Topic(TopicSuper):
+    def __init__(self, dds, name, data_type, reader_profile=None, writer_profile=None):
+        super(Topic, self).__init__(dds, name, data_type, reader_profile=reader_profile, writer_profile=writer_profile)
+        self._filtered_topics = {}
+
+    def _create_writer(self, listener, mask):
+        if self._writer_profile is not None:
+            library, profile = self._writer_profile
+            return self._dds._publisher.create_datawriter_with_profile(
+                self._topic,
+                library,
+                profile,
+                listener,
+                mask,
+            )
+        return self._dds._publisher.create_datawriter(
             self._topic,
             get('DATAWRITER_QOS_DEFAULT', DDSType.DataWriterQos),
-            None,
-            0,
+            listener,
+            mask,
         )
 
     def _create_topic(self):
         return self._dds._participant.create_topic(
             self.name,
-            self.data_type._get_typecode().name(ex()),
+            self._type_name,
             get('TOPIC_QOS_DEFAULT', DDSType.TopicQos),
             None,
             0,
         )
 
 
-    def subscribe(self, data_available_callback, instance_revoked_cb=None, liveliness_lost_cb=None, filter_expression=None, _send_topic_info=False):
+    def subscribe(self, data_available_callback, instance_revoked_cb=None, liveliness_lost_cb=None, filter_expression=None, dispatcher=None, lazy=False,
+                  filter_parameters=None, where=None, fields=None, _send_topic_info=False):
 
         """
         Makes a DDS subscription for this topic with the provided callback.
@@ -1045,11 +3264,14 @@ class Topic(TopicSuper):
         be provided. If desired, a filter expression [1] can be specified and only topics
         matching the filter will be passed to the callback.
 
-        To cancel a subscription, you call `unsubscribe' with a `topic' argument. This
-        method returns the topic instance for this purpose.
+        A topic can have any number of subscriptions. They share one DataReader, and
+        each sample is unpacked once for all of them, so callbacks should treat the
+        dictionaries they are given as read-only. To cancel a subscription, call
+        `unsubscribe' on the Subscription this method returns.
 
-        NOTE: currently filter parameters are not supported. Only provide filters
-              without parameters!
+        The filter expression may refer to parameters (%0, %1, ...), given by
+        `filter_parameters'. They can be changed later on the returned topic with
+        `set_filter_parameters', without recreating the reader.
 
         Parameters:
             data_available_callback  (function) Required. This function will be called with a
@@ -1063,30 +3285,167 @@ class Topic(TopicSuper):
 
             filter_expression        (String)   Optional. The filter expression
 
+            filter_parameters        ([String]) Optional. The values of the filter expression
+                                                parameters, in order (see `set_filter_parameters')
+
+            dispatcher               (String or Dispatcher) Optional. Where the callbacks run (see
+                                                DDS). Defaults to the dispatcher of the DDS instance.
+
+            lazy                     (Boolean or String) Optional. Call back with SampleView objects
+                                                that decode members on first access instead of
+                                                dictionaries. A view is only backed by the sample
+                                                until the take it came from is done, so True needs
+                                                the 'inline' dispatcher (ValueError otherwise); call
+                                                `materialize' to keep a sample. With 'copy', any
+                                                dispatcher may be used: views still referenced when
+                                                the take is done (e.g. queued on another dispatcher)
+                                                are materialized then instead.
+
+            where                    (function or Dict) Optional. Only call data_available_callback
+                                                for samples that pass this test, made before the
+                                                sample is unpacked. A function is called with a
+                                                SampleView (only the fields it reads are decoded) and
+                                                returns whether to keep the sample. A dictionary maps
+                                                field names to a value the field must equal, or to a
+                                                function testing the field value.
+
+            fields                   ([String]) Optional. Call data_available_callback with only these
+                                                (top level) fields, decoding nothing else.
+
         Returns:
-            topic (Topic or ContentFilteredTopic) The topic to pass to `unsubscribe' if desired.
+            subscription (Subscription) The subscription, to `unsubscribe' if desired. It can
+                                        also be used as its topic (the FilteredTopic when a
+                                        filter expression is given).
 
         [1] https://community.rti.com/static/documentation/connext-dds/5.2.0/doc/manuals/connext_dds/html_files/RTI_ConnextDDS_CoreLibraries_UsersManual/Content/UsersManual/SQL_Filter_Expression_Notation.htm
         """
 
 
+        if lazy not in (False, True, 'copy'):
+            raise ValueError('unknown lazy mode: %r' % (lazy,))
+        where = _compile_where(where, self._plan)
+        if fields is not None:
+            fields = list(fields)
+            for name in fields:
+                if name not in self._plan.by_name:
+                    raise ValueError('unknown field: %r' % (name,))
+
+        dispatcher = self._dds._get_dispatcher(dispatcher)
+        if lazy is True and not isinstance(dispatcher, InlineDispatcher):
+            raise ValueError("lazy=True needs the 'inline' dispatcher; use lazy='copy' with queued dispatchers")
+
         if filter_expression:
-            filtered_topic = FilteredTopic(self._dds, self.name, self.data_type, self._topic, filter_expression, self)
-            filtered_topic._instance_revoked_cb = instance_revoked_cb
-            filtered_topic._liveliness_lost_cb  = liveliness_lost_cb
-            filtered_topic._send_topic_info     = _send_topic_info
-            filtered_topic.add_data_available_callback(data_available_callback)
-            self._filtered_topics[filtered_topic.filter_name] = filtered_topic
-            _filtered_topic_refs[self.name].append(filtered_topic)
-            return filtered_topic
+            topic = FilteredTopic(self._dds, self.name, self.data_type, self._topic, filter_expression, self, filter_parameters)
+            self._filtered_topics[topic.filter_name] = topic
+            _filtered_topic_refs.setdefault(id(self), []).append(topic)
         else:
-            self._send_topic_info     = _send_topic_info
-            self._instance_revoked_cb = instance_revoked_cb
-            self._liveliness_lost_cb  = liveliness_lost_cb
-            self.add_data_available_callback(data_available_callback)
-            return self
+            topic = self
+
+        return topic._add_subscription(Subscription(
+            topic,
+            data_available_callback,
+            instance_revoked_cb=instance_revoked_cb,
+            liveliness_lost_cb=liveliness_lost_cb,
+            dispatcher=dispatcher,
+            lazy=lazy,
+            where=where,
+            fields=fields,
+            send_topic_info=_send_topic_info,
+        ))
+
+    def subscribe_batch(self, batch_callback, max_batch=None, max_latency=None, columns=None, dispatcher=None):
+
+        """
+        Makes a DDS subscription for this topic that delivers samples in batches.
+        The callback is called with two lists of the same length: the samples
+        (dictionaries, as for `subscribe') and their SampleInfo metadata. Samples
+        without valid data (disposed instances, instances without writers) are
+        included with only their key fields set; check `info.valid_data'.
+
+        By default each batch is whatever one take from the reader returned.
+        A topic can have any number of batch subscriptions, alongside its other
+        subscriptions; each gets every take. To cancel one, call `unsubscribe' on
+        the BatchSubscription returned.
+
+        With `columns', samples are unpacked straight into NumPy arrays (numpy must
+        be installed) using the dtype in `Topic.dtype': 'records' delivers one
+        structured array, 'fields' a dictionary of per-field arrays. Primitive and
+        fixed-length array members get numeric columns; strings, enums and
+        sequences become object columns. Wide characters are 'U1' columns, or
+        uint16 UTF-16 code units where wchar_t is 2 bytes (Windows).
+
+        Parameters:
+            batch_callback (function)   Required. Called with (samples, infos).
+
+            max_batch      (Integer)    Optional. The most samples in one batch. Larger
+                                        takes are split.
+
+            max_latency    (Float)      Optional. Coalesce takes into larger batches: a batch
+                                        is delivered once max_batch samples are pending or
+                                        the oldest pending sample has waited this many seconds.
+
+            columns        (String)     Optional. 'records' or 'fields' for columnar batches.
+
+            dispatcher     (String or Dispatcher) Optional. Where the callback runs (see DDS).
+                                        Defaults to the dispatcher of the DDS instance.
 
-    def dispose(self, data):
+        Returns:
+            subscription (BatchSubscription) The subscription, to `unsubscribe' if desired. Like
+                                             a Subscription, it can also be used as its topic.
+        """
+
+        batcher = _Batcher(batch_callback, self._dds._get_dispatcher(dispatcher), (self.name, None), max_batch, max_latency, columns)
+        with self._subscriptions_lock:
+            self._batchers = self._batchers + [batcher]
+        if self._listener is None:
+            self._enable_listener()
+        return BatchSubscription(self, batcher)
+
+    def cache(self, max_instances=None):
+
+        """
+        Keeps the most recent sample of every instance of this topic in an
+        InstanceCache, updated by the topic's listener alongside any subscription.
+        Calling this again returns the same cache. `unsubscribe' drops the cache.
+
+        Parameters:
+            max_instances (Integer) Optional. The most instances kept (see InstanceCache).
+
+        Returns:
+            cache (InstanceCache) The cache.
+        """
+
+        if self._cache is None:
+            self._cache = InstanceCache(self._keys, max_instances)
+            if self._listener is None:
+                self._enable_listener()
+        return self._cache
+
+    def stream(self, max_queue=1000, overflow=OVERFLOW_BLOCK, filter_expression=None, filter_parameters=None):
+
+        """
+        Makes a DDS subscription for this topic that queues samples on a Stream
+        instead of calling back. See `Stream' for how to consume it, and call
+        `Stream.close' to cancel the subscription.
+
+        Parameters:
+            max_queue         (Integer) Optional. The most samples the stream holds. 0 means unbounded.
+            overflow          (String)  Optional. What to do when the stream is full: OVERFLOW_BLOCK
+                                        (hold up the DDS listener thread, the default),
+                                        OVERFLOW_DROP_OLDEST or OVERFLOW_DROP_NEWEST.
+            filter_expression (String)  Optional. The filter expression (see `subscribe')
+            filter_parameters ([String]) Optional. The filter expression parameters (see `subscribe')
+
+        Returns:
+            stream (Stream) The stream of samples.
+        """
+
+        stream = Stream(self._dds, max_queue, overflow)
+        stream._subscription = self.subscribe(stream._put, filter_expression=filter_expression, filter_parameters=filter_parameters,
+                                              dispatcher=InlineDispatcher())
+        return stream
+
+    def dispose(self, data=None, handle=None):
 
         """
         Disposes a message instance. The provided message must have the 'key'
@@ -1094,19 +3453,202 @@ class Topic(TopicSuper):
         keys will be disposed.
 
         Parameters:
-            data (Dict) The provided message.
+            data   (Dict)             The provided message.
+            handle (InstanceHandle_t) Optional. The handle from `register_instance', in
+                                      which case `data' may be left out.
         """
 
-        instance = self._update(self._generate_instance(), data)
-        sample   = self._support.create_data()
+        if data is None and handle is None:
+            raise ValueError('dispose needs the instance: data with its key fields, or a handle')
+        with self._publish_lock:
+            if handle is None:
+                self._dyn_narrowed_writer.dispose(self._publish_sample(data), DDS_HANDLE_NIL)
+            else:
+                self._dyn_narrowed_writer.dispose(self._publish_sample(data or {}, self._registered_key(handle)), handle)
+
+# Discovery
+
+class Discovery(object):
+    """
+    Subscribes a DDS instance to the topic of every type published on the bus,
+    as the publications are discovered (see `subscribe_to_all_topics'). The
+    builtin publication reader is watched by a daemon thread, and the new types
+    found each time it wakes up are subscribed to together, after the
+    publication samples are returned.
+
+    Types can be limited with `include' and `exclude', lists of fnmatch patterns
+    matched against the full type name (e.g. 'my::module::*'). Types that can't
+    be subscribed to (e.g. missing from the topic libraries) are skipped and
+    counted as failed.
+
+    The discovery thread runs until `stop' is called, or the DDS instance is closed.
+    """
+    def __init__(self, dds, data_available_callback, instance_revoked_cb=None, liveliness_lost_cb=None,
+                 include=None, exclude=None):
+        self._dds                     = dds
+        self._data_available_callback = data_available_callback
+        self._instance_revoked_cb     = instance_revoked_cb
+        self._liveliness_lost_cb      = liveliness_lost_cb
+        self._include                 = list(include) if include is not None else None
+        self._exclude                 = list(exclude or ())
+        self._lock                    = threading.Lock()
+        self._topics                  = {}  # type name -> Topic, or None if filtered out or failed
+        self._discovered              = {}  # type name -> when it was discovered
+        self._latency                 = {}  # type name -> seconds from discovery to its first sample
+        self._failed                  = {}  # type name -> the exception subscribing raised
+        self._stopping                = False
+        self._guard                   = DDSFunc.GuardCondition_new()
+        self._thread                  = threading.Thread(target=self._run, name='dds-discovery')
+        self._thread.daemon           = True
+
+    def _start(self):
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """
+        Stops discovering new types. Topics already subscribed to are kept.
+
+        Parameters:
+            wait (Boolean) Optional. Whether to wait for the discovery thread to exit.
+                           Defaults to True.
+        """
+        # The guard is triggered and deleted under the lock, as the thread deletes it
+        # when it exits, which may be before this (e.g. if it died).
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            if self._guard is not None:
+                if self._thread.ident is None:
+                    self._guard.delete()
+                    self._guard = None
+                else:
+                    self._guard.set_trigger_value(True)
+        if wait and self._thread.ident is not None and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _wanted(self, type_name):
+        if self._include is None and not self._exclude:
+            return True
+        import fnmatch  # only needed here
+        if self._include is not None and not any(fnmatch.fnmatchcase(type_name, p) for p in self._include):
+            return False
+        return not any(fnmatch.fnmatchcase(type_name, p) for p in self._exclude)
+
+    def _run(self):
+        reader = self._dds._publication_dr
+        data_seq = DDSType.PublicationBuiltinTopicDataSeq()
+        info_seq = DDSType.SampleInfoSeq()
+        condition_seq = DDSType.ConditionSeq()
+        condition_seq.initialize()
+
+        waitset = DDSFunc.WaitSet_new()
+        status_condition = DDSFunc.Entity_get_statuscondition(ctypes.cast(reader, ctypes.POINTER(DDSType.Entity)))
+        status_condition.set_enabled_statuses(DDS_DATA_AVAILABLE_STATUS)
+        conditions = [ctypes.cast(status_condition, ctypes.POINTER(DDSType.Condition)),
+                      ctypes.cast(self._guard, ctypes.POINTER(DDSType.Condition))]
+        for condition in conditions:
+            waitset.attach_condition(condition)
 
         try:
-            write_into_dd(instance, sample)
-            self._dyn_narrowed_writer.dispose(sample, DDS_HANDLE_NIL)
+            while not self._stopping:
+                waitset.wait(ctypes.byref(condition_seq), ctypes.byref(_duration(None)))
+                if self._stopping:
+                    break
+
+                discovered = time.time()
+                new_types = []
+                data_seq.initialize()
+                info_seq.initialize()
+                try:
+                    reader.take(
+                        ctypes.byref(data_seq),
+                        ctypes.byref(info_seq),
+                        DDS_LENGTH_UNLIMITED,
+                        get('ANY_SAMPLE_STATE', DDS_SampleStateMask),
+                        get('ANY_VIEW_STATE', DDS_ViewStateMask),
+                        get('ANY_INSTANCE_STATE', DDS_InstanceStateMask)
+                    )
+                    with self._lock:
+                        for i in xrange(data_seq.get_length()):
+                            type_name = data_seq.get_reference(i).contents.type_name
+                            if type_name and type_name not in self._topics:
+                                self._topics[type_name] = None
+                                self._discovered[type_name] = discovered
+                                if self._wanted(type_name):
+                                    new_types.append(type_name)
+                except NoDataError:
+                    pass
+                finally:
+                    reader.return_loan(ctypes.byref(data_seq), ctypes.byref(info_seq))
+                    info_seq.finalize()
+                    data_seq.finalize()
+
+                for type_name in new_types:
+                    if self._stopping:
+                        break
+                    self._subscribe(type_name, discovered)
         finally:
-            self._support.delete_data(sample)
+            for condition in conditions:
+                waitset.detach_condition(condition)
+            waitset.delete()
+            condition_seq.finalize()
+            with self._lock:
+                self._guard.delete()
+                self._guard = None
+
+    def _subscribe(self, type_name, discovered):
+        callback = self._data_available_callback
+        subscription = []
+
+        def first_sample(data):
+            # Records the discovery latency, then steps out of the way.
+            with self._lock:
+                self._latency.setdefault(type_name, time.time() - discovered)
+            if subscription:
+                subscription[0].callback = callback
+            callback(data)
 
-def subscribe_to_all_topics(topic_libraries, data_available_callback, instance_revoked_cb=None, liveliness_lost_cb=None, domain_id=0):
+        try:
+            topic = self._dds.get_topic(type_name, sep='::')
+            subscription.append(topic.subscribe(
+                first_sample,
+                instance_revoked_cb=self._instance_revoked_cb,
+                liveliness_lost_cb=self._liveliness_lost_cb,
+                _send_topic_info=True
+            ))
+        except Exception as e:
+            with self._lock:
+                self._failed[type_name] = e
+            return
+        with self._lock:
+            self._topics[type_name] = topic
+
+    def topics(self):
+        """Returns a dictionary of type name -> Topic of the types subscribed to so far."""
+        with self._lock:
+            return dict((name, topic) for name, topic in self._topics.iteritems() if topic is not None)
+
+    def stats(self):
+        """
+        Returns the numbers of types discovered, subscribed to, filtered out and
+        failed, the failures (type name -> exception), and the seconds from
+        discovering each subscribed type to its first sample (type name -> seconds,
+        for the types that have had one).
+        """
+        with self._lock:
+            subscribed = sum(1 for topic in self._topics.itervalues() if topic is not None)
+            return {
+                'discovered':           len(self._topics),
+                'subscribed':           subscribed,
+                'filtered':             len(self._topics) - subscribed - len(self._failed),
+                'failed':               len(self._failed),
+                'failures':             dict(self._failed),
+                'first_sample_latency': dict(self._latency),
+            }
+
+def subscribe_to_all_topics(topic_libraries, data_available_callback, instance_revoked_cb=None, liveliness_lost_cb=None, domain_id=0, dispatcher=None,
+                            include=None, exclude=None):
     """
     Subscribes to all topics published on the DDS bus.
     It will subscribe to topics that are already publised and
@@ -1126,13 +3668,26 @@ def subscribe_to_all_topics(topic_libraries, data_available_callback, instance_r
         instance_revoked_cb     (function)           The function to call if the topic instance is revoked. (Optional)
                                                      The function will be called with the topic name.
         domain_id               (Integer)            The DDS domain ID (defaults to 0)
+        dispatcher              (String or Dispatcher) Where the callbacks run (see DDS)
+        include                 ([String])           Only subscribe to types matching one of these fnmatch
+                                                     patterns, e.g. 'my::module::*'. (Optional)
+        exclude                 ([String])           Don't subscribe to types matching any of these
+                                                     patterns. (Optional)
+
+    Returns:
+        dds (DDS) The DDS instance. Its `discovery' attribute is the Discovery, with the
+                  topics subscribed to and discovery statistics. Close the instance
+                  to stop.
     """
     return DDS(topic_libraries,
             _get_all=True,
             _all_data_available_cb=data_available_callback,
             _all_ir_cb=instance_revoked_cb,
             _all_ll_cb=liveliness_lost_cb,
-            domain_id=domain_id
+            _include=include,
+            _exclude=exclude,
+            domain_id=domain_id,
+            dispatcher=dispatcher
     )
 
 
@@ -1143,17 +3698,32 @@ class DDS(object):
     Parameters:
         topic_libraries ([String]) The list of topic libraries. If there is only one topic library,
                                    you may pass just the name instead of a list.
-        qos_library     (String)   The name of the QOS library to use (Optional)
+        qos_library     (String)   The name of the QOS library to use (Optional). It is also the
+                                   library of topic QoS profiles given without one (see get_topic).
         qos_profile     (String)   The name of the QOS profile to use (Optional)
         domain_id       (Integer)  The DDS domain ID (defaults to 0)
+        dispatcher      (String or Dispatcher) Where subscription callbacks run (Optional).
+                                   'keyed' (the default) runs them on a KeyedDispatcher, 'pool'
+                                   on a ThreadPoolDispatcher and 'inline' on the listener thread.
+                                   A Dispatcher instance may also be given. Individual
+                                   subscriptions can override this. Each name is one
+                                   dispatcher shared by this instance's subscriptions and
+                                   shut down by `close'; given instances are left running.
     """
-    def __init__(self, topic_libraries, qos_library=None, qos_profile=None, domain_id=0,
-                 _get_all=False, _all_data_available_cb=None, _all_ir_cb=None, _all_ll_cb=None):
-
-        self._data_seq      = None
-        self._info_seq      = None
-        self._condition_seq = None
-        self._initialized   = False
+    def __init__(self, topic_libraries, qos_library=None, qos_profile=None, domain_id=0, dispatcher=None,
+                 _get_all=False, _all_data_available_cb=None, _all_ir_cb=None, _all_ll_cb=None, _include=None, _exclude=None):
+
+        self.discovery      = None
+        self.metrics        = None
+        self._qos_library   = qos_library
+        self._metrics_lock  = threading.Lock()
+        self._dispatchers_lock = threading.Lock()
+        self._dispatchers = dispatchers = {}  # name -> this instance's dispatcher of that kind
+        self._state = state = {'closed': False}
+        self._dispatcher    = self._get_dispatcher('keyed' if dispatcher is None else dispatcher)
+        self._waker_lock    = threading.Lock()
+        self._waker = waker = {}
+        self._close_lock    = threading.RLock()
 
         if type(topic_libraries) != list:
             topic_libraries = [topic_libraries]
@@ -1169,17 +3739,13 @@ class DDS(object):
         )
 
         if _get_all:
-            self._all_data_available_cb = _all_data_available_cb or (lambda x: None)
-            self._all_ir_cb             = _all_ir_cb             or (lambda x: None)
-            self._all_ll_cb             = _all_ll_cb             or (lambda x: None)
-            self._all_topics = {}
             self._builtin_subscriber = self._participant.get_builtin_subscriber()
             self._publication_dr = DDSFunc.PublicationBuiltinTopicDataDataReader_narrow(self._builtin_subscriber.lookup_datareader('DCPSPublication'))
 
             # I don't know why, but this initialization needs to happen here on Windows. Otherwise nddsc segfaults when the waitset fires.
             self._topics = Library(map(libname, topic_libraries))
 
-            threading.Thread(target=self._get_all_topics).start()
+            self.discovery = Discovery(self, _all_data_available_cb or (lambda x: None), _all_ir_cb, _all_ll_cb, _include, _exclude)
 
 
         self._publisher = publisher = self._participant.create_publisher(
@@ -1195,93 +3761,110 @@ class DDS(object):
         )
 
         self._open_topics = weakref.WeakValueDictionary()
+        self._open_topics_lock = threading.Lock()  # get_topic is called from discovery and user threads
+        self._types_lock  = threading.Lock()
+        self._types = types = {}  # type name -> [DynamicDataTypeSupport, number of topics using it]
         if not _get_all:
             self._topics = Library(map(libname, topic_libraries))
 
-        def _cleanup(ref):
-            participant.delete_subscriber(subscriber)
-            participant.delete_publisher(publisher)
+        dispatchers_lock = self._dispatchers_lock
+
+        def _teardown():
+            # Dispatchers given as instances belong to the caller and are left running.
+            with dispatchers_lock:
+                for owned in dispatchers.values():
+                    owned.close(wait=False)
+                dispatchers.clear()
+            if 'dispatcher' in waker:
+                waker['dispatcher'].close(wait=False)
+            participant.delete_contained_entities()
+            for support, _ in types.values():
+                support.delete()
+            types.clear()
 
             # very slow for some reason
             DDSFunc.DomainParticipantFactory_get_instance().delete_participant(participant)
+        self._teardown = _teardown
 
+        def _cleanup(ref):
+            if not state['closed']:
+                state['closed'] = True
+                _teardown()
             _refs.remove(ref)
         _refs.add(weakref.ref(self, _cleanup))
+        _instances.add(self)
+
+        if self.discovery is not None:
+            self.discovery._start()
+
+    def _get_dispatcher(self, dispatcher):
+        # The dispatcher for a subscription: this instance's unless one is given. A
+        # name gives the one dispatcher of that kind this instance makes, and closes.
+        if dispatcher is None:
+            return self._dispatcher
+        if isinstance(dispatcher, Dispatcher):
+            return dispatcher
+        if dispatcher not in _DISPATCHER_NAMES:
+            raise ValueError('unknown dispatcher: %r' % (dispatcher,))
+        dispatchers = self._dispatchers
+        if dispatcher not in dispatchers:
+            with self._dispatchers_lock:
+                if self._state['closed']:
+                    raise Error('the DDS instance is closed')
+                if dispatcher not in dispatchers:
+                    dispatchers[dispatcher] = _make_dispatcher(dispatcher)
+        return dispatchers[dispatcher]
+
+    def _get_waker(self):
+        # A single thread per instance that schedules stream deliveries onto event
+        # loops and runs publish_async writes.
+        waker = self._waker
+        if 'dispatcher' not in waker:
+            with self._waker_lock:
+                if 'dispatcher' not in waker:
+                    waker['dispatcher'] = ThreadPoolDispatcher(workers=1)
+        return waker['dispatcher']
+
+    def dispatch_stats(self):
 
-        if _get_all:
-            for topic in self._all_topics:
-                self._all_topics[topic] = self.get_topic(topic, sep='::')
-                self._all_topics[topic].subscribe(
-                    self._all_data_available_cb,
-                    instance_revoked_cb=self._all_ir_cb,
-                    liveliness_lost_cb=self._all_ll_cb,
-                    _send_topic_info=True
-                )
-        self._initialized = True
-
-
-    def _all_topics_data_available(self):
-
-        self._data_seq.initialize()
-        self._info_seq.initialize()
-        self._publication_dr.take(
-            ctypes.byref(self._data_seq),
-            ctypes.byref(self._info_seq),
-            DDS_LENGTH_UNLIMITED,
-            get('ANY_SAMPLE_STATE', DDS_SampleStateMask),
-            get('ANY_VIEW_STATE', DDS_ViewStateMask),
-            get('ANY_INSTANCE_STATE', DDS_InstanceStateMask)
-        )
-
-        for i in xrange(self._data_seq.get_length()):
-            pd = self._data_seq.get_reference(i)
-            if pd.contents.type_name and pd.contents.type_name not in self._all_topics:
-                if self._initialized:
-                    self._all_topics[pd.contents.type_name] = self.get_topic(pd.contents.type_name, sep='::')
-                    self._all_topics[pd.contents.type_name].subscribe(
-                        self._all_data_available_cb,
-                        instance_revoked_cb=self._all_ir_cb,
-                        liveliness_lost_cb=self._all_ll_cb,
-                        _send_topic_info=True
-                    )
-                else:
-                    self._all_topics[pd.contents.type_name] = None
+        """
+        Returns the counters of this instance's default dispatcher (see Dispatcher.stats).
+        """
 
+        return self._dispatcher.stats()
 
-    def _get_all_topics(self):
+    def enable_metrics(self, topics=None):
 
-        if not self._data_seq:
-            self._data_seq = DDSType.PublicationBuiltinTopicDataSeq()
-        self._data_seq.initialize()
+        """
+        Starts collecting metrics (see Metrics) of the topics of this instance,
+        which can then be read from `dds_instance.metrics'. Until this is called
+        `metrics' is None and no time is spent on them.
 
-        if not self._info_seq:
-            self._info_seq = DDSType.SampleInfoSeq()
-        self._info_seq.initialize()
+        Parameters:
+            topics ([String]) Optional. Only collect metrics of the topics with these
+                              names. Calling this again adds to them. All topics if
+                              not given.
 
-        self.waitset = DDSFunc.WaitSet_new()
-        self.condition = DDSFunc.Entity_get_statuscondition(ctypes.cast(self._publication_dr, ctypes.POINTER(DDSType.Entity)))
-        self.waitset.attach_condition(ctypes.cast(self.condition, ctypes.POINTER(DDSType.Condition)))
-        self.condition.set_enabled_statuses(DDS_DATA_AVAILABLE_STATUS)
+        Returns:
+            (Metrics)
+        """
 
-        if not self._condition_seq:
-            self._condition_seq = DDSType.ConditionSeq()
-        self._condition_seq.initialize()
+        with self._metrics_lock:
+            if self.metrics is None:
+                self.metrics = Metrics(topics)
+            else:
+                self.metrics._add_topics(topics)
+            return self.metrics
 
-        while True:
-            self.waitset.wait(
-                ctypes.byref(self._condition_seq),
-                ctypes.byref(DDSType.Duration_t(DDS_DURATION_INFINITE_SEC, DDS_DURATION_INFINITE_NSEC))
-            )
-            try:
-                self._all_topics_data_available()
+    def disable_metrics(self):
 
-            finally:
-                self._publication_dr.return_loan(ctypes.byref(self._data_seq), ctypes.byref(self._info_seq))
-                self._info_seq.finalize()
-                self._data_seq.finalize()
+        """
+        Stops collecting metrics and discards them.
+        """
 
+        self.metrics = None
 
-    def get_topic(self, qualified_name, sep='.'):
+    def get_topic(self, qualified_name, sep='.', qos_profile=None, reader_qos_profile=None, writer_qos_profile=None):
 
         """
         Gets a topic instance given the fully qualified topic name.
@@ -1291,49 +3874,200 @@ class DDS(object):
         If the seperator for the namespace of the topic is not a '.' then you must
         specify the sep parameter.
 
+        The topic's reader and writer are created with the default QoS unless a QoS
+        profile is given, as 'library::profile' or as just 'profile' in the qos_library
+        this instance was made with. A topic is only opened once per name, so asking
+        for it again with different profiles raises a ValueError.
+
         Parameters:
-            qualified_name (String) Required. The full name of the topic (including the namespace)
-            sep            (String) Optional. The seperator for the namespace
+            qualified_name     (String) Required. The full name of the topic (including the namespace)
+            sep                (String) Optional. The seperator for the namespace
+            qos_profile        (String) Optional. The QoS profile of both the reader and the writer
+            reader_qos_profile (String) Optional. The QoS profile of the reader, instead of qos_profile
+            writer_qos_profile (String) Optional. The QoS profile of the writer, instead of qos_profile
         Returns: (Topic)
         """
 
         name = qualified_name.split(sep)[-1]
         data_type = getattr(self._topics, qualified_name.replace(sep, '_'))
-        return self._get_topic(name, data_type)
+        return self._get_topic(name, data_type,
+                               self._qos_profile(reader_qos_profile or qos_profile),
+                               self._qos_profile(writer_qos_profile or qos_profile))
+
+    def _qos_profile(self, profile):
+        # 'library::profile' or 'profile' -> (library, profile)
+        if profile is None:
+            return None
+        library, _, profile = profile.rpartition('::')
+        library = library or self._qos_library
+        if not library:
+            raise ValueError('QoS profile %r has no library and this DDS instance has no qos_library' % profile)
+        return library, profile
+
+    @property
+    def closed(self):
+        """Whether `close' has been called."""
+        return self._state['closed']
+
+    def close(self, wait=True):
+
+        """
+        Deletes the participant and everything in it in one go, instead of topic
+        by topic when they are garbage collected. Subscriptions are canceled and the
+        topics of this instance can't be used afterwards. Closing again does nothing.
+        DDS instances are also context managers that close on exit.
+
+        Deleting a participant can take a while, so with `wait' False it is done on
+        a background thread and this returns straight away.
 
-    def _get_topic(self, name, data_type):
-        res = self._open_topics.get(name, None)
-        if res is not None:
-            if data_type != res.data_type:
-                raise ValueError('_get_topic called with a previous name but a different data_type')
+        Parameters:
+            wait (Boolean) Optional. Whether to wait for the participant to be deleted.
+                           Defaults to True.
+
+        Returns:
+            thread (threading.Thread) With `wait' False, the thread deleting the participant,
+                                      to join if desired. Otherwise None.
+        """
+
+        if self.discovery is not None:
+            self.discovery.stop()
+        with self._close_lock:
+            if self._state['closed']:
+                return None
+            self._state['closed'] = True
+            for topic in self._open_topics.values():
+                for filtered_topic in topic._filtered_topics.values():
+                    topic.unsubscribe(filtered_topic)
+                topic.unsubscribe()
+                topic._release()
+
+        if wait:
+            self._teardown()
+            return None
+        thread = threading.Thread(target=self._teardown, name='dds-close')
+        thread.start()
+        return thread
+
+    @staticmethod
+    def close_all(instances=None):
+
+        """
+        Closes several DDS instances, deleting their participants concurrently, and
+        waits for them all. Meant for process shutdown.
+
+        Parameters:
+            instances ([DDS]) Optional. The instances to close. Defaults to every open
+                              DDS instance in the process.
+        """
+
+        if instances is None:
+            instances = list(_instances)
+        threads = [dds.close(wait=False) for dds in instances]
+        for thread in threads:
+            if thread is not None:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _register_type(self, data_type):
+        # Topics (filtered or not) of one type share a TypeSupport, which is
+        # registered with the participant by the first and unregistered by the last.
+        type_name = data_type._get_type_name()
+        with self._types_lock:
+            if self.closed:
+                raise Error('the DDS instance is closed')
+            entry = self._types.get(type_name)
+            if entry is None:
+                support = DDSFunc.DynamicDataTypeSupport_new(data_type._get_typecode(),
+                            get('DYNAMIC_DATA_TYPE_PROPERTY_DEFAULT', DDSType.DynamicDataTypeProperty_t))
+                support.register_type(self._participant, type_name)
+                entry = self._types[type_name] = [support, 0]
+            entry[1] += 1
+        return entry[0], type_name
+
+    def _unregister_type(self, type_name):
+        with self._types_lock:
+            entry = self._types[type_name]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._types[type_name]
+                entry[0].unregister_type(self._participant, type_name)
+                entry[0].delete()
+
+    def _get_topic(self, name, data_type, reader_profile=None, writer_profile=None):
+        with self._open_topics_lock:
+            res = self._open_topics.get(name, None)
+            if res is not None:
+                if data_type != res.data_type:
+                    raise ValueError('_get_topic called with a previous name but a different data_type')
+                if (reader_profile or writer_profile) and (reader_profile, writer_profile) != (res._reader_profile, res._writer_profile):
+                    raise ValueError('topic %r is already open with the QoS profiles %r' % (name, res.qos_profiles))
+                return res
+            res = Topic(self, name, data_type, reader_profile, writer_profile)
+            self._open_topics[name] = res
             return res
-        res = Topic(self, name, data_type)
-        self._open_topics[name] = res
-        return res
 
 
 class LibraryType(object):
     def __init__(self, libs, name):
         self._libs, self.name = libs, name
+        self._plans = {}
+        self._typecode = None
+        self._type_name = None
         del libs, name
 
-        assert self._get_typecode().name(ex()).replace('::', '_') == self.name.replace('::', '_')
+        assert self._get_type_name().replace('::', '_') == self.name.replace('::', '_')
 
     def _get_typecode(self):
-        for lib in self._libs:
-            if hasattr(lib, self.name + '_get_typecode'):
-                f = getattr(lib, self.name + '_get_typecode')
-                f.argtypes = []
-                f.restype = ctypes.POINTER(DDSType.TypeCode)
-                f.errcheck = check_null
-                return f()
-        raise ValueError("Couldn't find the topic in the provided libraries. Tried to find: " + self.name)
+        # The generated X_get_typecode functions return a static TypeCode, so it is kept.
+        if self._typecode is None:
+            for lib in self._libs:
+                if hasattr(lib, self.name + '_get_typecode'):
+                    f = getattr(lib, self.name + '_get_typecode')
+                    f.argtypes = []
+                    f.restype = ctypes.POINTER(DDSType.TypeCode)
+                    f.errcheck = check_null
+                    self._typecode = f()
+                    break
+            else:
+                raise ValueError("Couldn't find the topic in the provided libraries. Tried to find: " + self.name)
+        return self._typecode
+
+    def _get_type_name(self):
+        if self._type_name is None:
+            self._type_name = self._get_typecode().name(ex())
+        return self._type_name
+
+    def _get_plan(self, arrays=False):
+        plan = self._plans.get(arrays)
+        if plan is None:
+            plan = self._plans[arrays] = _plan_for(self._get_typecode(), arrays)
+        return plan
+
+# Type libraries and the types looked up in them are shared by every DDS
+# instance in the process, so a type's TypeCode and plan are only resolved once.
+_libraries = {}      # path -> CDLL
+_library_types = {}  # (library paths, type) -> LibraryType
+
+def _load_library(path):
+    lib = _libraries.get(path)
+    if lib is None:
+        lib = _libraries.setdefault(path, ctypes.CDLL(path))
+    return lib
 
 class Library(object):
     def __init__(self, so_paths):
-        self._libs = map(ctypes.CDLL, so_paths)
+        self._paths = tuple(so_paths)
+        self._libs = map(_load_library, so_paths)
 
     def __getattr__(self, attr):
-        res = LibraryType(self._libs, attr)
+        key = (self._paths, attr)
+        res = _library_types.get(key)
+        if res is None:
+            res = _library_types.setdefault(key, LibraryType(self._libs, attr))
         setattr(self, attr, res)
         return res
@@ -0,0 +1,38 @@
+#!/usr/bin/env python2.7
+"""
+Runs pyDDS's tests against the in-memory stand-in for the RTI C API in
+benchmarks/stub (see benchmarks/README.md). Build the stub first with `make' in
+benchmarks/, then:
+
+    python2.7 tests/run.py [-v] [test_module ...]
+"""
+
+import os
+import sys
+import unittest
+
+HERE  = os.path.dirname(os.path.abspath(__file__))
+ROOT  = os.path.dirname(HERE)
+BUILD = os.path.join(ROOT, 'benchmarks', 'build')
+
+# dlopen only reads LD_LIBRARY_PATH at startup, so re-exec with the stub on it.
+if BUILD not in os.environ.get('LD_LIBRARY_PATH', '').split(os.pathsep):
+    if not os.path.exists(os.path.join(BUILD, 'libnddsc.so')):
+        sys.exit('The stub libraries are not built. Run `make\' in %s first.' % os.path.dirname(BUILD))
+    os.environ['LD_LIBRARY_PATH'] = os.pathsep.join(filter(None, [BUILD, os.environ.get('LD_LIBRARY_PATH')]))
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    verbosity = 2 if '-v' in args else 1
+    names = [a for a in args if a != '-v']
+    loader = unittest.TestLoader()
+    if names:
+        suite = loader.loadTestsFromNames(names)
+    else:
+        suite = loader.discover(HERE, top_level_dir=HERE)
+    result = unittest.TextTestRunner(verbosity=verbosity).run(suite)
+    sys.exit(not result.wasSuccessful())
@@ -0,0 +1,79 @@
+"""Sequences and arrays of primitives. Run through tests/run.py."""
+
+import array
+import sys
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ArraysTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.SequenceHeavy')
+        self.topic.take_next()  # make the reader, which only gets samples published after it
+
+    def tearDown(self):
+        self.dds.close()
+
+    def round_trip(self, sample):
+        self.topic.publish(sample)
+        return self.topic.take_next()
+
+    def test_lists(self):
+        got = self.round_trip({'id': 1, 'points': [0.5, 1.5], 'indices': [1, -2, 3], 'blob': [7] * 64})
+        self.assertEqual((got['points'], got['indices']), ([0.5, 1.5], [1, -2, 3]))
+        self.assertEqual(got['blob'], [7] * 64)
+        self.assertEqual(got['covariance'], [0.0] * 36)
+
+    def test_array_arrays(self):
+        self.topic.arrays = True
+        got = self.round_trip({'id': 1, 'indices': array.array('i', [4, 5]), 'blob': '\x01' * 64})
+        self.assertEqual(got['indices'], array.array('i', [4, 5]))
+        self.assertEqual(got['blob'], '\x01' * 64)
+
+    def test_out_of_range(self):
+        self.assertRaises(ValueError, self.topic.publish, {'indices': [2 ** 31]})
+        self.assertRaises(ValueError, self.topic.publish, {'blob': [-1] * 64})
+
+    def test_wrong_array_length(self):
+        self.assertRaises(ValueError, self.topic.publish, {'covariance': [1.0] * 37})
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_numpy(self):
+        got = self.round_trip({'id': 1, 'indices': numpy.arange(3), 'blob': numpy.ones(64, numpy.uint8),
+                               'covariance': numpy.eye(6)})
+        self.assertEqual(got['indices'], [0, 1, 2])
+        self.assertEqual(got['blob'], [1] * 64)
+        self.assertEqual(got['covariance'][:7], [1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_numpy_out_of_range(self):
+        self.assertRaises(ValueError, self.topic.publish, {'indices': numpy.array([0, 2 ** 40])})
+        self.assertRaises(ValueError, self.topic.publish, {'indices': numpy.array([1.0, 1e20])})
+        self.assertRaises(ValueError, self.topic.publish, {'blob': numpy.full(64, 256, numpy.int32)})
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_numpy_bounds_checked_without_iterating(self):
+        class NotIterable(numpy.ndarray):
+            def __iter__(self):
+                raise AssertionError('iterated over the array in Python')
+
+        indices = numpy.arange(1024).view(NotIterable)         # checked with min() and max()
+        blob = numpy.zeros(64, numpy.int8).view(NotIterable)   # checked
+        small = numpy.arange(1024, dtype=numpy.int16).view(NotIterable)  # fits, not checked
+        self.round_trip({'id': 1, 'indices': indices, 'blob': numpy.abs(blob)})
+        got = self.round_trip({'id': 2, 'indices': small})
+        self.assertEqual(got['indices'][-1], 1023)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""Batch subscriptions. Run through tests/run.py."""
+
+import ctypes
+import sys
+import time
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+
+    def tearDown(self):
+        self.dds.close()
+
+    def subscribe_batch(self, **kwargs):
+        batches = []
+        kwargs.setdefault('dispatcher', 'inline')
+        subscription = self.topic.subscribe_batch(lambda samples, infos: batches.append((samples, infos)), **kwargs)
+        return subscription, batches
+
+    def test_batch(self):
+        subscription, batches = self.subscribe_batch()
+        self.topic.publish({'id': 4})
+        (samples, infos), = batches
+        self.assertEqual([s['id'] for s in samples], [4])
+        self.assertTrue(infos[0].valid_data)
+        self.assertIsInstance(subscription, dds.BatchSubscription)
+
+    def test_several_batch_subscriptions(self):
+        first, first_batches = self.subscribe_batch()
+        second, second_batches = self.subscribe_batch()
+        self.topic.publish({'id': 1})
+        self.assertEqual((len(first_batches), len(second_batches)), (1, 1))
+
+        first.unsubscribe()
+        self.topic.publish({'id': 2})
+        self.assertEqual((len(first_batches), len(second_batches)), (1, 2))
+        self.assertEqual(second_batches[-1][0][0]['id'], 2)
+
+    def test_unsubscribe_through_topic(self):
+        subscription, batches = self.subscribe_batch()
+        self.topic.unsubscribe(subscription)
+        self.topic.publish({'id': 1})
+        self.assertEqual(batches, [])
+
+        self.subscribe_batch()
+        self.topic.subscribe(lambda sample: None)
+        self.topic.unsubscribe()
+        self.assertEqual(self.topic._batchers, [])
+        self.assertIsNone(self.topic._listener)
+
+    def test_listener_kept_for_other_subscriptions(self):
+        got = []
+        self.topic.subscribe(got.append, dispatcher='inline')
+        subscription, batches = self.subscribe_batch()
+        subscription.unsubscribe()
+        self.topic.publish({'id': 1})
+        self.assertEqual(len(got), 1)
+
+    def test_subscription_used_as_topic(self):
+        subscription, batches = self.subscribe_batch()
+        subscription.publish({'id': 9})
+        self.assertEqual(batches[0][0][0]['id'], 9)
+        self.assertEqual(subscription.name, 'Flat')
+
+    def test_max_batch(self):
+        subscription, batches = self.subscribe_batch(max_batch=2, max_latency=5.0)
+        for i in xrange(5):
+            self.topic.publish({'id': i})
+        self.assertEqual([[s['id'] for s in samples] for samples, _ in batches], [[0, 1], [2, 3]])
+        subscription.unsubscribe()  # delivers what is pending
+        self.assertEqual([s['id'] for s in batches[-1][0]], [4])
+
+    def test_max_latency(self):
+        subscription, batches = self.subscribe_batch(max_latency=0.05)
+        for i in xrange(3):
+            self.topic.publish({'id': i})
+        deadline = time.time() + 5.0
+        while not batches and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([s['id'] for s in batches[0][0]], [0, 1, 2])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_dicts_and_columns_on_one_topic(self):
+        _, dict_batches = self.subscribe_batch()
+        _, record_batches = self.subscribe_batch(columns='records')
+        _, field_batches = self.subscribe_batch(columns='fields')
+        self.topic.publish({'id': 7, 'x': 2.5})
+        self.assertEqual(dict_batches[0][0][0]['x'], 2.5)
+        records = record_batches[0][0]
+        self.assertEqual(records.dtype, self.topic.dtype)
+        self.assertEqual((records['id'][0], records['x'][0]), (7, 2.5))
+        self.assertEqual(list(field_batches[0][0]['id']), [7])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_wchar_column_matches_wchar_t(self):
+        dds._import_numpy('columnar batches')
+        wchar = dds._numpy_type(dds.TCKind.WCHAR)
+        self.assertEqual(wchar.itemsize, ctypes.sizeof(ctypes.c_wchar))
+
+        saved = dds.DDS_Wchar
+        dds.DDS_Wchar = ctypes.c_uint16  # as on Windows
+        try:
+            self.assertEqual(dds._numpy_type(dds.TCKind.WCHAR), numpy.dtype(numpy.uint16))
+        finally:
+            dds.DDS_Wchar = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
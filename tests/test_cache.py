@@ -0,0 +1,75 @@
+"""The per-instance cache (Topic.cache). Run through tests/run.py."""
+
+import sys
+import threading
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+
+    def tearDown(self):
+        self.dds.close()
+
+    def test_cache(self):
+        cache = self.topic.cache(max_instances=3)
+        self.assertIs(self.topic.cache(), cache)
+        for i in xrange(5):
+            self.topic.publish({'id': i, 'x': float(i)})
+        self.topic.publish({'id': 3, 'x': 33.0})
+        self.assertEqual(sorted(cache.snapshot()), [(2,), (3,), (4,)])
+        self.assertEqual((len(cache), cache.evicted), (3, 2))
+        self.assertEqual((cache[3]['x'], cache.get(0), cache.get({'id': 4})['x']), (33.0, None, 4.0))
+        self.assertTrue((4,) in cache)
+        self.assertRaises(KeyError, cache.__getitem__, 0)
+
+        self.topic.dispose({'id': 3})
+        self.assertEqual(sorted(cache.snapshot()), [(2,), (4,)])
+        self.topic.unsubscribe()
+        self.assertIsNone(self.topic._cache)
+
+    def test_eviction_order_follows_updates(self):
+        cache = self.topic.cache(max_instances=2)
+        self.topic.publish({'id': 1})
+        self.topic.publish({'id': 2})
+        self.topic.publish({'id': 1, 'x': 1.5})
+        self.topic.publish({'id': 3})
+        self.assertEqual(sorted(cache.snapshot()), [(1,), (3,)])
+
+    def test_reads_while_updating(self):
+        # An update re-inserts its instance; a reader must never see it missing.
+        cache = self.topic.cache()
+        self.topic.publish({'id': 1})
+        self.topic.publish({'id': 2})
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)  # switch threads as often as possible
+        self.addCleanup(sys.setcheckinterval, interval)
+
+        stop = threading.Event()
+        def update():
+            count = 0
+            while not stop.is_set():
+                count += 1
+                self.topic.publish({'id': 1, 'count': count})
+        updater = threading.Thread(target=update)
+        updater.start()
+        misses = 0
+        try:
+            for _ in xrange(20000):
+                if cache.get(1) is None or 1 not in cache or len(cache) != 2:
+                    misses += 1
+        finally:
+            stop.set()
+            updater.join()
+        self.assertEqual(misses, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Using a topic after its DDS instance is closed. Run through tests/run.py."""
+
+import sys
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+
+class UseAfterCloseTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+        # Make the reader, the writer and their reusable samples before closing.
+        self.topic.publish({'id': 1})
+        self.topic.take_next()
+
+    def closed(self, wait=True):
+        thread = self.dds.close(wait=wait)
+        if thread is not None:
+            thread.join()
+        return self.topic
+
+    def assertClosed(self, call, *args, **kwargs):
+        self.assertRaisesRegexp(dds.Error, 'closed', call, *args, **kwargs)
+
+    def test_take_next(self):
+        self.assertClosed(self.closed().take_next)
+
+    def test_take_next_without_reusable_sample(self):
+        topic = self.dds.get_topic('bench.Nested')
+        self.dds.close()
+        self.assertClosed(topic.take_next)
+
+    def test_publish(self):
+        self.assertClosed(self.closed().publish, {'id': 1})
+
+    def test_publish_with_metrics(self):
+        self.dds.enable_metrics()
+        self.assertClosed(self.closed().publish, {'id': 1})
+
+    def test_publish_many(self):
+        result = self.closed().publish_many([{'id': 1}, {'id': 2}])
+        self.assertEqual(result['published'], 0)
+        self.assertEqual(len(result['failed']), 2)
+
+    def test_register_instance_and_dispose(self):
+        topic = self.closed()
+        self.assertClosed(topic.register_instance, 1)
+        self.assertClosed(topic.dispose, {'id': 1})
+
+    def test_poll(self):
+        topic = self.closed()
+        self.assertClosed(topic.take)
+        self.assertClosed(topic.read)
+        self.assertClosed(topic.wait, 0.01)
+
+    def test_subscribe(self):
+        topic = self.closed()
+        self.assertClosed(topic.subscribe, lambda sample: None)
+        self.assertClosed(topic.subscribe_batch, lambda samples, infos: None)
+
+    def test_close_in_background(self):
+        self.assertClosed(self.closed(wait=False).take_next)
+
+    def test_get_topic(self):
+        self.dds.close()
+        self.assertClosed(self.dds.get_topic, 'bench.Wide')
+
+    def test_close_twice(self):
+        self.dds.close()
+        self.assertIsNone(self.dds.close())
+        self.assertTrue(self.dds.closed)
+
+    def test_context_manager(self):
+        with dds.DDS('bench_types') as instance:
+            topic = instance.get_topic('bench.Flat')
+            topic.publish({'id': 1})
+        self.assertTrue(instance.closed)
+        self.assertClosed(topic.publish, {'id': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Discovery (subscribe_to_all_topics) and concurrent get_topic. Run through tests/run.py."""
+
+import sys
+import threading
+import time
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import StringIO
+
+import dds
+
+
+def wait_for(test, timeout=5.0):
+    deadline = time.time() + timeout
+    while not test() and time.time() < deadline:
+        time.sleep(0.01)
+    return test()
+
+def discovery_threads():
+    return [t for t in threading.enumerate() if t.name == 'dds-discovery']
+
+
+class DiscoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.publisher = dds.DDS('bench_types')
+        self.got = []
+
+    def tearDown(self):
+        self.publisher.close()
+
+    def subscribe_to_all(self, **kwargs):
+        instance = dds.subscribe_to_all_topics('bench_types', self.got.append, dispatcher='inline', **kwargs)
+        self.addCleanup(instance.close)
+        return instance
+
+    def publish(self, qualified_name, sample_id):
+        self.publisher.get_topic(qualified_name).publish({'id': sample_id})
+
+    def test_subscribes_to_published_types(self):
+        instance = self.subscribe_to_all(exclude=['bench::Nested'])
+        self.publish('bench.Flat', 1)
+        self.publish('bench.Nested', 2)
+        self.assertTrue(wait_for(lambda: instance.discovery.stats()['discovered'] == 2))
+        self.publish('bench.Flat', 3)
+        self.publish('bench.Nested', 4)
+        # Whether sample 1 arrives depends on when the reader was made.
+        self.assertEqual([(g['name'], g['data']['id']) for g in self.got if g['data']['id'] != 1], [('bench::Flat', 3)])
+        self.assertEqual(sorted(instance.discovery.topics()), ['bench::Flat'])
+        stats = instance.discovery.stats()
+        self.assertEqual((stats['subscribed'], stats['filtered'], stats['failed']), (1, 1, 0))
+
+    def test_stop(self):
+        instance = self.subscribe_to_all()
+        instance.discovery.stop()
+        self.assertEqual(discovery_threads(), [])
+        instance.discovery.stop()
+        self.publish('bench.Flat', 1)
+        time.sleep(0.05)
+        self.assertEqual(instance.discovery.stats()['discovered'], 0)
+
+    def test_stop_racing_close(self):
+        for _ in xrange(50):
+            instance = dds.subscribe_to_all_topics('bench_types', self.got.append, dispatcher='inline')
+            instance.discovery.stop(wait=False)
+            instance.close()
+        self.assertTrue(wait_for(lambda: discovery_threads() == []))
+
+    def test_stop_after_the_thread_died(self):
+        instance = self.subscribe_to_all()
+
+        def broken(type_name):
+            raise RuntimeError('discovery failed')
+        instance.discovery._wanted = broken
+
+        stderr, sys.stderr = sys.stderr, StringIO.StringIO()  # the thread's traceback
+        try:
+            self.publish('bench.Flat', 1)
+            self.assertTrue(wait_for(lambda: discovery_threads() == []))
+        finally:
+            sys.stderr = stderr
+        instance.discovery.stop()
+        instance.close()
+
+    def test_close_stops_discovery(self):
+        instance = self.subscribe_to_all()
+        self.assertEqual(len(discovery_threads()), 1)
+        instance.close()
+        self.assertEqual(discovery_threads(), [])
+
+
+class ConcurrentGetTopicTest(unittest.TestCase):
+    def test_one_topic_per_name(self):
+        with dds.DDS('bench_types') as instance:
+            for name in ('bench.Flat', 'bench.Nested', 'bench.Wide'):
+                start = threading.Event()
+                topics = []
+
+                def get():
+                    start.wait()
+                    topics.append(instance.get_topic(name))
+
+                threads = [threading.Thread(target=get) for _ in xrange(8)]
+                for thread in threads:
+                    thread.start()
+                start.set()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(len(set(map(id, topics))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Dispatcher selection and lifecycle. Run through tests/run.py."""
+
+import sys
+import threading
+import time
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import StringIO
+
+import dds
+
+
+def dispatch_threads():
+    return [t for t in threading.enumerate() if t.name == 'dds-dispatch']
+
+def wait_for(test, timeout=5.0):
+    deadline = time.time() + timeout
+    while not test() and time.time() < deadline:
+        time.sleep(0.01)
+    return test()
+
+
+class DispatcherLifecycleTest(unittest.TestCase):
+    def setUp(self):
+        self.before = len(dispatch_threads())
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+
+    def tearDown(self):
+        self.dds.close()
+
+    def test_names_share_one_dispatcher(self):
+        self.assertIs(self.dds._get_dispatcher('keyed'), self.dds._dispatcher)
+        self.assertIs(self.dds._get_dispatcher('pool'), self.dds._get_dispatcher('pool'))
+        self.assertIsNot(self.dds._get_dispatcher('pool'), self.dds._dispatcher)
+
+    def test_subscribing_by_name_does_not_add_threads(self):
+        self.topic.subscribe(lambda sample: None, dispatcher='pool').unsubscribe()
+        running = len(dispatch_threads())
+        for _ in xrange(50):
+            for name in ('keyed', 'pool'):
+                self.topic.subscribe(lambda sample: None, dispatcher=name)
+                self.topic.subscribe_batch(lambda samples, infos: None, dispatcher=name)
+                self.topic.subscribe_status(lambda event: None, dispatcher=name)
+                self.topic.unsubscribe()
+        self.assertEqual(len(dispatch_threads()), running)
+
+    def test_close_stops_named_dispatchers(self):
+        got = []
+        self.topic.subscribe(got.append, dispatcher='pool')
+        self.topic.publish({'id': 1})
+        self.assertTrue(wait_for(lambda: got))
+        self.assertGreater(len(dispatch_threads()), self.before)
+        self.dds.close()
+        self.assertTrue(wait_for(lambda: len(dispatch_threads()) == self.before))
+
+    def test_given_dispatcher_is_left_running(self):
+        dispatcher = dds.ThreadPoolDispatcher(workers=1)
+        try:
+            got = []
+            self.topic.subscribe(got.append, dispatcher=dispatcher)
+            self.dds.close()
+            done = threading.Event()
+            dispatcher.dispatch(None, lambda data: done.set(), None)
+            self.assertTrue(done.wait(5.0))
+        finally:
+            dispatcher.close()
+
+    def test_unknown_name(self):
+        self.assertRaises(ValueError, self.topic.subscribe, lambda sample: None, dispatcher='nope')
+        self.assertRaises(ValueError, dds.DDS, 'bench_types', dispatcher='nope')
+
+    def test_no_dispatcher_after_close(self):
+        self.dds.close()
+        self.assertRaises(dds.Error, self.dds._get_dispatcher, 'pool')
+
+
+class DispatchOrderTest(unittest.TestCase):
+    def test_keyed_keeps_instance_order(self):
+        with dds.DDS('bench_types') as instance:
+            topic = instance.get_topic('bench.Flat')
+            got = []
+            topic.subscribe(lambda sample: got.append((sample['id'], sample['count'])))
+            for count in xrange(200):
+                topic.publish({'id': count % 4, 'count': count})
+            self.assertTrue(wait_for(lambda: len(got) == 200))
+            for key in xrange(4):
+                counts = [c for i, c in got if i == key]
+                self.assertEqual(counts, sorted(counts))
+
+
+class DispatcherStatsTest(unittest.TestCase):
+    def setUp(self):
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)  # switch threads as often as possible
+        self.addCleanup(sys.setcheckinterval, interval)
+        self.stderr, sys.stderr = sys.stderr, StringIO.StringIO()  # tracebacks of the failing callbacks
+        self.addCleanup(setattr, sys, 'stderr', self.stderr)
+
+    def callback(self, n):
+        if n % 500 == 0:
+            raise ValueError(n)
+
+    def test_counts_from_many_threads(self):
+        # An inline dispatcher runs callbacks on whichever listener threads call it.
+        dispatcher = dds.InlineDispatcher()
+        def listener():
+            for n in xrange(1, 5001):
+                dispatcher.dispatch(None, self.callback, n)
+        threads = [threading.Thread(target=listener) for _ in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = dispatcher.stats()
+        self.assertEqual((stats['dispatched'], stats['errors']), (40000, 80))
+
+    def test_counts_from_pool_workers(self):
+        dispatcher = dds.ThreadPoolDispatcher(workers=8, max_queue=0)
+        for n in xrange(1, 10001):
+            dispatcher.dispatch(None, self.callback, n)
+        dispatcher.close()
+        stats = dispatcher.stats()
+        self.assertEqual((stats['dispatched'], stats['errors'], stats['queue_depth']), (10000, 20, 0))
+
+if __name__ == '__main__':
+    unittest.main()
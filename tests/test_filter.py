@@ -0,0 +1,69 @@
+"""Content filter parameters. Run through tests/run.py."""
+
+import ctypes
+import sys
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+# Counter indices, as in benchmarks/stub/nddsc_stub.c
+CNT_STRING_SEQ_ALLOC = 11
+CNT_STRING_SEQ_FREE  = 12
+
+
+class FilterParametersTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+        self.lib = dds._ddsc_lib
+        self.lib.stub_cft_parameter.restype = ctypes.c_char_p
+
+    def tearDown(self):
+        self.dds.close()
+
+    def cft_parameters(self, filtered):
+        # The parameters the ContentFilteredTopic itself holds.
+        res = []
+        while self.lib.stub_cft_parameter(filtered._topic, len(res)) is not None:
+            res.append(self.lib.stub_cft_parameter(filtered._topic, len(res)))
+        return res
+
+    def string_seqs(self):
+        return self.lib.stub_get_counter(CNT_STRING_SEQ_ALLOC) - self.lib.stub_get_counter(CNT_STRING_SEQ_FREE)
+
+    def subscribe(self):
+        return self.topic.subscribe(lambda sample: None, dispatcher='inline',
+                                    filter_expression='x > %0 AND mode = %1', filter_parameters=[1.5, "'ACTIVE'"])
+
+    def test_parameters_reach_the_filter(self):
+        filtered = self.subscribe()
+        self.assertEqual(filtered.filter_parameters, ['1.5', "'ACTIVE'"])
+        self.assertEqual(self.cft_parameters(filtered), ['1.5', "'ACTIVE'"])
+
+        reader = filtered._reader
+        filtered.set_filter_parameters(10, "'IDLE'")
+        self.assertEqual(filtered.filter_parameters, ['10', "'IDLE'"])
+        self.assertEqual(self.cft_parameters(filtered), ['10', "'IDLE'"])
+        self.assertIs(filtered._reader, reader)
+
+    def test_sequences_released(self):
+        filtered = self.subscribe()
+        seqs = self.string_seqs()
+        for i in xrange(5):
+            filtered.set_filter_parameters(i, "'IDLE'")
+        self.assertEqual(self.string_seqs(), seqs)
+
+    def test_rejected_parameters(self):
+        filtered = self.subscribe()
+        seqs = self.string_seqs()
+        self.assertRaises(dds.Error, filtered.set_filter_parameters, *range(101))
+        self.assertEqual(self.string_seqs(), seqs)
+        self.assertEqual(filtered.filter_parameters, ['1.5', "'ACTIVE'"])
+        self.assertEqual(self.cft_parameters(filtered), ['1.5', "'ACTIVE'"])
+
+
+if __name__ == '__main__':
+    unittest.main()
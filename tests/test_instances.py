@@ -0,0 +1,62 @@
+"""Instance registration, writes by handle and disposal. Run through tests/run.py."""
+
+import sys
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+
+class InstanceTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+        self.topic.take()  # make the reader before publishing
+
+    def tearDown(self):
+        self.dds.close()
+
+    def test_register_instance(self):
+        handle = self.topic.register_instance({'id': 5})
+        self.assertTrue(handle.isValid)
+        self.assertIs(self.topic.register_instance(5), handle)
+        self.assertIs(self.topic.register_instance((5,)), handle)
+        self.topic.publish({'x': 2.5}, handle=handle)
+        self.assertEqual([(s['id'], s['x']) for s in self.topic.take()], [(5, 2.5)])
+
+        self.topic.unregister_instance(handle)
+        self.assertRaises(dds.Error, self.topic.publish, {'x': 1.0}, handle=handle)
+        self.assertRaises(dds.Error, self.topic.unregister_instance, 5)
+        self.assertRaises(ValueError, self.topic.register_instance, ())
+
+    def test_max_registered_instances(self):
+        self.topic.max_registered_instances = 2
+        handles = [self.topic.register_instance(i) for i in xrange(3)]
+        self.assertEqual(list(self.topic._handles), [(1,), (2,)])
+        self.assertRaises(dds.Error, self.topic.publish, {}, handle=handles[0])
+
+    def test_dispose(self):
+        self.topic.publish({'id': 1})
+        self.topic.take()
+        self.topic.dispose({'id': 1})
+        (sample, info), = self.topic.take(info=True)
+        self.assertEqual(sample['id'], 1)
+        self.assertFalse(info.valid_data)
+        self.assertEqual(info.instance_state, dds.DDS_NOT_ALIVE_DISPOSED_INSTANCE_STATE)
+
+    def test_dispose_by_handle(self):
+        handle = self.topic.register_instance(2)
+        self.topic.publish({}, handle=handle)
+        self.topic.take()
+        self.topic.dispose(handle=handle)
+        (sample, info), = self.topic.take(info=True)
+        self.assertEqual((sample['id'], info.instance_state), (2, dds.DDS_NOT_ALIVE_DISPOSED_INSTANCE_STATE))
+
+    def test_dispose_needs_an_instance(self):
+        self.assertRaises(ValueError, self.topic.dispose)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""Lazy SampleView subscriptions. Run through tests/run.py."""
+
+import sys
+import threading
+import time
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+
+class LazyTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Wide')
+
+    def tearDown(self):
+        self.dds.close()
+
+    def publish(self, count):
+        for i in xrange(count):
+            self.topic.publish({'id': i, 'f01': i * 2})
+
+    def test_inline_view(self):
+        got = []
+        self.topic.subscribe(lambda view: got.append((view['id'], view['f01'])), dispatcher='inline', lazy=True)
+        self.publish(3)
+        self.assertEqual(got, [(0, 0), (1, 2), (2, 4)])
+
+    def test_view_used_after_the_take(self):
+        kept = []
+        self.topic.subscribe(kept.append, dispatcher='inline', lazy=True)
+        self.publish(1)
+        view, = kept
+        self.assertRaises(dds.Error, view.__getitem__, 'f02')
+
+    def test_lazy_needs_inline_dispatcher(self):
+        self.assertRaises(ValueError, self.topic.subscribe, lambda view: None, lazy=True)
+        self.assertRaises(ValueError, self.topic.subscribe, lambda view: None, lazy=True, dispatcher='pool')
+
+    def test_copy_kept_by_inline_callback(self):
+        kept = []
+        self.topic.subscribe(kept.append, dispatcher='inline', lazy='copy')
+        self.publish(2)
+        self.assertEqual([(view['id'], view['f01'], view['f02']) for view in kept], [(0, 0, 0), (1, 2, 0)])
+
+    def test_copy_not_kept_is_not_decoded(self):
+        calls = dds._ddsc_lib.stub_get_counter  # DynamicData get/set calls, see benchmarks/bench.py
+        self.topic.subscribe(lambda view: view['id'], dispatcher='inline', lazy='copy')
+        self.publish(1)
+        dds._ddsc_lib.stub_reset_counters()
+        self.publish(1)
+        self.assertLess(calls(8), 10)
+
+    def check_copy_under(self, dispatcher, count=2000):
+        got, errors = [], []
+        done = threading.Event()
+
+        def callback(view):
+            try:
+                got.append((view['id'], view['f01']))
+            except Exception as e:
+                errors.append(e)
+            if len(got) + len(errors) == count:
+                done.set()
+
+        kwargs = {} if dispatcher is None else {'dispatcher': dispatcher}
+        self.topic.subscribe(callback, lazy='copy', **kwargs)
+        self.publish(count)
+        self.assertTrue(done.wait(10.0))
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(got), [(i, i * 2) for i in xrange(count)])
+
+    def test_copy_under_default_dispatcher(self):
+        self.check_copy_under(None)
+
+    def test_copy_under_pool_dispatcher(self):
+        self.check_copy_under('pool')
+
+    def test_copy_with_slow_callbacks(self):
+        # Workers still decoding while the listener returns the loan.
+        got = []
+        done = threading.Event()
+
+        def callback(view):
+            time.sleep(0.001)
+            got.append(view.materialize())
+            if len(got) == 50:
+                done.set()
+
+        self.topic.subscribe(callback, lazy='copy', dispatcher='pool')
+        self.publish(50)
+        self.assertTrue(done.wait(10.0))
+        self.assertEqual(sorted(sample['id'] for sample in got), range(50))
+        self.assertTrue(all(len(sample) == len(got[0]) for sample in got))
+
+
+if __name__ == '__main__':
+    unittest.main()
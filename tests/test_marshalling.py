@@ -0,0 +1,103 @@
+"""Converting samples between dictionaries and DynamicData. Run through tests/run.py."""
+
+import collections
+import sys
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+
+class MarshallingTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+
+    def tearDown(self):
+        self.dds.close()
+
+    def round_trip(self, qualified_name, sample):
+        topic = self.dds.get_topic(qualified_name)
+        topic.take()  # make the reader before publishing
+        topic.publish(sample)
+        return topic.take_next()
+
+    def test_primitives_and_enum(self):
+        sample = {'id': -7, 'sequence': 2 ** 63, 'x': 1.5, 'roll': 0.25, 'count': 2 ** 32 - 1,
+                  'offset': -5, 'port': 65535, 'stamp': -2 ** 63, 'valid': True, 'flags': 255,
+                  'grade': 'A', 'mode': 'FAULT'}
+        got = self.round_trip('bench.Flat', sample)
+        for name, value in sample.items():
+            self.assertEqual(got[name], value, name)
+
+    def test_defaults(self):
+        got = self.round_trip('bench.Flat', {'id': 1})
+        self.assertEqual((got['x'], got['count'], got['valid'], got['mode']), (0.0, 0, False, 'IDLE'))
+
+    def test_nested(self):
+        pose = {'position': {'x': 1.0, 'y': 2.0, 'z': 3.0}, 'velocity': {'x': -1.0, 'y': 0.0, 'z': 0.5}, 'heading': 0.75}
+        got = self.round_trip('bench.Nested', {'id': 2, 'pose': pose, 'target': {'heading': 1.5}, 'mode': 'ACTIVE'})
+        self.assertEqual(got['pose'], pose)
+        self.assertEqual(got['target']['heading'], 1.5)
+        self.assertEqual(got['target']['position'], {'x': 0.0, 'y': 0.0, 'z': 0.0})
+
+    def test_strings(self):
+        sample = {'name': 'key', 'description': 'd' * 256, 'units': '', 'tags': ['a', 'bc', '']}
+        got = self.round_trip('bench.StringHeavy', sample)
+        for name, value in sample.items():
+            self.assertEqual(got[name], value, name)
+        self.assertEqual(got['source'], '')
+
+    def test_publish_is_sparse(self):
+        # Fields left out of a publish get their defaults, not the previous values.
+        topic = self.dds.get_topic('bench.Wide')
+        topic.take()
+        topic.publish({'id': 1, 'f01': 1.5, 'f03': 3})
+        topic.publish({'id': 2, 'f02': 2.5})
+        first, second = topic.take()
+        self.assertEqual((first['f01'], first['f03']), (1.5, 3))
+        self.assertEqual((second['f01'], second['f02'], second['f03']), (0.0, 2.5, 0))
+
+    def test_errors(self):
+        topic = self.dds.get_topic('bench.Flat')
+        self.assertRaises(Exception, topic.publish, {'mode': 'NO_SUCH_MODE'})
+        self.assertRaises(Exception, topic.publish, {'id': 'not a number'})
+        self.assertRaises(ValueError, topic.publish, {'port': 65536})
+        self.assertRaises(ValueError, self.dds.get_topic('bench.StringHeavy').publish, {'name': 'a\0b'})
+
+    def test_any_mapping(self):
+        class Sample(collections.Mapping):
+            def __init__(self, **fields):
+                self.fields = fields
+            def __getitem__(self, name):
+                return self.fields[name]
+            def __iter__(self):
+                return iter(self.fields)
+            def __len__(self):
+                return len(self.fields)
+
+        got = self.round_trip('bench.Nested', Sample(id=4, pose=Sample(heading=0.5)))
+        self.assertEqual((got['id'], got['pose']['heading']), (4, 0.5))
+        topic = self.dds.get_topic('bench.Nested')
+        self.assertRaises(TypeError, topic.publish, [('id', 1)])
+        self.assertRaises(TypeError, topic.publish, {'pose': 0.5})
+        self.assertRaises(TypeError, self.dds.get_topic('bench.StringHeavy').publish, {'tags': 'abc'})
+
+    def test_unknown_fields_are_ignored(self):
+        self.assertEqual(self.round_trip('bench.Flat', {'id': 5, 'no_such_field': 1})['id'], 5)
+
+    def test_unpack_and_write_dd(self):
+        topic = self.dds.get_topic('bench.Nested')
+        topic.take()
+        topic.publish({'id': 3, 'pose': {'heading': 2.0}})
+        sample = topic._resources['publish_sample']
+        unpacked = dds.unpack_dd(sample)
+        self.assertEqual(unpacked['pose']['heading'], 2.0)
+        unpacked['mode'] = 'FAULT'
+        dds.write_into_dd(unpacked, sample)
+        self.assertEqual(dds.unpack_dd(sample), unpacked)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Metrics and their Prometheus export. Run through tests/run.py."""
+
+import re
+import sys
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import StringIO
+
+import dds
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+        self.got = []
+        self.topic.subscribe(self.got.append, dispatcher='inline')
+
+    def tearDown(self):
+        self.dds.close()
+
+    def test_off_by_default(self):
+        self.topic.publish({'id': 1})
+        self.assertIsNone(self.dds.metrics)
+        self.assertIsNone(self.topic.metrics())
+
+    def test_publish_and_take(self):
+        other = self.dds.get_topic('bench.Nested')
+        self.assertIs(self.topic.enable_metrics(), self.dds.metrics)
+        self.topic.publish({'id': 1})
+        other.publish({'id': 1})
+        self.assertEqual(len(self.got), 1)
+
+        snapshot = self.topic.metrics()
+        self.assertEqual((snapshot['samples_published'], snapshot['samples_taken'], snapshot['callback_errors']), (1, 1, 0))
+        for name in ('unpack_seconds', 'queue_wait_seconds', 'callback_seconds', 'publish_marshal_seconds',
+                     'publish_write_seconds', 'latency_seconds'):
+            self.assertEqual(snapshot[name]['count'], 1, name)
+            self.assertGreaterEqual(snapshot[name]['sum'], 0, name)
+        take_size = snapshot['take_size']
+        self.assertEqual((take_size['count'], take_size['sum']), (1, 1))
+        self.assertEqual(take_size['buckets'][0], (1, 1))
+        self.assertEqual(take_size['buckets'][-1], (float('inf'), 1))
+        self.assertEqual(sorted(self.dds.metrics.snapshot()), ['Flat'])
+        self.assertIsNone(other.metrics())
+
+    def test_callback_errors(self):
+        self.topic.unsubscribe()
+        self.topic.subscribe(lambda sample: 1 / 0, dispatcher='inline')
+        self.dds.enable_metrics()
+        saved, sys.stderr = sys.stderr, StringIO.StringIO()
+        try:
+            self.topic.publish({'id': 1})
+        finally:
+            sys.stderr = saved
+        self.assertEqual(self.topic.metrics()['callback_errors'], 1)
+
+    def test_reset_and_disable(self):
+        metrics = self.dds.enable_metrics()
+        self.topic.publish({'id': 1})
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {})
+        self.dds.disable_metrics()
+        self.topic.publish({'id': 2})
+        self.assertIsNone(self.dds.metrics)
+        self.assertIsNone(self.topic.metrics())
+
+    def test_prometheus(self):
+        metrics = self.dds.enable_metrics()
+        for i in xrange(3):
+            self.topic.publish({'id': i})
+        lines = metrics.prometheus().splitlines()
+
+        self.assertIn('# HELP pydds_samples_published_total Samples published.', lines)
+        self.assertIn('# TYPE pydds_samples_published_total counter', lines)
+        self.assertIn('pydds_samples_published_total{topic="Flat"} 3', lines)
+        self.assertIn('pydds_samples_taken_total{topic="Flat"} 3', lines)
+        self.assertIn('# TYPE pydds_take_size histogram', lines)
+        self.assertIn('pydds_take_size_bucket{topic="Flat",le="1.0"} 3', lines)
+        self.assertIn('pydds_take_size_bucket{topic="Flat",le="+Inf"} 3', lines)
+        self.assertIn('pydds_take_size_sum{topic="Flat"} 3.0', lines)
+        self.assertIn('pydds_take_size_count{topic="Flat"} 3', lines)
+
+        sample = re.compile(r'^[a-z_]+\{topic="Flat"(,le="([0-9.e+-]+|\+Inf)")?\} [0-9.e+-]+$')
+        for line in lines:
+            self.assertTrue(line.startswith('# HELP ') or line.startswith('# TYPE ') or sample.match(line), line)
+
+        # Buckets are cumulative.
+        counts = [int(line.rsplit(' ', 1)[1]) for line in lines if line.startswith('pydds_callback_seconds_bucket')]
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(counts[-1], 3)
+
+        self.assertIn('app_samples_taken_total{topic="Flat"} 3', metrics.prometheus(prefix='app').splitlines())
+
+    def test_prometheus_labels_are_escaped(self):
+        self.assertEqual(dds._prometheus_label('a"b\\c\nd'), '"a\\"b\\\\c\\nd"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""QoS profiles for topics' readers and writers. Run through tests/run.py."""
+
+import ctypes
+import sys
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+
+class QosProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types', qos_library='Lib')
+        self.profile = dds._ddsc_lib.stub_entity_profile  # 'library::profile' an entity was made with
+        self.profile.restype = ctypes.c_char_p
+        self.profile.argtypes = [ctypes.c_void_p]
+
+    def tearDown(self):
+        self.dds.close()
+
+    def entity_profile(self, entity):
+        return self.profile(ctypes.cast(entity, ctypes.c_void_p))
+
+    def test_library_defaults_to_qos_library(self):
+        topic = self.dds.get_topic('bench.Flat', qos_profile='Telemetry')
+        self.assertEqual(topic.qos_profiles, {'reader': ('Lib', 'Telemetry'), 'writer': ('Lib', 'Telemetry')})
+        topic.take()
+        topic.publish({'id': 1})
+        self.assertEqual(self.entity_profile(topic._reader), 'Lib::Telemetry')
+        self.assertEqual(self.entity_profile(topic._writer), 'Lib::Telemetry')
+
+    def test_no_library(self):
+        with dds.DDS('bench_types') as instance:
+            self.assertRaises(ValueError, instance.get_topic, 'bench.Flat', qos_profile='Telemetry')
+            topic = instance.get_topic('bench.Flat', qos_profile='Lib::Telemetry')
+            self.assertEqual(topic.qos_profiles['reader'], ('Lib', 'Telemetry'))
+
+    def test_reader_and_writer_profiles_override(self):
+        topic = self.dds.get_topic('bench.Flat', qos_profile='Telemetry', writer_qos_profile='Other::Batched')
+        self.assertEqual(topic.qos_profiles, {'reader': ('Lib', 'Telemetry'), 'writer': ('Other', 'Batched')})
+        nested = self.dds.get_topic('bench.Nested', qos_profile='Telemetry', reader_qos_profile='Reliable')
+        self.assertEqual(nested.qos_profiles, {'reader': ('Lib', 'Reliable'), 'writer': ('Lib', 'Telemetry')})
+
+        got = []
+        topic.subscribe(got.append, dispatcher='inline')
+        topic.publish({'id': 1})
+        self.assertEqual(len(got), 1)
+        self.assertEqual(self.entity_profile(topic._reader), 'Lib::Telemetry')
+        self.assertEqual(self.entity_profile(topic._writer), 'Other::Batched')
+
+    def test_default_profiles(self):
+        topic = self.dds.get_topic('bench.Flat')
+        self.assertEqual(topic.qos_profiles, {'reader': None, 'writer': None})
+        topic.take()
+        self.assertIsNone(self.entity_profile(topic._reader))
+
+    def test_filtered_topic_uses_reader_profile(self):
+        topic = self.dds.get_topic('bench.Flat', qos_profile='Telemetry', writer_qos_profile='Other::Batched')
+        filtered = topic.subscribe(lambda sample: None, filter_expression='id > 0', dispatcher='inline')
+        self.assertEqual(filtered.qos_profiles, {'reader': ('Lib', 'Telemetry'), 'writer': None})
+        self.assertEqual(self.entity_profile(filtered._reader), 'Lib::Telemetry')
+
+    def test_reopening(self):
+        topic = self.dds.get_topic('bench.Flat', qos_profile='Telemetry', writer_qos_profile='Other::Batched')
+        self.assertIs(self.dds.get_topic('bench.Flat'), topic)
+        self.assertIs(self.dds.get_topic('bench.Flat', qos_profile='Lib::Telemetry', writer_qos_profile='Other::Batched'), topic)
+        self.assertRaises(ValueError, self.dds.get_topic, 'bench.Flat', qos_profile='Reliable')
+        self.assertRaises(ValueError, self.dds.get_topic, 'bench.Flat', qos_profile='Telemetry')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Status events and counts. Run through tests/run.py."""
+
+import sys
+import threading
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+
+class StatusTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+
+    def tearDown(self):
+        self.dds.close()
+
+    def lose_samples(self, count):
+        dds._ddsc_lib.stub_reader_lose_samples(self.topic._reader, count)
+
+    def test_matched(self):
+        events = []
+        self.topic.subscribe_status(events.append, dispatcher='inline')
+        self.topic.subscribe(lambda sample: None, dispatcher='inline')
+        self.topic.publish({'id': 1})
+        kinds = sorted(event.kind for event in events)
+        self.assertEqual(kinds, ['publication_matched', 'subscription_matched'])
+        self.assertEqual(events[0].topic, 'Flat')
+        self.assertEqual(events[0].status['current_count'], 1)
+        counts = self.topic.status_counts()
+        self.assertEqual((counts['publication_matched'], counts['subscription_matched']), (1, 1))
+
+    def test_kinds(self):
+        lost = []
+        self.topic.subscribe_status(lost.append, kinds=['sample_lost'], dispatcher='inline')
+        self.topic.publish({'id': 1})
+        self.topic.subscribe(lambda sample: None, dispatcher='inline')
+        self.lose_samples(3)
+        self.assertEqual([(e.kind, e.status['total_count']) for e in lost], [('sample_lost', 3)])
+        self.assertEqual(self.topic.status_counts()['sample_lost'], 3)
+        self.assertRaises(ValueError, self.topic.subscribe_status, lost.append, kinds=['nope'])
+
+    def test_unsubscribe(self):
+        events = []
+        subscription = self.topic.subscribe_status(events.append, dispatcher='inline')
+        subscription.unsubscribe()
+        self.topic.subscribe(lambda sample: None, dispatcher='inline')
+        self.lose_samples(1)
+        self.assertEqual(events, [])
+        self.assertEqual(self.topic.status_counts()['sample_lost'], 1)
+
+    def test_one_kind_in_order_on_keyed_dispatcher(self):
+        totals = []
+        done = threading.Event()
+
+        def callback(event):
+            totals.append(event.status['total_count'])
+            if len(totals) == 100:
+                done.set()
+
+        self.topic.subscribe_status(callback, kinds=['sample_lost'])
+        self.topic.subscribe(lambda sample: None)
+        for _ in xrange(100):
+            self.lose_samples(1)
+        self.assertTrue(done.wait(5.0))
+        self.assertEqual(totals, range(1, 101))
+
+    def test_inline_events_in_order_with_samples(self):
+        seen = []
+        self.topic.subscribe_status(lambda event: seen.append(event.kind), kinds=['sample_lost'], dispatcher='inline')
+        self.topic.subscribe(lambda sample: seen.append(sample['id']), dispatcher='inline')
+        self.topic.publish({'id': 1})
+        self.lose_samples(1)
+        self.topic.publish({'id': 2})
+        self.assertEqual(seen, [1, 'sample_lost', 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+"""Streams and publish_async. Run through tests/run.py."""
+
+import sys
+import threading
+import time
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+
+def wait_for(test, timeout=5.0):
+    deadline = time.time() + timeout
+    while not test() and time.time() < deadline:
+        time.sleep(0.01)
+    return test()
+
+
+class StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+
+    def tearDown(self):
+        self.dds.close()
+
+    def publish(self, *ids):
+        for i in ids:
+            self.topic.publish({'id': i})
+
+    def ids(self, samples):
+        return [s['id'] for s in samples]
+
+    def test_get(self):
+        stream = self.topic.stream()
+        self.assertIsNone(stream.get(0.01))
+        self.publish(1)
+        self.assertEqual(stream.get(1.0)['id'], 1)
+
+    def test_iteration_ends_after_close(self):
+        stream = self.topic.stream()
+        self.publish(1, 2)
+        stream.close()
+        self.publish(3)
+        self.assertEqual(self.ids(stream), [1, 2])
+
+    def test_drop_newest(self):
+        stream = self.topic.stream(max_queue=2, overflow=dds.OVERFLOW_DROP_NEWEST)
+        self.publish(1, 2, 3, 4)
+        self.assertEqual(self.ids(stream.drain()), [1, 2])
+        stats = stream.stats()
+        self.assertEqual((stats['enqueued'], stats['dropped'], stats['high_water'], stats['queue_depth']), (2, 2, 2, 0))
+
+    def test_drop_oldest(self):
+        stream = self.topic.stream(max_queue=2, overflow=dds.OVERFLOW_DROP_OLDEST)
+        self.publish(1, 2, 3, 4)
+        self.assertEqual(self.ids(stream.drain()), [3, 4])
+        self.assertEqual(stream.stats()['dropped'], 2)
+
+    def test_block(self):
+        stream = self.topic.stream(max_queue=1)
+        self.publish(1)
+        publisher = threading.Thread(target=self.publish, args=(2,))
+        publisher.start()
+        time.sleep(0.05)
+        self.assertTrue(publisher.is_alive())  # held up on the full stream
+        self.assertEqual(stream.get(1.0)['id'], 1)
+        publisher.join(5.0)
+        self.assertFalse(publisher.is_alive())
+        self.assertEqual(stream.get(1.0)['id'], 2)
+        self.assertEqual(stream.stats()['dropped'], 0)
+
+    def test_unknown_overflow(self):
+        self.assertRaises(ValueError, self.topic.stream, overflow='nope')
+
+
+class OnSamplesTest(unittest.TestCase):
+    # A stand-in event loop: `schedule' queues functions and `run_loop' calls them.
+
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+        self.scheduled = []
+        self.got = []
+
+    def tearDown(self):
+        self.dds.close()
+
+    def run_loop(self):
+        while self.scheduled:
+            self.scheduled.pop(0)()
+
+    def test_one_delivery_outstanding(self):
+        stream = self.topic.stream()
+        stream.on_samples(self.got.append, self.scheduled.append)
+        for i in xrange(3):
+            self.topic.publish({'id': i})
+        self.assertTrue(wait_for(lambda: self.scheduled))
+        time.sleep(0.05)
+        self.assertEqual(len(self.scheduled), 1)
+
+        self.run_loop()
+        self.assertEqual([[s['id'] for s in samples] for samples in self.got], [[0, 1, 2]])
+
+        self.topic.publish({'id': 3})
+        self.assertTrue(wait_for(lambda: self.scheduled))
+        self.run_loop()
+        self.assertEqual([s['id'] for s in self.got[-1]], [3])
+
+    def test_samples_queued_before_on_samples(self):
+        stream = self.topic.stream()
+        self.topic.publish({'id': 1})
+        stream.on_samples(self.got.append, self.scheduled.append)
+        self.assertTrue(wait_for(lambda: self.scheduled))
+        self.run_loop()
+        self.assertEqual([s['id'] for s in self.got[0]], [1])
+
+
+class PublishAsyncTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+        self.topic.take()  # make the reader before publishing
+
+    def tearDown(self):
+        self.dds.close()
+
+    def test_callback(self):
+        results = []
+        done = threading.Event()
+
+        def callback(error):
+            results.append(error)
+            if len(results) == 3:
+                done.set()
+
+        self.topic.publish_async({'id': 1}, callback)
+        self.topic.publish_async({'port': 65536}, callback)
+        self.topic.publish_async({'id': 2}, callback)
+        self.assertTrue(done.wait(5.0))
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertIsNone(results[2])
+        self.assertEqual([s['id'] for s in self.topic.take()], [1, 2])
+
+    def test_without_callback(self):
+        self.topic.publish_async({'id': 5})
+        self.assertTrue(wait_for(lambda: self.topic.read()))
+        self.assertEqual([s['id'] for s in self.topic.take()], [5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""Publishing, subscribing and polling a topic. Run through tests/run.py."""
+
+import sys
+import threading
+import time
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import dds
+
+
+class TopicTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+
+    def tearDown(self):
+        self.dds.close()
+
+    def test_publish_subscribe(self):
+        got = []
+        self.topic.subscribe(got.append, dispatcher='inline')
+        self.topic.publish({'id': 3, 'x': 1.5, 'mode': 'ACTIVE'})
+        self.assertEqual(len(got), 1)
+        self.assertEqual((got[0]['id'], got[0]['x'], got[0]['mode']), (3, 1.5, 'ACTIVE'))
+        self.assertEqual(got[0]['count'], 0)
+
+    def test_unsubscribe(self):
+        got = []
+        subscription = self.topic.subscribe(got.append, dispatcher='inline')
+        subscription.unsubscribe()
+        self.topic.publish({'id': 1})
+        self.assertEqual(got, [])
+
+    def test_take_next(self):
+        self.assertIsNone(self.topic.take_next())
+        self.topic.publish({'id': 5})
+        self.assertEqual(self.topic.take_next()['id'], 5)
+        self.assertIsNone(self.topic.take_next())
+
+    def test_get_topic_is_cached(self):
+        self.assertIs(self.dds.get_topic('bench.Flat'), self.topic)
+
+
+class PollingTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+        self.topic.take()  # make the reader before publishing
+
+    def tearDown(self):
+        self.dds.close()
+
+    def publish(self, *ids):
+        for i in ids:
+            self.topic.publish({'id': i})
+
+    def test_wait_times_out(self):
+        start = time.time()
+        self.assertFalse(self.topic.wait(0.05))
+        self.assertGreaterEqual(time.time() - start, 0.04)
+
+    def test_wait_for_data(self):
+        self.publish(1)
+        self.assertTrue(self.topic.wait(0))
+        self.topic.take()
+        timer = threading.Timer(0.05, self.publish, [2])
+        timer.start()
+        try:
+            self.assertTrue(self.topic.wait(5.0))
+        finally:
+            timer.join()
+        self.assertEqual([s['id'] for s in self.topic.take()], [2])
+
+    def test_take_empties_the_reader(self):
+        self.assertEqual(self.topic.take(), [])
+        self.publish(1, 2, 3)
+        self.assertEqual([s['id'] for s in self.topic.take(max_samples=2)], [1, 2])
+        self.assertEqual([s['id'] for s in self.topic.take()], [3])
+        self.assertEqual(self.topic.take(), [])
+        self.assertFalse(self.topic.wait(0))
+
+    def test_read_leaves_the_samples(self):
+        self.publish(1, 2)
+        self.assertEqual([s['id'] for s in self.topic.read()], [1, 2])
+        self.assertEqual([s['id'] for s in self.topic.read(max_samples=1)], [1])
+        self.assertEqual([s['id'] for s in self.topic.take()], [1, 2])
+        self.assertEqual(self.topic.read(), [])
+
+    def test_take_next(self):
+        self.assertIsNone(self.topic.take_next())
+        self.assertIsNone(self.topic.take_next(info=True))
+        self.publish(1, 2)
+        sample, info = self.topic.take_next(info=True)
+        self.assertEqual(sample['id'], 1)
+        self.assertTrue(info.valid_data)
+        self.assertEqual(self.topic.take_next()['id'], 2)
+        self.assertIsNone(self.topic.take_next())
+
+    def test_info(self):
+        self.publish(4)
+        (sample, info), = self.topic.take(info=True)
+        self.assertEqual(sample['id'], 4)
+        self.assertEqual(info.instance_state, dds.DDS_ALIVE_INSTANCE_STATE)
+
+
+class PublishManyTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Flat')
+        self.topic.take()  # make the reader before publishing
+
+    def tearDown(self):
+        self.dds.close()
+
+    def test_batches_and_failures(self):
+        def samples():
+            for i in xrange(25):
+                yield {'id': i} if i != 7 else {'id': 'bad'}
+        batches = []
+        result = self.topic.publish_many(samples(), batch_size=10, on_batch=batches.append)
+        self.assertEqual(result['published'], 24)
+        self.assertEqual([index for index, _ in result['failed']], [7])
+        self.assertEqual([(b['batch'], b['published'], b['failed']) for b in batches], [(0, 9, 1), (1, 10, 0), (2, 5, 0)])
+        self.assertEqual([s['id'] for s in self.topic.take()], range(7) + range(8, 25))
+
+    def test_nothing_to_publish(self):
+        self.assertEqual(self.topic.publish_many([])['published'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Subscribing with where= and fields=. Run through tests/run.py."""
+
+import sys
+import unittest
+
+if sys.version_info[0] > 2:
+    raise unittest.SkipTest('dds.py is Python 2 only')
+
+import StringIO
+
+import dds
+
+CNT_CALLS = 8  # DynamicData get/set calls, as in benchmarks/stub/nddsc_stub.c
+
+
+class WhereTest(unittest.TestCase):
+    def setUp(self):
+        self.dds = dds.DDS('bench_types')
+        self.topic = self.dds.get_topic('bench.Wide')
+        self.got = []
+
+    def tearDown(self):
+        self.dds.close()
+
+    def subscribe(self, **kwargs):
+        self.topic.subscribe(self.got.append, dispatcher='inline', **kwargs)
+
+    def publish(self, sample):
+        # The DynamicData get calls made delivering `sample': the rest are the
+        # set calls of the publish, one per field given.
+        lib = dds._ddsc_lib
+        lib.stub_reset_counters()
+        self.topic.publish(sample)
+        return lib.stub_get_counter(CNT_CALLS) - len(sample)
+
+    def test_callable(self):
+        self.subscribe(where=lambda sample: sample['f01'] > 1)
+        self.publish({'id': 1, 'f01': 0.5})
+        self.publish({'id': 2, 'f01': 5.0})
+        self.assertEqual([s['id'] for s in self.got], [2])
+
+    def test_dict(self):
+        self.subscribe(where={'f03': 3, 'f01': lambda value: value < 0})
+        self.publish({'id': 3, 'f03': 3, 'f01': -1.0})
+        self.publish({'id': 4, 'f03': 3})
+        self.publish({'id': 5, 'f01': -1.0})
+        self.assertEqual([s['id'] for s in self.got], [3])
+        self.assertEqual(len(self.got[0]), 60)
+
+    def test_only_tested_and_wanted_fields_decoded(self):
+        self.subscribe(where={'f01': lambda value: value > 1}, fields=['id', 'f02'])
+        self.assertEqual(self.publish({'id': 1, 'f01': 0.5}), 1)               # f01
+        self.assertEqual(self.publish({'id': 2, 'f01': 5.0, 'f02': 7.0}), 3)   # f01, id, f02
+        self.assertEqual(self.got, [{'id': 2, 'f02': 7.0}])
+
+    def test_fields(self):
+        self.subscribe(fields=['f01'])
+        self.publish({'id': 6, 'f01': 1.0})
+        self.assertEqual(self.got, [{'f01': 1.0}])
+
+    def test_failing_where_skips_the_sample(self):
+        self.subscribe(where=lambda sample: 1 / 0)
+        saved, sys.stderr = sys.stderr, StringIO.StringIO()
+        try:
+            self.publish({'id': 8})
+        finally:
+            sys.stderr = saved
+        self.assertEqual(self.got, [])
+
+    def test_unknown_fields(self):
+        self.assertRaises(ValueError, self.topic.subscribe, len, fields=['nope'])
+        self.assertRaises(ValueError, self.topic.subscribe, len, where={'nope': 1})
+        self.assertRaises(TypeError, self.topic.subscribe, len, where=1)
+
+
+if __name__ == '__main__':
+    unittest.main()